@@ -0,0 +1,176 @@
+import asyncio, time
+
+from ServerWorker import ServerWorker
+from LiveChannel import liveChannels
+from MediaCatalog import mediaCatalog
+from VideoStream import MediaFile
+from Egress import Egress, TCP_QUEUE_BYTES, tcpDropped
+
+class AsyncSendQueue:
+    """Send queue of an interleaved session on asyncio: the transport's write buffer, bounded.
+
+    The transport never blocks and writes each message whole and in order;
+    a droppable message that would take its buffer past maxBytes is dropped.
+    """
+
+    def __init__(self, transport, maxBytes=TCP_QUEUE_BYTES):
+        self.transport = transport
+        self.maxBytes = maxBytes
+        self.dropped = 0
+
+    def push(self, data, droppable=True):
+        if self.transport.is_closing():
+            return False
+        if droppable and self.transport.get_write_buffer_size() + len(data) > self.maxBytes:
+            self.dropped += 1
+            tcpDropped.inc()
+            return False
+        self.transport.write(data)
+        return True
+
+    def close(self):
+        pass
+
+class AsyncServerWorker(ServerWorker):
+    """ServerWorker whose RTSP replies, RTP sending and frame timers run on an asyncio loop.
+
+    The first SETUP of a video that is not open yet may have to build its
+    index, packet store and catalog entry: the file is opened on the loop's
+    executor first, and the requests of the connection wait in order until
+    it is ready, so other sessions keep streaming meanwhile.
+    """
+    __slots__ = ('loop', 'waiting')
+
+    def __init__(self, clientInfo, loop, egress):
+        super().__init__(clientInfo)
+        self.loop = loop
+        self.egress = egress
+        # Requests recebidos enquanto um vídeo é aberto no executor; None = nenhuma abertura em curso
+        self.waiting = None
+
+    def processRtspRequest(self, request):
+        if self.waiting is not None:
+            self.waiting.append(request)
+            return
+        if (request.method == self.SETUP and self.state == self.INIT and request.uri
+                and liveChannels.get(request.uri) is None and self.needsOpening(request.uri)):
+            self.waiting = [request]
+            future = self.loop.run_in_executor(None, self.prepareMedia, request.uri)
+            future.add_done_callback(self.mediaPrepared)
+            return
+        super().processRtspRequest(request)
+
+    def needsOpening(self, filename):
+        """Check whether SETUP of filename would open a video of the catalog that is not open yet."""
+        path = mediaCatalog.resolve(filename)
+        return path is not None and not MediaFile.isOpen(path)
+
+    def prepareMedia(self, filename):
+        """Describe and open the video in an executor thread; the stream returned keeps it open."""
+        info = self.lookupMedia(filename)
+        if info is None:
+            return None
+        return self.openStream(filename, info)
+
+    def mediaPrepared(self, future):
+        """Process the requests that waited for the video (runs on the loop)."""
+        try:
+            stream = future.result()
+        except Exception:
+            # O SETUP responde 404 ao tentar abrir de novo
+            stream = None
+        requests, self.waiting = self.waiting, None
+        try:
+            if not self.clientInfo['rtspSocket'][0].is_closing():
+                for request in requests:
+                    super().processRtspRequest(request)
+        except Exception as e:
+            print("Erro no processamento RTSP:", e)
+            self.clientInfo['rtspSocket'][0].close()
+        finally:
+            # A sessão já tem a sua referência: esta só segurava o arquivo aberto
+            if stream is not None:
+                stream.close()
+
+    def sendRtspReply(self, reply):
+        """Write a serialized RTSP reply on the control connection."""
+        self.clientInfo['rtspSocket'][0].write(reply)
+
+    def sendPacket(self, buffers):
+        """Queue one RTP packet; the batch is flushed once the current loop iteration ends."""
+        if self.egress.enqueue(self.session.rtpSocket, buffers, self.rtpAddress()):
+            self.loop.call_soon(self.egress.flush)
+        self.countPacket(buffers)
+
+    def flushEgress(self):
+        # O NACK chega pela thread RTCP: o envio fica com o loop
+        self.loop.call_soon_threadsafe(self.egress.flush)
+
+    def expire(self):
+        print("Sessão", self.sessionId(), "encerrada por inatividade")
+        # O transport só pode ser fechado na thread do loop; connection_lost encerra a sessão
+        self.loop.call_soon_threadsafe(self.clientInfo['rtspSocket'][0].close)
+
+    def openSendQueue(self):
+        return AsyncSendQueue(self.clientInfo['rtspSocket'][0])
+
+    def callAt(self, when, callback):
+        """Schedule callback at monotonic time when on the event loop."""
+        # O relógio do loop pode ter outra origem que time.monotonic()
+        return self.loop.call_at(when - time.monotonic() + self.loop.time(), callback)
+
+class RtspProtocol(asyncio.Protocol):
+    """RTSP control connection of one client."""
+
+    def __init__(self, server):
+        self.server = server
+        self.worker = None
+
+    def connection_made(self, transport):
+        clientInfo = {}
+        clientInfo['rtspSocket'] = (transport, transport.get_extra_info('peername'))
+        print("Novo cliente conectado:", clientInfo['rtspSocket'][1])
+        self.worker = AsyncServerWorker(clientInfo, self.server.loop, self.server.egress)
+
+    def data_received(self, data):
+        try:
+            if not self.worker.dataReceived(data):
+                self.worker.clientInfo['rtspSocket'][0].close()
+        except Exception as e:
+            print("Erro no processamento RTSP:", e)
+            self.worker.clientInfo['rtspSocket'][0].close()
+
+    def connection_lost(self, exc):
+        print("Cliente desconectou o socket RTSP.")
+        self.worker.closeSession()
+
+class AsyncServer:
+    """RTSP server that serves every session from a single asyncio event loop."""
+
+    def __init__(self, port, egressSockets=1, sock=None):
+        self.port = port
+        self.egressSockets = egressSockets
+        # Socket de escuta já aberto (modo prefork); senão o servidor abre a porta
+        self.sock = sock
+        self.loop = None
+        self.egress = None
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+
+        # Um único socket UDP envia o RTP de todas as sessões, em lotes por iteração do loop
+        self.egress = Egress(self.egressSockets)
+
+        if self.sock is not None:
+            server = await self.loop.create_server(lambda: RtspProtocol(self), sock=self.sock)
+        else:
+            server = await self.loop.create_server(lambda: RtspProtocol(self), '', self.port)
+        print("Servidor (asyncio) escutando na porta:", self.port)
+        async with server:
+            await server.serve_forever()
+
+    def main(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
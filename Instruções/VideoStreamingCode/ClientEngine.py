@@ -0,0 +1,434 @@
+import socket, threading, time, random
+from RtpPacket import RtpPacket
+from JpegPayload import JpegReassembler
+from JitterBuffer import JitterBuffer
+from RtspMessage import RtspMessage, RtspParser, InterleavedFrame
+from Fec import FecDecoder, FEC_PT
+from Rtcp import ReceiverStats, NackTracker, buildReceiverReport, buildBye, buildNack, parseRtcp, RTCP_SR, RTCP_INTERVAL
+from RtpReceiver import rtpReceiver
+
+class ClientEngine:
+    """RTSP/RTP client without a GUI.
+
+    Runs the RTSP requests and replies, the RTP reception (jitter buffer and
+    JPEG reassembly) and the RTCP reports. The RTP of every session of the
+    process is received by the single RtpReceiver loop, so one process can
+    play many streams. Every completed frame is handed to onFrame(); the Tk
+    clients and the load generator override the hooks.
+    With transport='tcp' RTP and RTCP are interleaved on the RTSP connection
+    instead of using UDP ports. With fec=True (UDP only) the SETUP asks for
+    XOR parity packets, which rebuild single lost packets before the jitter
+    buffer; with nack=True it asks the server to resend the packets missing
+    from the sequence, reported in RTCP NACKs as soon as a gap shows up.
+    """
+    INIT = 0
+    READY = 1
+    PLAYING = 2
+    state = INIT
+
+    SETUP = 0
+    PLAY = 1
+    PAUSE = 2
+    TEARDOWN = 3
+    DESCRIBE = 4
+    OPTIONS = 5
+
+    METHOD_NAMES = {SETUP: 'SETUP', PLAY: 'PLAY', PAUSE: 'PAUSE', TEARDOWN: 'TEARDOWN', DESCRIBE: 'DESCRIBE',
+                    OPTIONS: 'OPTIONS'}
+
+    # Mensagens de progresso no console (o gerador de carga desliga)
+    verbose = True
+
+    def __init__(self, serveraddr, serverport, rtpport, filename, jitterDelay=0.1, transport='udp', fec=False, nack=False):
+        self.serverAddr = serveraddr
+        self.serverPort = int(serverport)
+        self.rtpPort = int(rtpport)
+        self.fileName = filename
+        self.rtspSeq = 0
+        self.sessionId = 0
+        self.requestSent = -1
+        # CSeq cuja resposta waitReply() espera (o keep-alive não conta)
+        self.replySeq = 0
+        # Timeout da sessão anunciado pelo servidor e instante do último request enviado
+        self.sessionTimeout = 60
+        self.lastRequest = time.monotonic()
+        # Requests enviados e ainda sem resposta, por CSeq
+        self.pending = {}
+        self.teardownAcked = 0
+        self.frameNbr = 0
+        self.rtpSocket = None
+        self.rtcpSocket = None
+        self.serverRtcpPort = None
+        # Canais (RTP, RTCP) do RTP intercalado na conexão RTSP; None = RTP sobre UDP
+        self.interleaved = (0, 1) if transport == 'tcp' else None
+        # FEC pedido no SETUP; o decodificador só existe se o servidor aceitou
+        self.fecRequested = fec and self.interleaved is None
+        self.fec = None
+        # Retransmissão pedida no SETUP; os buracos só são relatados se o servidor aceitou
+        self.nackRequested = nack and self.interleaved is None
+        self.nack = None
+        # Requests RTSP e RTCP intercalado escrevem no mesmo socket, de threads diferentes
+        self.sendLock = threading.Lock()
+        self.closed = False
+        # SSRC do cliente nos RRs e no BYE; estatísticas de recepção RFC 3550 relatadas ao servidor
+        self.rtcpSsrc = random.getrandbits(32)
+        self.receiverStats = ReceiverStats()
+        self.reassembler = JpegReassembler()
+        # Reordena os pacotes e os libera no relógio de reprodução (atraso em segundos)
+        self.jitterBuffer = JitterBuffer(delay=jitterDelay)
+        # Sinaliza a chegada da resposta ao último request enviado
+        self.replyEvent = threading.Event()
+        self.bytesReceived = 0
+        self.connectToServer()
+
+    # Hooks sobrescritos pela GUI e pelo gerador de carga
+    def onFrame(self, frameNbr, frame, timestamp):
+        """Called from the RTP thread with each complete JPEG frame and its RTP timestamp."""
+
+    def onDescribe(self, sdpInfo):
+        print("SDP recebido do servidor:\n" + sdpInfo)
+
+    def onSenderReport(self, packet, arrival):
+        """Called from the RTCP thread with each SR from the server."""
+        self.receiverStats.onSenderReport(packet, arrival)
+
+    def showWarning(self, title, message):
+        print(f"{title}: {message}")
+
+    def log(self, *args):
+        if self.verbose:
+            print(*args)
+
+    def setupMovie(self):
+        if self.state == self.INIT:
+            self.sendRtspRequest(self.SETUP)
+
+    def playMovie(self):
+        if self.state == self.READY:
+            # Novo PLAY: o mapeamento timestamp -> relógio local recomeça
+            self.jitterBuffer.reset()
+            self.reassembler = JpegReassembler()
+            # O loop de recepção passa a ler o socket RTP antes de o servidor começar a enviar
+            rtpReceiver.add(self)
+            self.sendRtspRequest(self.PLAY)
+
+    def pauseMovie(self):
+        if self.state == self.PLAYING:
+            self.sendRtspRequest(self.PAUSE)
+
+    def describeMovie(self):
+        self.sendRtspRequest(self.DESCRIBE)
+
+    def teardownMovie(self):
+        """Leave the session: RTCP BYE followed by TEARDOWN."""
+        # Tenta enviar TEARDOWN apenas se tivermos socket
+        if self.rtspSocket:
+            self.sendRtcp(buildBye(self.rtcpSsrc))
+            self.sendRtspRequest(self.TEARDOWN)
+
+    def waitReply(self, timeout=None):
+        """Wait for the reply to the last request. Return False on timeout."""
+        return self.replyEvent.wait(timeout)
+
+    def releaseFrames(self, now):
+        """Reassemble the packets due in the jitter buffer and hand the complete frames to onFrame().
+        Return the seconds until the next packet is due, or None when the buffer is empty."""
+        for rtpPacket in self.jitterBuffer.pop(now):
+            # O reassembler só devolve frames completos
+            frame = self.reassembler.addPacket(rtpPacket)
+            if frame:
+                self.frameNbr += 1
+                self.onFrame(self.frameNbr, frame, rtpPacket.timestamp())
+        return self.jitterBuffer.timeUntilNext(now)
+
+    def receivePacket(self, data):
+        """Put a received RTP datagram in the jitter buffer; a FEC packet may give back a lost one.
+        Called from the RtpReceiver thread."""
+        self.bytesReceived += len(data)
+        rtpPacket = RtpPacket()
+        rtpPacket.decode(data)
+
+        # print("Current Seq Num: " + str(rtpPacket.seqNum()))
+
+        if rtpPacket.payloadType() == FEC_PT:
+            data = self.fec.addParity(data) if self.fec is not None else None
+            if data is None:
+                return
+            # Pacote reconstruído: não conta como recebido no RR, que relata a perda do caminho
+            rtpPacket = RtpPacket()
+            rtpPacket.decode(data)
+        else:
+            if self.fec is not None:
+                self.fec.addMedia(rtpPacket.seqNum(), data)
+            if self.nack is not None:
+                lost = self.nack.update(rtpPacket.seqNum())
+                if lost:
+                    self.sendRtcp(buildNack(self.rtcpSsrc, rtpPacket.ssrc(), lost))
+            self.receiverStats.update(rtpPacket, time.time())
+        self.jitterBuffer.insert(rtpPacket, time.monotonic())
+
+    def connectToServer(self):
+        """Connect to the Server. Start a new RTSP/TCP session."""
+        self.rtspSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            self.rtspSocket.connect((self.serverAddr, self.serverPort))
+            self.log(f"Conectado ao servidor RTSP {self.serverAddr}:{self.serverPort}")
+            # Thread que recebe as respostas RTSP (DESCRIBE pode vir antes do SETUP)
+            threading.Thread(target=self.recvRtspReply, daemon=True).start()
+        except Exception as e:
+            self.rtspSocket = None
+            self.showWarning('Connection Failed', f"Connection to '{self.serverAddr}:{self.serverPort}' failed.\n{e}")
+
+    def sendRtspRequest(self, requestCode):
+        """Send RTSP request to the server."""
+        if not self.rtspSocket:
+            self.log("Não há conexão RTSP ativa.")
+            return
+
+        headers = {}
+        # Setup request
+        if requestCode == self.SETUP and self.state == self.INIT:
+            if self.interleaved is not None:
+                headers['Transport'] = f"RTP/AVP/TCP;unicast;interleaved={self.interleaved[0]}-{self.interleaved[1]}"
+            else:
+                headers['Transport'] = f"RTP/AVP;unicast;client_port={self.rtpPort}-{self.rtpPort + 1}"
+                if self.fecRequested:
+                    headers['Transport'] += ";x-fec"
+                if self.nackRequested:
+                    headers['Transport'] += ";x-nack"
+
+        # Describe request, in any state
+        elif requestCode == self.DESCRIBE:
+            if self.sessionId:
+                headers['Session'] = self.sessionId
+
+        # Play, pause, teardown and keep-alive requests
+        elif ((requestCode == self.PLAY and self.state == self.READY)
+              or (requestCode == self.PAUSE and self.state == self.PLAYING)
+              or (requestCode in (self.TEARDOWN, self.OPTIONS) and not self.state == self.INIT)):
+            headers['Session'] = self.sessionId
+
+        else:
+            return
+
+        # O keep-alive sai da thread RTCP: número de sequência e envio sob o mesmo lock
+        with self.sendLock:
+            # Update RTSP sequence number.
+            self.rtspSeq += 1
+            # A resposta é associada ao request pelo CSeq, então vários podem estar pendentes
+            self.pending[self.rtspSeq] = requestCode
+            if requestCode != self.OPTIONS:
+                self.requestSent = requestCode
+                self.replySeq = self.rtspSeq
+                self.replyEvent.clear()
+            self.lastRequest = time.monotonic()
+            request = RtspMessage.request(self.METHOD_NAMES[requestCode], self.fileName, self.rtspSeq, headers)
+            try:
+                self.rtspSocket.sendall(request.serialize())
+            except Exception as e:
+                self.log("Erro ao enviar RTSP request:", e)
+                return
+        self.log('\nData sent:\n' + str(request))
+
+    def keepAlive(self):
+        """Send an OPTIONS when no request went out for half the session timeout."""
+        if self.sessionId and time.monotonic() - self.lastRequest > self.sessionTimeout / 2:
+            self.sendRtspRequest(self.OPTIONS)
+
+    def recvRtspReply(self):
+        """Receive RTSP replies from the server."""
+        parser = RtspParser()
+        while True:
+            try:
+                data = self.rtspSocket.recv(65536)
+                if data:
+                    for message in parser.feed(data):
+                        if isinstance(message, InterleavedFrame):
+                            self.interleavedReceived(message)
+                        else:
+                            self.parseRtspReply(message)
+                else:
+                    # conexão fechada pelo servidor
+                    self.log("Servidor fechou a conexão RTSP.")
+                    break
+
+                # Close the RTSP socket once the Teardown is answered
+                if self.requestSent == self.TEARDOWN and not self.pending:
+                    try:
+                        self.rtspSocket.shutdown(socket.SHUT_RDWR)
+                        self.rtspSocket.close()
+                    except:
+                        pass
+                    break
+            except Exception as e:
+                self.log("Erro em recvRtspReply:", e)
+                break
+
+    def parseRtspReply(self, reply):
+        """Process one RTSP reply (an RtspMessage) from the server."""
+        try:
+            seqNum = int(reply.cseq)
+        except (TypeError, ValueError):
+            return
+
+        # Process only replies to a request we are waiting for
+        requestCode = self.pending.pop(seqNum, None)
+        if requestCode is None:
+            return
+
+        if reply.statusCode != 200:
+            self.log(f"Erro do servidor para {self.METHOD_NAMES[requestCode]}: {reply.statusCode} {reply.reason}")
+            if requestCode == self.SETUP:
+                self.showWarning('Setup Failed', f"{reply.statusCode} {reply.reason}")
+        else:
+            try:
+                # Session: <id>[;timeout=<s>]
+                sessionHeader = reply.header('Session', '0').split(';')
+                session = int(sessionHeader[0])
+                for parameter in sessionHeader[1:]:
+                    if parameter.strip().startswith('timeout='):
+                        self.sessionTimeout = int(parameter.split('=', 1)[1])
+            except ValueError:
+                session = 0
+
+            # New RTSP session ID
+            if self.sessionId == 0:
+                self.sessionId = session
+
+            # Process only if the session ID is the same
+            if self.sessionId == session:
+                if requestCode == self.SETUP:
+                    self.state = self.READY
+                    self.parseTransport(reply.header('Transport', ''))
+                    self.openRtpPort()
+                elif requestCode == self.PLAY:
+                    self.state = self.PLAYING
+                elif requestCode == self.PAUSE:
+                    self.state = self.READY
+                    rtpReceiver.remove(self)
+                    self.log("Estatísticas RTP:", self.jitterBuffer.stats())
+                    if self.fec is not None:
+                        self.log("FEC:", self.fec.stats())
+                    if self.nack is not None:
+                        self.log("Pacotes pedidos por NACK:", self.nack.requested)
+                elif requestCode == self.DESCRIBE:
+                    self.onDescribe(reply.bodyText())
+                elif requestCode == self.TEARDOWN:
+                    self.state = self.INIT
+                    self.teardownAcked = 1
+                    rtpReceiver.remove(self)
+        if seqNum == self.replySeq:
+            self.replyEvent.set()
+
+    def interleavedReceived(self, frame):
+        """Handle a '$' packet from the RTSP connection: RTP to the receive loop, RTCP SRs."""
+        if self.interleaved is None:
+            return
+        if frame.channel == self.interleaved[0]:
+            rtpReceiver.deliver(self, frame.data)
+        elif frame.channel == self.interleaved[1]:
+            for packet in parseRtcp(frame.data):
+                if packet['type'] == RTCP_SR:
+                    self.onSenderReport(packet, time.time())
+
+    def openRtpPort(self):
+        """Open RTP socket binded to a specified port."""
+        if self.interleaved is not None:
+            # RTP e RTCP chegam pela conexão RTSP: só a thread que envia os RRs é necessária
+            threading.Thread(target=self.runRtcp, daemon=True).start()
+            return
+
+        self.rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # Lido pelo selector do RtpReceiver
+        self.rtpSocket.setblocking(False)
+
+        try:
+            self.rtpSocket.bind(("", self.rtpPort))
+            self.log(f"RTP socket aberto em 0.0.0.0:{self.rtpPort}")
+        except Exception as e:
+            self.showWarning('Unable to Bind', f'Unable to bind PORT={self.rtpPort}\n{e}')
+
+        self.openRtcpPort()
+
+    def parseTransport(self, transport):
+        """Read the server RTCP port (or the interleaved channels) from the Transport header of the SETUP reply."""
+        if self.interleaved is not None and 'interleaved=' in transport:
+            channels = transport.split('interleaved=')[1].split(';')[0].strip().split('-')
+            self.interleaved = (int(channels[0]), int(channels[1]) if len(channels) > 1 else int(channels[0]) + 1)
+        if self.fecRequested and 'x-fec=' in transport:
+            self.fec = FecDecoder()
+        if self.nackRequested and 'x-nack' in transport:
+            self.nack = NackTracker()
+        if 'server_port=' in transport:
+            ports = transport.split('server_port=')[1].split(';')[0].strip().split('-')
+            self.serverRtcpPort = int(ports[1]) if len(ports) > 1 else int(ports[0]) + 1
+
+    def openRtcpPort(self):
+        """Open the RTCP socket on the port after the RTP one and start its thread."""
+        if self.serverRtcpPort is None:
+            return
+        self.rtcpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.rtcpSocket.bind(("", self.rtpPort + 1))
+        except Exception as e:
+            self.log("Não foi possível abrir a porta RTCP:", e)
+            self.rtcpSocket = None
+            return
+        self.rtcpSocket.settimeout(RTCP_INTERVAL)
+        threading.Thread(target=self.runRtcp, daemon=True).start()
+
+    def runRtcp(self):
+        """Receive the server's SRs and send an RR every RTCP_INTERVAL."""
+        nextReport = time.monotonic() + RTCP_INTERVAL
+        while self.teardownAcked == 0 and not self.closed:
+            self.keepAlive()
+            if self.rtcpSocket is None:
+                # RTCP intercalado: os SRs chegam pela thread RTSP
+                time.sleep(max(0.0, nextReport - time.monotonic()))
+            else:
+                try:
+                    data = self.rtcpSocket.recv(2048)
+                    for packet in parseRtcp(data):
+                        if packet['type'] == RTCP_SR:
+                            self.onSenderReport(packet, time.time())
+                except socket.timeout:
+                    pass
+                except OSError:
+                    break
+            if time.monotonic() >= nextReport:
+                nextReport = time.monotonic() + RTCP_INTERVAL
+                block = self.receiverStats.reportBlock(time.time())
+                if block is not None:
+                    self.sendRtcp(buildReceiverReport(self.rtcpSsrc, [block]))
+        try:
+            if self.rtcpSocket is not None:
+                self.rtcpSocket.close()
+        except:
+            pass
+
+    def sendRtcp(self, packet):
+        if self.interleaved is not None:
+            try:
+                with self.sendLock:
+                    self.rtspSocket.sendall(InterleavedFrame(self.interleaved[1], packet).serialize())
+            except OSError:
+                pass
+            return
+        if self.rtcpSocket is None:
+            return
+        try:
+            self.rtcpSocket.sendto(packet, (self.serverAddr, self.serverRtcpPort))
+        except OSError:
+            pass
+
+    def close(self):
+        """Close every socket of the session (RTSP, RTP and RTCP)."""
+        # Sai do loop de recepção antes de o socket RTP ser fechado
+        rtpReceiver.remove(self)
+        self.closed = True
+        for sock in (self.rtspSocket, self.rtpSocket, self.rtcpSocket):
+            if sock is not None:
+                try:
+                    sock.close()
+                except OSError:
+                    pass
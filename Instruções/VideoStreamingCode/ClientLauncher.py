@@ -1,21 +1,33 @@
-import sys
-from tkinter import Tk  # Python 3 usa 'tkinter' minúsculo
-
-from Client import Client
-
-if __name__ == "__main__":
-    try:
-        serverAddr = sys.argv[1]
-        serverPort = sys.argv[2]
-        rtpPort = sys.argv[3]
-        fileName = sys.argv[4]    
-    except:
-        print("[Usage: ClientLauncher.py Server_name Server_port RTP_port Video_file]")
-        sys.exit() # Encerra o programa se faltarem argumentos
-    
-    root = Tk()
-    
-    # Create a new client
-    app = Client(root, serverAddr, serverPort, rtpPort, fileName)
-    app.master.title("RTPClient")    
+import sys
+from tkinter import Tk  # Python 3 usa 'tkinter' minúsculo
+
+from Client import Client
+
+if __name__ == "__main__":
+    try:
+        serverAddr = sys.argv[1]
+        serverPort = sys.argv[2]
+        rtpPort = sys.argv[3]
+        fileName = sys.argv[4]    
+        # Atraso opcional do jitter buffer, em milissegundos
+        jitterDelay = int(sys.argv[5]) / 1000 if len(sys.argv) > 5 else 0.1
+        # 'tcp': RTP intercalado na conexão RTSP, para redes que bloqueiam UDP
+        # 'fec': RTP sobre UDP com pacotes de paridade, se o servidor oferecer (Server.py --fec)
+        # 'nack': RTP sobre UDP com retransmissão dos pacotes perdidos (Server.py --nack)
+        transport = sys.argv[6] if len(sys.argv) > 6 else 'udp'
+        if transport not in ('udp', 'tcp', 'fec', 'nack'):
+            raise ValueError(transport)
+        fec = transport == 'fec'
+        nack = transport == 'nack'
+        if fec or nack:
+            transport = 'udp'
+    except:
+        print("[Usage: ClientLauncher.py Server_name Server_port RTP_port Video_file [Jitter_ms] [udp|tcp|fec|nack]]")
+        sys.exit() # Encerra o programa se faltarem argumentos
+    
+    root = Tk()
+    
+    # Create a new client
+    app = Client(root, serverAddr, serverPort, rtpPort, fileName, jitterDelay, transport, fec, nack)
+    app.master.title("RTPClient")    
     root.mainloop()
\ No newline at end of file
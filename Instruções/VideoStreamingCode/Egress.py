@@ -0,0 +1,201 @@
+import collections, socket, threading, time
+
+from Scheduler import mediaScheduler
+from Metrics import metrics, FAST_BUCKETS
+
+# sendmsg (scatter/gather) não existe no Windows
+HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')
+
+# Buffer de envio grande: um tick pode ter os pacotes de milhares de sessões
+SEND_BUFFER_SIZE = 4 * 1024 * 1024
+
+# Limite de bytes na fila de envio de cada conexão com RTP intercalado (RTP/AVP/TCP)
+TCP_QUEUE_BYTES = 256 * 1024
+
+# Nova tentativa de esvaziar a fila de uma conexão cujo socket estava cheio
+TCP_RETRY_DELAY = 0.005
+
+packetsSent = metrics.counter('rtp_packets_sent_total', "Pacotes RTP enviados")
+bytesSent = metrics.counter('rtp_bytes_sent_total', "Bytes RTP enviados (cabeçalhos incluídos)")
+sendErrors = metrics.counter('rtp_send_errors_total', "Envios RTP que falharam")
+sendDuration = metrics.histogram('rtp_send_duration_seconds', "Duração de cada chamada sendmsg/sendto",
+                                 buckets=FAST_BUCKETS)
+tcpDropped = metrics.counter('rtp_tcp_dropped_total',
+                             "Frames e relatórios RTCP descartados inteiros com a fila RTP/TCP cheia")
+
+class Egress:
+    """A few UDP sockets shared by every session, flushed in batches once per scheduler tick.
+
+    Sessions enqueue their packets while the scheduler runs the callbacks
+    that are due; flush() then sends everything collected in that tick and
+    records how many packets, bytes and send errors it had.
+    """
+
+    def __init__(self, socketCount=1):
+        self.sockets = []
+        self.setSocketCount(socketCount)
+        self.pending = []
+        self.lock = threading.Lock()
+        self.ticks = 0
+        self.lastTick = {'packets': 0, 'bytes': 0, 'errors': 0}
+        self.totals = {'packets': 0, 'bytes': 0, 'errors': 0}
+
+    def setSocketCount(self, socketCount):
+        """Open sockets until there are socketCount of them (used before any session starts)."""
+        while len(self.sockets) < socketCount:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER_SIZE)
+            except OSError:
+                pass
+            # Porta fixa desde já: ela é anunciada no server_port do Transport
+            sock.bind(('', 0))
+            self.sockets.append(sock)
+
+    def reopen(self, socketCount):
+        """Replace the sockets with new ones, e.g. in a worker process that inherited them by fork."""
+        for sock in self.sockets:
+            sock.close()
+        self.sockets = []
+        self.setSocketCount(socketCount)
+
+    def socketFor(self, key):
+        """Return the socket used by a session (stable for a given key, e.g. the SSRC)."""
+        return self.sockets[key % len(self.sockets)]
+
+    def enqueue(self, sock, buffers, address):
+        """Queue one packet for the next flush. Return True if it starts a new batch."""
+        # O header RTP é o template da sessão, reescrito no próximo pacote: guarda uma cópia de 12 bytes
+        buffers[0] = bytes(buffers[0])
+        with self.lock:
+            self.pending.append((sock, buffers, address))
+            return len(self.pending) == 1
+
+    def flush(self):
+        """Send every queued packet. Return the counters of this tick."""
+        with self.lock:
+            batch = self.pending
+            self.pending = []
+        if not batch:
+            return None
+
+        packets = sent = errors = 0
+        durations = []
+        clock = time.perf_counter
+        for sock, buffers, address in batch:
+            started = clock()
+            try:
+                if HAS_SENDMSG:
+                    sent += sock.sendmsg(buffers, (), 0, address)
+                else:
+                    sent += sock.sendto(b''.join(buffers), address)
+                packets += 1
+            except OSError:
+                errors += 1
+            durations.append(clock() - started)
+
+        # Métricas atualizadas uma vez por tick, não por pacote
+        sendDuration.observeMany(durations)
+        packetsSent.inc(packets)
+        bytesSent.inc(sent)
+        if errors:
+            sendErrors.inc(errors)
+        tick = {'packets': packets, 'bytes': sent, 'errors': errors}
+        self.ticks += 1
+        self.lastTick = tick
+        for name, value in tick.items():
+            self.totals[name] += value
+        return tick
+
+    def stats(self):
+        """Return the counters of the last tick and the totals since startup."""
+        return {'ticks': self.ticks, 'lastTick': dict(self.lastTick), 'totals': dict(self.totals)}
+
+    def close(self):
+        for sock in self.sockets:
+            sock.close()
+
+class TcpSendQueue:
+    """Bounded, non-blocking send queue of an RTSP connection that carries interleaved RTP.
+
+    Whole messages are queued: the '$' packets of one frame, an RTCP report
+    or an RTSP reply. A message already partly written is always finished
+    before the next, so the framing on the wire stays intact. When a
+    droppable message does not fit in maxBytes it is dropped whole, so a
+    slow viewer costs bounded memory and never blocks the sending thread;
+    what the socket does not take now is retried with callAt(). The socket
+    is switched to non-blocking mode, so whoever reads from it must wait
+    for data with select().
+    """
+
+    def __init__(self, sock, callAt, maxBytes=TCP_QUEUE_BYTES):
+        # Não bloqueante em todas as plataformas (MSG_DONTWAIT não existe no Windows): um cliente lento não
+        # segura a thread do scheduler de mídia, que envia para todas as sessões
+        sock.setblocking(False)
+        self.sock = sock
+        self.callAt = callAt
+        self.maxBytes = maxBytes
+        self.messages = collections.deque()
+        # Bytes da primeira mensagem da fila que já foram escritos
+        self.offset = 0
+        self.queuedBytes = 0
+        self.dropped = 0
+        self.retry = None
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def push(self, data, droppable=True):
+        """Queue one whole message and send what the socket takes now. Return False if it was dropped."""
+        with self.lock:
+            if self.closed:
+                return False
+            if droppable and self.queuedBytes + len(data) > self.maxBytes:
+                self.dropped += 1
+                tcpDropped.inc()
+                return False
+            self.messages.append(data)
+            self.queuedBytes += len(data)
+            self.sendQueued()
+        return True
+
+    def flush(self):
+        with self.lock:
+            self.retry = None
+            if not self.closed:
+                self.sendQueued()
+
+    def sendQueued(self):
+        # Chamado com o lock: escreve até o socket recusar
+        while self.messages:
+            head = self.messages[0]
+            try:
+                sent = self.sock.send(memoryview(head)[self.offset:])
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                # Conexão perdida: o que estava na fila não tem mais para onde ir
+                self.closed = True
+                self.messages.clear()
+                self.queuedBytes = 0
+                return
+            self.offset += sent
+            self.queuedBytes -= sent
+            if self.offset < len(head):
+                break
+            self.messages.popleft()
+            self.offset = 0
+        if self.messages and self.retry is None:
+            self.retry = self.callAt(time.monotonic() + TCP_RETRY_DELAY, self.flush)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.messages.clear()
+            self.queuedBytes = 0
+            if self.retry is not None:
+                self.retry.cancel()
+                self.retry = None
+
+# Egress do modo com threads, esvaziado ao fim de cada tick do scheduler de mídia
+egress = Egress()
+mediaScheduler.addTickListener(egress.flush)
@@ -0,0 +1,183 @@
+import struct
+from collections import deque
+
+from RtpPacket import RTP_HEADER, HEADER_SIZE
+from Scheduler import RTP_CLOCK_RATE
+
+# Payload type dinâmico dos pacotes de paridade ("ulpfec", RFC 5109)
+FEC_PT = 127
+
+# A máscara de 16 bits do cabeçalho de nível 0 (L = 0) cobre até 16 pacotes por grupo
+MAX_GROUP = 16
+
+# E|L|P|X|CC, M|PT, SN base, TS recovery e length recovery (RFC 5109, seção 7.3)
+FEC_HEADER = struct.Struct("!BBHIH")
+# Protection length e máscara do nível 0 (seção 7.4)
+LEVEL_HEADER = struct.Struct("!HH")
+
+# Pacotes de mídia guardados pelo receptor para reconstruir um perdido (alguns grupos)
+RECEIVE_WINDOW = 4 * MAX_GROUP
+
+class FecEncoder:
+    """XOR parity over groups of consecutive RTP packets of a session (RFC 5109, level 0).
+
+    After every size media packets the sender emits one FEC packet whose
+    payload is the XOR of theirs and whose header carries the XOR of their
+    header fields and lengths: a receiver that lost any one packet of the
+    group rebuilds it from the others. The parity packets go on the same
+    port with payload type FEC_PT, the media SSRC and their own sequence
+    numbers (the separate stream of RFC 2733), so receivers without FEC
+    ignore them.
+    """
+    # Tamanho de grupo oferecido pelo servidor (Server.py --fec); 0 desliga o FEC
+    group = 0
+
+    __slots__ = ('size', 'ssrc', 'seq', 'count', 'snBase', 'bits', 'lengths', 'timestamps', 'payload',
+                 'protection', 'timestamp', 'packets')
+
+    def __init__(self, size, ssrc, seq=0):
+        self.size = size
+        self.ssrc = ssrc
+        self.seq = seq
+        # Pacotes de paridade enviados
+        self.packets = 0
+        self.reset()
+
+    def reset(self):
+        """Start a new group."""
+        self.count = 0
+        self.snBase = 0
+        self.bits = 0
+        self.lengths = 0
+        self.timestamps = 0
+        # XOR dos payloads como inteiro little-endian: os payloads menores ficam completados com zeros no fim
+        self.payload = 0
+        self.protection = 0
+        self.timestamp = 0
+
+    def add(self, buffers):
+        """Account for a media packet sent as buffers (RTP header first). Return the FEC packet that closes
+        the group, or None."""
+        header = buffers[0]
+        first, second, seq, timestamp, _ = RTP_HEADER.unpack_from(header)
+        data = b''.join(buffers[1:]) if len(buffers) > 2 else buffers[1]
+        if self.count == 0:
+            self.snBase = seq
+        self.count += 1
+        # P, X e CC do primeiro byte; M e PT do segundo
+        self.bits ^= ((first & 0x3F) << 8) | second
+        self.timestamps ^= timestamp
+        self.lengths ^= len(data)
+        self.payload ^= int.from_bytes(data, 'little')
+        self.protection = max(self.protection, len(data))
+        self.timestamp = timestamp
+        if self.count < self.size:
+            return None
+        return self.parity()
+
+    def parity(self):
+        """Build the FEC packet of the current group and start a new one."""
+        mask = ((1 << self.count) - 1) << (MAX_GROUP - self.count)
+        packet = b''.join((
+            RTP_HEADER.pack(0x80, FEC_PT, self.seq, self.timestamp, self.ssrc),
+            FEC_HEADER.pack(self.bits >> 8, self.bits & 0xFF, self.snBase, self.timestamps, self.lengths),
+            LEVEL_HEADER.pack(self.protection, mask),
+            self.payload.to_bytes(self.protection, 'little'),
+        ))
+        self.seq = (self.seq + 1) & 0xFFFF
+        self.packets += 1
+        self.reset()
+        return packet
+
+class FecDecoder:
+    """Rebuilds single lost RTP packets of a group from its FEC packet (receiver side).
+
+    The last RECEIVE_WINDOW media packets are kept by sequence number.
+    When a parity packet arrives and exactly one of the packets it protects
+    is missing, XOR-ing the parity with the others gives back that
+    packet's header fields, length and payload.
+    """
+
+    def __init__(self, window=RECEIVE_WINDOW):
+        self.packets = {}
+        self.order = deque()
+        self.window = window
+        self.parityReceived = 0
+        self.recovered = 0
+        # Grupos com mais de um pacote perdido: a paridade não basta
+        self.unrecoverable = 0
+
+    def addMedia(self, seq, data):
+        """Keep a received media packet (the whole datagram)."""
+        if seq in self.packets:
+            return
+        if len(self.order) >= self.window:
+            self.packets.pop(self.order.popleft(), None)
+        self.packets[seq] = data
+        self.order.append(seq)
+
+    def addParity(self, data):
+        """Process a FEC packet. Return the datagram of the recovered media packet, or None."""
+        self.parityReceived += 1
+        if len(data) < HEADER_SIZE + FEC_HEADER.size + LEVEL_HEADER.size:
+            return None
+        ssrc = RTP_HEADER.unpack_from(data)[4]
+        first, second, snBase, timestamps, lengths = FEC_HEADER.unpack_from(data, HEADER_SIZE)
+        protection, mask = LEVEL_HEADER.unpack_from(data, HEADER_SIZE + FEC_HEADER.size)
+        payloadStart = HEADER_SIZE + FEC_HEADER.size + LEVEL_HEADER.size
+
+        missing = None
+        protected = []
+        for i in range(MAX_GROUP):
+            if mask & (0x8000 >> i):
+                seq = (snBase + i) & 0xFFFF
+                packet = self.packets.get(seq)
+                if packet is None:
+                    if missing is not None:
+                        self.unrecoverable += 1
+                        return None
+                    missing = seq
+                else:
+                    protected.append(packet)
+        if missing is None:
+            return None
+
+        bits = ((first & 0x3F) << 8) | second
+        payload = int.from_bytes(data[payloadStart:payloadStart + protection], 'little')
+        for packet in protected:
+            packetFirst, packetSecond, _, timestamp, _ = RTP_HEADER.unpack_from(packet)
+            bits ^= ((packetFirst & 0x3F) << 8) | packetSecond
+            timestamps ^= timestamp
+            lengths ^= len(packet) - HEADER_SIZE
+            payload ^= int.from_bytes(memoryview(packet)[HEADER_SIZE:], 'little')
+        if lengths > protection:
+            # Paridade corrompida ou de outra sessão
+            return None
+
+        recovered = RTP_HEADER.pack(0x80 | (bits >> 8), bits & 0xFF, missing, timestamps, ssrc)
+        recovered += payload.to_bytes(protection, 'little')[:lengths]
+        self.recovered += 1
+        self.addMedia(missing, recovered)
+        return recovered
+
+    def stats(self):
+        return {'parityReceived': self.parityReceived, 'recovered': self.recovered,
+                'unrecoverable': self.unrecoverable}
+
+def sdpLines(group):
+    """Return the SDP attributes announcing the FEC payload type, or none when group is 0."""
+    if not group:
+        return []
+    return [f"a=rtpmap:{FEC_PT} ulpfec/{RTP_CLOCK_RATE}", f"a=fmtp:{FEC_PT} x-group={group}"]
+
+def parseFecParameter(transport):
+    """Return the group size asked for in an x-fec[=<group>] Transport parameter: 0 if absent,
+    None for the server's default."""
+    for parameter in transport.split(';'):
+        name, _, value = parameter.strip().partition('=')
+        if name == 'x-fec':
+            try:
+                return int(value) if value else None
+            except ValueError:
+                return None
+    return 0
@@ -0,0 +1,141 @@
+"""Overhead and recovery of the XOR parity FEC under packet loss, over loopback UDP.
+
+Usage: python FecBenchmark.py [--frames 400] [--loss 0.01,0.02,0.05,0.1] [--groups 0,4,8,16]
+                              [--burst 1] [--width 640 --height 480 --frame-size 30000]
+
+A synthetic video is packetized as the server does (RFC 2435 fragments,
+the session's RTP header template, FecEncoder parity), each datagram is
+dropped at the sender with the given loss rate and the rest cross a
+loopback UDP socket into FecDecoder. For every loss rate and group size
+(0 = no FEC) the table shows the bandwidth overhead of the parity packets,
+the packet loss before and after recovery and the frames that would not
+be complete. --burst sets the mean length of the loss bursts (Gilbert
+model; 1 = independent losses), where single-parity FEC recovers little.
+"""
+import argparse, os, random, socket, tempfile
+
+from Fec import FecEncoder, FecDecoder, FEC_PT
+from JpegPayload import JpegPacketizer
+from MediaCatalog import MJPEG_PT
+from RtpPacket import RTP_HEADER, RtpHeaderTemplate
+from SyntheticVideo import writeSyntheticMjpeg
+from VideoStream import VideoStream
+
+SSRC = 0x1234ABCD
+
+class LossModel:
+    """Gilbert loss model: independent losses when burst is 1, bursts of that mean length otherwise."""
+
+    def __init__(self, loss, burst, seed):
+        self.rng = random.Random(seed)
+        self.stay = 1 - 1 / burst
+        # Probabilidade de entrar em uma rajada que mantém a taxa média de perda
+        self.enter = loss / (burst * (1 - loss)) if burst > 1 else loss
+        self.losing = False
+
+    def drop(self):
+        if self.losing:
+            self.losing = self.rng.random() < self.stay
+        else:
+            self.losing = self.rng.random() < self.enter
+        return self.losing
+
+def readFrames(count, width, height, frameSize):
+    with tempfile.TemporaryDirectory() as directory:
+        path = writeSyntheticMjpeg(os.path.join(directory, "fec.Mjpeg"), count, width, height, frameSize)
+        stream = VideoStream(path)
+        frames = [bytes(stream.nextFrame()) for _ in range(count)]
+        stream.close()
+    return frames
+
+def run(frames, loss, group, burst, seed=1):
+    """Send the frames through the lossy loopback link. Return the counters of the run."""
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+    receiver.bind(('127.0.0.1', 0))
+    receiver.setblocking(False)
+    address = receiver.getsockname()
+
+    packetizer = JpegPacketizer()
+    template = RtpHeaderTemplate(MJPEG_PT, SSRC)
+    encoder = FecEncoder(group, SSRC) if group else None
+    decoder = FecDecoder()
+    # Mesma semente para mídia e paridade em todos os grupos: as perdas de mídia são as mesmas em cada linha
+    mediaLoss = LossModel(loss, burst, seed)
+    parityLoss = LossModel(loss, burst, seed + 1)
+
+    seq = 0
+    frameOfSeq = {}
+    received = set()
+    mediaBytes = parityBytes = 0
+
+    def drain():
+        while True:
+            try:
+                data = receiver.recv(65535)
+            except BlockingIOError:
+                return
+            if data[1] & 0x7F == FEC_PT:
+                recovered = decoder.addParity(data)
+                if recovered is not None:
+                    received.add(RTP_HEADER.unpack_from(recovered)[2])
+            else:
+                packetSeq = RTP_HEADER.unpack_from(data)[2]
+                received.add(packetSeq)
+                decoder.addMedia(packetSeq, data)
+
+    try:
+        for frameNumber, frame in enumerate(frames):
+            for jpegHeader, fragment, last in packetizer.packetize(frame):
+                buffers = [bytes(template.patch(seq, frameNumber * 4500, 1 if last else 0)), jpegHeader, fragment]
+                frameOfSeq[seq] = frameNumber
+                seq += 1
+                mediaBytes += sum(len(b) for b in buffers)
+                if not mediaLoss.drop():
+                    sender.sendto(b''.join(buffers), address)
+                parity = encoder.add(buffers) if encoder is not None else None
+                if parity is not None:
+                    parityBytes += len(parity)
+                    if not parityLoss.drop():
+                        sender.sendto(parity, address)
+            drain()
+        drain()
+    finally:
+        sender.close()
+        receiver.close()
+
+    lostFrames = {frameOfSeq[s] for s in range(seq) if s not in received}
+    stats = decoder.stats()
+    return {
+        'packets': seq,
+        'overhead': parityBytes / mediaBytes,
+        'lostBefore': (seq - len(received) + stats['recovered']) / seq,
+        'lostAfter': (seq - len(received)) / seq,
+        'framesLost': len(lostFrames) / len(frames),
+        'recovered': stats['recovered'],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=400)
+    parser.add_argument('--loss', default="0.01,0.02,0.05,0.1", help="taxas de perda, separadas por vírgula")
+    parser.add_argument('--groups', default="0,4,8,16", help="pacotes por paridade (0 = sem FEC)")
+    parser.add_argument('--burst', type=float, default=1.0, help="tamanho médio das rajadas de perda")
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--frame-size', type=int, default=30000)
+    args = parser.parse_args()
+
+    frames = readFrames(args.frames, args.width, args.height, args.frame_size)
+    print(f"{args.frames} frames {args.width}x{args.height} de ~{args.frame_size} bytes, rajadas de {args.burst:g}")
+    print(f"{'perda':>6} {'grupo':>5} {'overhead':>9} {'perda antes':>12} {'perda depois':>13} "
+          f"{'frames perdidos':>16} {'recuperados':>12}")
+    for loss in (float(value) for value in args.loss.split(',')):
+        for group in (int(value) for value in args.groups.split(',')):
+            result = run(frames, loss, group, args.burst)
+            print(f"{loss:>6.1%} {group or '-':>5} {result['overhead']:>9.1%} {result['lostBefore']:>12.2%} "
+                  f"{result['lostAfter']:>13.2%} {result['framesLost']:>16.1%} {result['recovered']:>12}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import threading
+from collections import OrderedDict
+from Metrics import metrics
+
+# Limite padrão de memória do cache compartilhado (64 MB)
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+class FrameCache:
+    """Size-bounded LRU cache of frames keyed by (file key, frame number)."""
+
+    def __init__(self, maxBytes=DEFAULT_MAX_BYTES):
+        self.maxBytes = maxBytes
+        self.totalBytes = 0
+        self.frames = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, loader):
+        """Return the cached frame for key, calling loader() to read it on a miss."""
+        with self.lock:
+            data = self.frames.get(key)
+            if data is not None:
+                self.frames.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+
+        # A leitura do disco acontece fora do lock
+        data = loader()
+        if data:
+            self.put(key, data)
+        return data
+
+    def put(self, key, data):
+        """Insert a frame, evicting the least recently used ones beyond maxBytes."""
+        size = len(data)
+        if size > self.maxBytes:
+            return
+        with self.lock:
+            old = self.frames.pop(key, None)
+            if old is not None:
+                self.totalBytes -= len(old)
+            self.frames[key] = data
+            self.totalBytes += size
+            while self.totalBytes > self.maxBytes:
+                _, evicted = self.frames.popitem(last=False)
+                self.totalBytes -= len(evicted)
+                self.evictions += 1
+
+    def resize(self, maxBytes):
+        """Change the size limit, evicting frames if needed."""
+        with self.lock:
+            self.maxBytes = maxBytes
+            while self.totalBytes > self.maxBytes:
+                _, evicted = self.frames.popitem(last=False)
+                self.totalBytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every cached frame."""
+        with self.lock:
+            self.frames.clear()
+            self.totalBytes = 0
+
+    def stats(self):
+        """Return hit/miss counters and current occupancy."""
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'frames': len(self.frames),
+                'bytes': self.totalBytes,
+                'maxBytes': self.maxBytes,
+            }
+
+# Cache único do processo, compartilhado por todas as sessões
+frameCache = FrameCache()
+
+metrics.counter('frame_cache_hits_total', "Leituras de frame atendidas pelo cache", function=lambda: frameCache.hits)
+metrics.counter('frame_cache_misses_total', "Leituras de frame que foram ao arquivo", function=lambda: frameCache.misses)
+metrics.gauge('frame_cache_bytes', "Bytes de frames no cache", function=lambda: frameCache.totalBytes)
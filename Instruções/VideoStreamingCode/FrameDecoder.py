@@ -0,0 +1,114 @@
+import io, queue, threading
+from PIL import Image, ImageTk
+
+class FrameDecoder:
+    """Decode received JPEG frames in memory on a small worker pool and show them from the Tk main loop.
+
+    The RTP thread calls submit(); workers decode with PIL draft mode at the
+    display size; poll() runs on the Tk main loop via after() and shows the
+    newest decoded frame. Both queues are bounded and drop their oldest frame
+    when full, so a slow client skips frames instead of accumulating latency.
+    """
+
+    def __init__(self, master, onFrame, displaySize=(384, 288), workers=2, pollInterval=10):
+        self.master = master
+        self.onFrame = onFrame
+        self.displaySize = displaySize
+        self.pollInterval = pollInterval
+        self.input = queue.Queue(maxsize=workers)
+        self.output = queue.Queue(maxsize=workers + 1)
+        self.lastShown = 0
+        self.framesDecoded = 0
+        self.framesDropped = 0
+        self.running = True
+        self.pollId = None
+        self.workers = [threading.Thread(target=self.decodeLoop, name="FrameDecoder", daemon=True)
+                        for _ in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def putDroppingOldest(self, frameQueue, item):
+        """Put item in a bounded queue, discarding its oldest entry when it is full."""
+        while True:
+            try:
+                frameQueue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    frameQueue.get_nowait()
+                    self.framesDropped += 1
+                except queue.Empty:
+                    pass
+
+    def submit(self, frameNbr, data):
+        """Queue a received JPEG frame for decoding (called from the RTP thread)."""
+        if self.running:
+            self.putDroppingOldest(self.input, (frameNbr, data))
+
+    def decodeLoop(self):
+        while True:
+            item = self.input.get()
+            if item is None:
+                return
+            frameNbr, data = item
+            try:
+                image = Image.open(io.BytesIO(data))
+                # Draft: o decodificador JPEG reduz a escala na própria DCT, bem mais barato que decodificar e redimensionar
+                image.draft('RGB', self.displaySize)
+                if image.size[0] > self.displaySize[0] or image.size[1] > self.displaySize[1]:
+                    image.thumbnail(self.displaySize)
+                elif image.size[0] < self.displaySize[0] and image.size[1] < self.displaySize[1]:
+                    # Rendition de resolução menor (bitrate adaptativo): ampliada para a imagem não mudar de tamanho
+                    scale = min(self.displaySize[0] / image.size[0], self.displaySize[1] / image.size[1])
+                    image = image.resize((round(image.size[0] * scale), round(image.size[1] * scale)), Image.BILINEAR)
+                image.load()
+            except Exception as e:
+                # Em caso de imagem corrompida, apenas ignora o frame
+                print(f"Erro ao decodificar frame: {e}")
+                continue
+            self.framesDecoded += 1
+            self.putDroppingOldest(self.output, (frameNbr, image))
+
+    def start(self):
+        """Start polling decoded frames from the Tk main loop."""
+        self.pollId = self.master.after(self.pollInterval, self.poll)
+
+    def poll(self):
+        """Show the newest decoded frame and poll again (runs on the Tk main loop)."""
+        self.showNewest()
+        if self.running:
+            self.pollId = self.master.after(self.pollInterval, self.poll)
+
+    def showNewest(self):
+        """Show the newest decoded frame, if any (runs on the Tk main loop)."""
+        newest = None
+        while True:
+            try:
+                frameNbr, image = self.output.get_nowait()
+            except queue.Empty:
+                break
+            # Workers em paralelo podem terminar fora de ordem: só avança
+            if frameNbr > self.lastShown and (newest is None or frameNbr > newest[0]):
+                newest = (frameNbr, image)
+            else:
+                self.framesDropped += 1
+        if newest is not None:
+            self.lastShown = newest[0]
+            # PhotoImage só pode ser criado na thread do Tk
+            self.onFrame(ImageTk.PhotoImage(newest[1]))
+
+    def reset(self):
+        """Forget the last frame shown, e.g. when a new session starts numbering from 1."""
+        self.lastShown = 0
+
+    def stop(self):
+        """Stop the workers and the polling."""
+        self.running = False
+        for _ in self.workers:
+            self.putDroppingOldest(self.input, None)
+        if self.pollId is not None:
+            try:
+                self.master.after_cancel(self.pollId)
+            except Exception:
+                pass
+            self.pollId = None
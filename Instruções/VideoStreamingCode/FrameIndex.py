@@ -0,0 +1,119 @@
+import os, struct, mmap
+from array import array
+
+INDEX_EXT = ".idx"
+INDEX_MAGIC = b"MJIX"
+INDEX_VERSION = 1
+
+# magic, versão, mtime (ns) e tamanho do .Mjpeg, número de frames
+INDEX_HEADER = struct.Struct("<4sIqQQ")
+
+# Cada frame do .Mjpeg é precedido por 5 bytes ASCII com o seu tamanho
+FRAME_HEADER_SIZE = 5
+
+class FrameIndex:
+    """Offset index giving random access to the frames of an .Mjpeg file.
+
+    The index is built once by walking the length prefixes and saved next to
+    the video as <filename>.idx. The sidecar stores the mtime and size of the
+    video it was built from and is rebuilt whenever they no longer match.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.indexFile = filename + INDEX_EXT
+        stat = os.stat(filename)
+        self.mtime = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.mm = None
+        # offsets[n] é a posição do cabeçalho do frame n; offsets[-1] é o fim do último frame
+        self.offsets = None
+
+        if not self.load():
+            offsets = self.build()
+            try:
+                self.save(offsets)
+            except OSError:
+                # Diretório sem permissão de escrita: mantém o índice só em memória
+                pass
+            if not self.load():
+                self.offsets = offsets
+
+    def build(self):
+        """Walk the length prefixes of the video and return the frame offsets."""
+        offsets = array('Q', [0])
+        with open(self.filename, 'rb') as file:
+            pos = 0
+            while True:
+                data = file.read(FRAME_HEADER_SIZE)
+                if len(data) < FRAME_HEADER_SIZE:
+                    break
+                try:
+                    framelength = int(data)
+                except ValueError:
+                    break
+                end = pos + FRAME_HEADER_SIZE + framelength
+                if end > self.size:
+                    # Frame truncado no fim do arquivo
+                    break
+                file.seek(framelength, os.SEEK_CUR)
+                offsets.append(end)
+                pos = end
+        return offsets
+
+    def save(self, offsets):
+        """Write the sidecar index file."""
+        # Temporário por processo: workers do prefork podem criar o mesmo índice ao mesmo tempo
+        tmpFile = f"{self.indexFile}.{os.getpid()}.tmp"
+        try:
+            with open(tmpFile, 'wb') as file:
+                file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, self.mtime, self.size, len(offsets) - 1))
+                file.write(offsets.tobytes())
+            os.replace(tmpFile, self.indexFile)
+        except BaseException:
+            # Disco cheio ou escrita interrompida: o temporário não fica acumulado ao lado do vídeo
+            try:
+                os.unlink(tmpFile)
+            except OSError:
+                pass
+            raise
+
+    def load(self):
+        """Memory-map the sidecar index. Return False if it is missing or stale."""
+        try:
+            with open(self.indexFile, 'rb') as file:
+                mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+
+        valid = False
+        if len(mm) >= INDEX_HEADER.size:
+            magic, version, mtime, size, count = INDEX_HEADER.unpack_from(mm)
+            valid = (magic == INDEX_MAGIC and version == INDEX_VERSION
+                     and mtime == self.mtime and size == self.size
+                     and len(mm) == INDEX_HEADER.size + 8 * (count + 1))
+        if not valid:
+            mm.close()
+            return False
+
+        self.close()
+        self.mm = mm
+        self.offsets = memoryview(mm)[INDEX_HEADER.size:].cast('Q')
+        return True
+
+    def frameCount(self):
+        """Return the number of frames in the video."""
+        return len(self.offsets) - 1
+
+    def frameSpan(self, frameNumber):
+        """Return (offset, length) of the JPEG data of a 0-based frame number."""
+        start = self.offsets[frameNumber] + FRAME_HEADER_SIZE
+        return start, self.offsets[frameNumber + 1] - start
+
+    def close(self):
+        """Release the memory-mapped sidecar."""
+        if self.mm is not None:
+            self.offsets.release()
+            self.mm.close()
+            self.mm = None
+            self.offsets = None
@@ -0,0 +1,149 @@
+from collections import deque
+
+RTP_SEQ_MOD = 1 << 16
+RTP_TS_MOD = 1 << 32
+
+class SequenceExtender:
+    """Extend a wrapping RTP counter (16-bit sequence numbers or 32-bit timestamps) to a monotonic integer."""
+
+    def __init__(self, modulus):
+        self.modulus = modulus
+        self.half = modulus // 2
+        self.cycles = 0
+        self.maxValue = None
+
+    def extend(self, value):
+        if self.maxValue is None:
+            self.maxValue = value
+            return value
+        delta = (value - self.maxValue) % self.modulus
+        if delta < self.half:
+            # À frente do maior valor visto; passou de volta pelo zero?
+            if value < self.maxValue:
+                self.cycles += self.modulus
+            self.maxValue = value
+            return self.cycles + value
+        # Atrás do maior valor visto (pacote reordenado), possivelmente do ciclo anterior
+        if value > self.maxValue:
+            return self.cycles - self.modulus + value
+        return self.cycles + value
+
+class JitterBuffer:
+    """Reorder RTP packets and release them in sequence order on a playout clock.
+
+    Sequence numbers and timestamps are extended across their wraparound.
+    Each packet is released at the local time its RTP timestamp maps to, plus
+    the configured delay; a missing packet is given up on (counted as lost)
+    once the next packet present is due. Packets that arrive after their
+    sequence number was released or skipped are counted as late, repeated
+    ones as duplicates, and buffered ones thrown away by a sequence jump
+    larger than the window as dropped.
+    """
+
+    def __init__(self, delay=0.1, window=1024, clockRate=90000):
+        self.delay = delay
+        self.window = window
+        self.clockRate = clockRate
+        self.reset()
+
+    def reset(self):
+        """Forget every packet and the playout mapping (e.g. on a new PLAY)."""
+        self.seqExtender = SequenceExtender(RTP_SEQ_MOD)
+        self.tsExtender = SequenceExtender(RTP_TS_MOD)
+        self.packets = {}
+        self.nextSeq = None
+        # Menor (chegada - timestamp) visto: define quando cada timestamp deve tocar
+        self.minTransit = None
+        self.released = deque(maxlen=self.window)
+        self.releasedSet = set()
+        self.received = 0
+        self.lost = 0
+        self.late = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.dropped = 0
+
+    def insert(self, rtpPacket, arrival):
+        """Add a packet received at monotonic time arrival. Return False if it was discarded."""
+        seq = self.seqExtender.extend(rtpPacket.seqNum())
+        timestamp = self.tsExtender.extend(rtpPacket.timestamp())
+
+        if self.nextSeq is None:
+            self.nextSeq = seq
+        if seq < self.nextSeq:
+            if seq in self.releasedSet:
+                self.duplicates += 1
+            else:
+                self.late += 1
+            return False
+        if seq in self.packets:
+            self.duplicates += 1
+            return False
+        if seq - self.nextSeq >= self.window:
+            # Salto maior que a janela: considera perdido tudo que faltava e recomeça daqui
+            self.lost += sum(1 for s in range(self.nextSeq, seq) if s not in self.packets)
+            # Os que estavam no buffer nunca serão entregues
+            self.dropped += len(self.packets)
+            self.packets.clear()
+            self.nextSeq = seq
+        if seq < self.seqExtender.cycles + self.seqExtender.maxValue:
+            self.reordered += 1
+
+        self.received += 1
+        transit = arrival - timestamp / self.clockRate
+        if self.minTransit is None or transit < self.minTransit:
+            self.minTransit = transit
+        self.packets[seq] = (timestamp, rtpPacket)
+        return True
+
+    def playoutTime(self, timestamp):
+        """Return the local monotonic time at which an extended timestamp plays."""
+        return timestamp / self.clockRate + self.minTransit + self.delay
+
+    def pop(self, now):
+        """Return the packets due at monotonic time now, in sequence order."""
+        ready = []
+        while self.packets:
+            entry = self.packets.get(self.nextSeq)
+            if entry is None:
+                # Buraco: espera até o próximo pacote presente vencer, aí desiste do que falta
+                following = min(self.packets)
+                if self.playoutTime(self.packets[following][0]) > now:
+                    break
+                self.lost += following - self.nextSeq
+                self.nextSeq = following
+                continue
+            if self.playoutTime(entry[0]) > now:
+                break
+            del self.packets[self.nextSeq]
+            self.markReleased(self.nextSeq)
+            self.nextSeq += 1
+            ready.append(entry[1])
+        return ready
+
+    def markReleased(self, seq):
+        if len(self.released) == self.released.maxlen:
+            self.releasedSet.discard(self.released[0])
+        self.released.append(seq)
+        self.releasedSet.add(seq)
+
+    def timeUntilNext(self, now):
+        """Return seconds until the next packet is due, or None if the buffer is empty."""
+        if not self.packets:
+            return None
+        entry = self.packets.get(self.nextSeq)
+        if entry is None:
+            entry = self.packets[min(self.packets)]
+        return max(0.0, self.playoutTime(entry[0]) - now)
+
+    def stats(self):
+        """Return the packet counters."""
+        return {
+            'received': self.received,
+            'lost': self.lost,
+            'late': self.late,
+            'duplicates': self.duplicates,
+            'reordered': self.reordered,
+            'dropped': self.dropped,
+            'buffered': len(self.packets),
+        }
@@ -0,0 +1,381 @@
+import struct
+
+# Tamanho máximo de um datagrama RTP (cabeçalhos incluídos), abaixo do MTU Ethernet
+MAX_PACKET_SIZE = 1400
+RTP_HEADER_SIZE = 12
+
+# Cabeçalho principal RFC 2435: type-specific (8) + fragment offset (24), type, Q, width/8, height/8
+JPEG_HEADER = struct.Struct("!IBBBB")
+# Cabeçalho de restart (tipos 64-127): intervalo, F|L|contagem; 0xFFFF = fragmentos fora das fronteiras de restart
+RESTART_HEADER = struct.Struct("!HH")
+RESTART_ANY = 0xFFFF
+RESTART_TYPE = 64
+# Tipo dinâmico (128-255 ficam para o protocolo de sessão): o arquivo JFIF inteiro, para os frames que os tipos 0
+# e 1 não descrevem (4:4:4, progressivos, tabelas de Huffman próprias); declarado no fmtp do SDP
+JFIF_TYPE = 128
+# Cabeçalho de tabelas de quantização (Q >= 128): MBZ, precision, length
+QUANT_HEADER = struct.Struct("!BBH")
+
+# Q = 255: tabelas dinâmicas, enviadas no primeiro fragmento de cada frame
+DYNAMIC_Q = 255
+# Frames sem DQT: Q 50 corresponde às tabelas do anexo K da norma, sem escala
+STANDARD_Q = 50
+
+MAX_FRAGMENT_OFFSET = 0xFFFFFF
+
+# Largura e altura vão em unidades de 8 pixels, em 8 bits
+MAX_DIMENSION = 255 * 8
+
+# Posição natural (linha a linha) de cada coeficiente na ordem zigue-zague
+ZIGZAG = (0, 1, 8, 16, 9, 2, 3, 10, 17, 24, 32, 25, 18, 11, 4, 5, 12, 19, 26, 33, 40, 48, 41, 34, 27, 20, 13, 6, 7,
+          14, 21, 28, 35, 42, 49, 56, 57, 50, 43, 36, 29, 22, 15, 23, 30, 37, 44, 51, 58, 59, 52, 45, 38, 31, 39, 46,
+          53, 60, 61, 54, 47, 55, 62, 63)
+
+# Tabelas K.1 e K.2 da norma JPEG (ordem natural)
+LUMA_QUANTIZER = (16, 11, 10, 16, 24, 40, 51, 61, 12, 12, 14, 19, 26, 58, 60, 55, 14, 13, 16, 24, 40, 57, 69, 56,
+                  14, 17, 22, 29, 51, 87, 80, 62, 18, 22, 37, 56, 68, 109, 103, 77, 24, 35, 55, 64, 81, 104, 113, 92,
+                  49, 64, 78, 87, 103, 121, 120, 101, 72, 92, 95, 98, 112, 100, 103, 99)
+CHROMA_QUANTIZER = (17, 18, 24, 47, 99, 99, 99, 99, 18, 21, 26, 66, 99, 99, 99, 99, 24, 26, 56, 99, 99, 99, 99, 99,
+                    47, 66) + (99,) * 38
+
+# Tabelas de Huffman da seção K.3, as únicas que a RFC 2435 admite: (classe << 4 | id) -> contagens + símbolos
+HUFFMAN_TABLES = {
+    0x00: bytes((0, 1, 5, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0)) + bytes(range(12)),
+    0x01: bytes((0, 3, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0)) + bytes(range(12)),
+    0x10: bytes((0, 2, 1, 3, 3, 2, 4, 3, 5, 5, 4, 4, 0, 0, 1, 0x7D)) + bytes.fromhex(
+        "01020300041105122131410613516107227114328191a1082342b1c11552d1f0"
+        "2433627282090a161718191a25262728292a3435363738393a43444546474849"
+        "4a535455565758595a636465666768696a737475767778797a83848586878889"
+        "8a92939495969798999aa2a3a4a5a6a7a8a9aab2b3b4b5b6b7b8b9bac2c3c4c5"
+        "c6c7c8c9cad2d3d4d5d6d7d8d9dae1e2e3e4e5e6e7e8e9eaf1f2f3f4f5f6f7f8"
+        "f9fa"),
+    0x11: bytes((0, 2, 1, 2, 4, 4, 3, 4, 7, 5, 4, 4, 0, 1, 2, 0x77)) + bytes.fromhex(
+        "000102031104052131061241510761711322328108144291a1b1c109233352f0"
+        "156272d10a162434e125f11718191a262728292a35363738393a434445464748"
+        "494a535455565758595a636465666768696a737475767778797a828384858687"
+        "88898a92939495969798999aa2a3a4a5a6a7a8a9aab2b3b4b5b6b7b8b9bac2c3"
+        "c4c5c6c7c8c9cad2d3d4d5d6d7d8d9dae2e3e4e5e6e7e8e9eaf2f3f4f5f6f7f8"
+        "f9fa"),
+}
+
+def serialNewer(a, b):
+    """Return True if 32-bit timestamp a is newer than b, handling wraparound."""
+    return a != b and ((a - b) & 0xFFFFFFFF) < 0x80000000
+
+def parseJpegInfo(frame):
+    """Return (type, width, height) of a JPEG frame, read from its SOF marker.
+
+    type follows RFC 2435: 0 for 4:2:2 and 1 for 4:2:0 luma sampling. Returns
+    (1, 0, 0) when no SOF marker is found.
+    """
+    pos = 2
+    size = len(frame)
+    while pos + 4 <= size:
+        if frame[pos] != 0xFF:
+            break
+        marker = frame[pos + 1]
+        # Marcadores sem segmento (RSTn, SOI, TEM) e bytes de preenchimento 0xFF
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if 0xD0 <= marker <= 0xD8 or marker == 0x01:
+            pos += 2
+            continue
+        length = frame[pos + 2] << 8 | frame[pos + 3]
+        # SOF0..SOF15, exceto DHT (C4), JPG (C8) e DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            if pos + 11 + 3 > size:
+                break
+            height = frame[pos + 5] << 8 | frame[pos + 6]
+            width = frame[pos + 7] << 8 | frame[pos + 8]
+            sampling = frame[pos + 11]
+            jpegType = 0 if (sampling & 0x0F) == 1 else 1
+            return jpegType, width, height
+        # SOS: depois dele vêm os dados de scan
+        if marker == 0xDA:
+            break
+        pos += 2 + length
+    return 1, 0, 0
+
+def parseScan(frame):
+    """Read what RFC 2435 carries of a JPEG frame: (type, width, height, Q, tables, restart interval, scan start,
+    scan end), or None if the types 0 and 1 of RFC 2435 cannot describe the frame.
+
+    The format only covers baseline frames with three components, 4:2:2 or
+    4:2:0 luma sampling, one table for the luma and one for both chroma
+    components, the Huffman tables of section K.3 of the JPEG standard and
+    at most 2040x2040 pixels. tables is the quantization header and tables
+    of the first fragment (empty with STANDARD_Q, for a frame without DQT).
+    """
+    size = len(frame)
+    if size < 4 or frame[0] != 0xFF or frame[1] != 0xD8:
+        return None
+    quantizers = {}
+    sof = None
+    interval = 0
+    pos = 2
+    while pos + 4 <= size:
+        if frame[pos] != 0xFF:
+            return None
+        marker = frame[pos + 1]
+        # Bytes de preenchimento 0xFF e marcadores sem segmento
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if 0xD0 <= marker <= 0xD8 or marker == 0x01:
+            pos += 2
+            continue
+        length = frame[pos + 2] << 8 | frame[pos + 3]
+        segment = frame[pos + 4:pos + 2 + length]
+        if marker == 0xDB:
+            offset = 0
+            while offset < len(segment):
+                precision, table = segment[offset] >> 4, segment[offset] & 0x0F
+                tableSize = 128 if precision else 64
+                quantizers[table] = (precision, bytes(segment[offset + 1:offset + 1 + tableSize]))
+                offset += 1 + tableSize
+        elif marker == 0xC4:
+            offset = 0
+            while offset < len(segment):
+                end = offset + 17 + sum(segment[offset + 1:offset + 17])
+                if HUFFMAN_TABLES.get(segment[offset]) != segment[offset + 1:end]:
+                    return None
+                offset = end
+        elif marker == 0xDD and len(segment) >= 2:
+            interval = segment[0] << 8 | segment[1]
+        elif marker == 0xC0:
+            sof = segment
+        elif 0xC1 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            # Progressivo, aritmético ou sem perdas
+            return None
+        elif marker == 0xDA:
+            scanStart = pos + 2 + length
+            break
+        pos += 2 + length
+    else:
+        return None
+
+    # SOF0: precisão, altura, largura, 3 componentes (id, amostragem, tabela)
+    if sof is None or len(sof) < 15 or sof[0] != 8 or sof[5] != 3:
+        return None
+    height = sof[1] << 8 | sof[2]
+    width = sof[3] << 8 | sof[4]
+    if not 0 < width <= MAX_DIMENSION or not 0 < height <= MAX_DIMENSION:
+        return None
+    if sof[7] not in (0x21, 0x22) or sof[10] != 0x11 or sof[13] != 0x11 or sof[11] != sof[14]:
+        return None
+    jpegType = 0 if sof[7] == 0x21 else 1
+    # SOS de um único scan entrelaçado: luma com as tabelas 0, crominância com as 1
+    if len(segment) < 7 or segment[0] != 3 or (segment[2], segment[4], segment[6]) != (0x00, 0x11, 0x11):
+        return None
+
+    if not quantizers:
+        q, tables = STANDARD_Q, b''
+    else:
+        try:
+            luma, chroma = quantizers[sof[8]], quantizers[sof[11]]
+        except KeyError:
+            return None
+        data = luma[1] + chroma[1]
+        q = DYNAMIC_Q
+        tables = QUANT_HEADER.pack(0, luma[0] | chroma[0] << 1, len(data)) + data
+    if interval:
+        jpegType += RESTART_TYPE
+
+    # O EOI não é transportado: o receptor o recoloca
+    scanEnd = frame.rfind(b"\xff\xd9", scanStart)
+    if scanEnd < 0:
+        scanEnd = size
+    return jpegType, width // 8, height // 8, q, tables, interval, scanStart, scanEnd
+
+class JpegPacketizer:
+    """Split JPEG frames into RFC 2435 fragments that fit in MAX_PACKET_SIZE datagrams.
+
+    Only the entropy-coded scan data is sent, as the RFC requires: the
+    quantization tables of the frame go in the quantization header of the
+    first fragment (Q = 255) and the restart interval, if any, in a restart
+    header of every fragment. The receiver rebuilds the JPEG headers from
+    them. A frame that types 0 and 1 cannot describe (see parseScan) is sent
+    whole with JFIF_TYPE, which other RFC 2435 receivers drop as unknown
+    instead of decoding it with the wrong headers.
+    """
+
+    def __init__(self, maxPacketSize=MAX_PACKET_SIZE):
+        self.maxPayload = maxPacketSize - RTP_HEADER_SIZE - JPEG_HEADER.size
+
+    def packetize(self, frame):
+        """Return a list of (payload header, fragment, last) for one frame."""
+        scan = parseScan(frame)
+        if scan is None:
+            _, width, height = parseJpegInfo(frame)
+            scan = (JFIF_TYPE, min(width // 8, 255), min(height // 8, 255), 0, b'', 0, 0, len(frame))
+        jpegType, width, height, q, tables, interval, start, end = scan
+        if end - start > MAX_FRAGMENT_OFFSET:
+            raise ValueError("frame grande demais para o fragment offset de 24 bits")
+        restart = RESTART_HEADER.pack(interval, RESTART_ANY) if interval else b''
+
+        view = memoryview(frame)[start:end]
+        fragments = []
+        offset = 0
+        total = end - start
+        while True:
+            header = JPEG_HEADER.pack(offset, jpegType, q, width, height) + restart
+            if offset == 0:
+                header += tables
+            end = min(offset + self.maxPayload - len(header) + JPEG_HEADER.size, total)
+            fragments.append((header, view[offset:end], end == total))
+            if end == total:
+                return fragments
+            offset = end
+
+def makeTables(q):
+    """Return the luma and chroma quantization tables (zigzag order) of a Q below 128 (RFC 2435, appendix A)."""
+    factor = max(1, min(q, 99))
+    scale = 5000 // factor if factor < 50 else 200 - factor * 2
+    return b''.join(bytes(max(1, min((quantizer[z] * scale + 50) // 100, 255)) for z in ZIGZAG)
+                    for quantizer in (LUMA_QUANTIZER, CHROMA_QUANTIZER))
+
+def makeHeaders(jpegType, width, height, precision, tables, interval):
+    """Return the JPEG headers (SOI to SOS) of an RFC 2435 frame (appendix A)."""
+    parts = [b"\xff\xd8"]
+    offset = 0
+    for table in (0, 1):
+        tableSize = 128 if precision >> table & 1 else 64
+        parts.append(struct.pack("!HHB", 0xFFDB, 3 + tableSize, (tableSize == 128) << 4 | table))
+        parts.append(tables[offset:offset + tableSize])
+        offset += tableSize
+    if interval:
+        parts.append(struct.pack("!HHH", 0xFFDD, 4, interval))
+    sampling = 0x21 if jpegType & 1 == 0 else 0x22
+    parts.append(struct.pack("!HHBHHB", 0xFFC0, 17, 8, height * 8, width * 8, 3))
+    parts.append(bytes((1, sampling, 0, 2, 0x11, 1, 3, 0x11, 1)))
+    for table, data in HUFFMAN_TABLES.items():
+        parts.append(struct.pack("!HHB", 0xFFC4, 3 + len(data), table) + data)
+    parts.append(bytes((0xFF, 0xDA, 0, 12, 3, 1, 0x00, 2, 0x11, 3, 0x11, 0, 63, 0)))
+    return b''.join(parts)
+
+class JpegReassembler:
+    """Rebuild JPEG frames from RFC 2435 fragments that may arrive out of order or be lost.
+
+    The scan data of the fragments is joined and prefixed with headers built
+    from the payload header (JFIF_TYPE fragments already carry the whole file): the quantization tables sent with the frame
+    (or the standard ones scaled by Q below 128), the restart interval and
+    the standard Huffman tables. The headers are kept while they do not
+    change, which is every frame of a video encoded with fixed tables.
+    """
+
+    def __init__(self, maxPending=4):
+        # Frames incompletos ainda aguardados, por timestamp RTP
+        self.maxPending = maxPending
+        self.pending = {}
+        self.lastTimestamp = None
+        self.framesCompleted = 0
+        self.framesLost = 0
+        self.latePackets = 0
+        # Tabelas de Q 128-254 podem vir só no primeiro frame que usa aquele Q
+        self.quantizers = {}
+        self.headerKey = None
+        self.headers = None
+
+    def addPacket(self, rtpPacket):
+        """Add a decoded RtpPacket. Return the JPEG frame it completes, or None."""
+        timestamp = rtpPacket.timestamp()
+        if self.lastTimestamp is not None and not serialNewer(timestamp, self.lastTimestamp):
+            # Fragmento de um frame já entregue ou descartado
+            self.latePackets += 1
+            return None
+
+        payload = rtpPacket.getPayload()
+        if len(payload) < JPEG_HEADER.size:
+            return None
+        word, jpegType, q, width, height = JPEG_HEADER.unpack_from(payload)
+        offset = word & MAX_FRAGMENT_OFFSET
+        start = JPEG_HEADER.size
+        interval = 0
+        if RESTART_TYPE <= jpegType < JFIF_TYPE:
+            if len(payload) < start + RESTART_HEADER.size:
+                return None
+            interval = RESTART_HEADER.unpack_from(payload, start)[0]
+            start += RESTART_HEADER.size
+        quantizer = None
+        if q >= 128 and offset == 0:
+            if len(payload) < start + QUANT_HEADER.size:
+                return None
+            _, precision, length = QUANT_HEADER.unpack_from(payload, start)
+            start += QUANT_HEADER.size
+            if length:
+                quantizer = (precision, bytes(payload[start:start + length]))
+            start += length
+        data = payload[start:]
+
+        frame = self.pending.get(timestamp)
+        if frame is None:
+            frame = self.pending[timestamp] = {'fragments': {}, 'received': 0, 'total': None,
+                                               'header': (jpegType, q, width, height, interval), 'quantizer': None}
+        if offset in frame['fragments']:
+            return None
+        frame['fragments'][offset] = data
+        frame['received'] += len(data)
+        if quantizer is not None:
+            frame['quantizer'] = quantizer
+        if rtpPacket.marker():
+            frame['total'] = offset + len(data)
+
+        if frame['total'] is not None and frame['received'] >= frame['total']:
+            return self.complete(timestamp, frame)
+
+        # Limita a memória: descarta os frames incompletos mais antigos
+        while len(self.pending) > self.maxPending:
+            # Todos os pendentes são mais novos que o último entregue
+            reference = timestamp - 0x80000000 if self.lastTimestamp is None else self.lastTimestamp
+            oldest = min(self.pending, key=lambda ts: (ts - reference) & 0xFFFFFFFF)
+            del self.pending[oldest]
+            self.framesLost += 1
+        return None
+
+    def complete(self, timestamp, frame):
+        """Join the fragments of a finished frame and drop older incomplete ones."""
+        data = b''.join(frame['fragments'][offset] for offset in sorted(frame['fragments']))
+        del self.pending[timestamp]
+        for ts in list(self.pending):
+            if not serialNewer(ts, timestamp):
+                del self.pending[ts]
+                self.framesLost += 1
+        self.lastTimestamp = timestamp
+        if frame['header'][0] == JFIF_TYPE:
+            headers = trailer = b''
+        else:
+            headers = self.frameHeaders(frame['header'], frame['quantizer'])
+            trailer = b"\xff\xd9"
+        if len(data) != frame['total'] or headers is None:
+            # Fragmentos sobrepostos, tipo desconhecido ou tabelas que não chegaram: frame inconsistente
+            self.framesLost += 1
+            return None
+        self.framesCompleted += 1
+        return headers + data + trailer
+
+    def frameHeaders(self, header, quantizer):
+        """Return the JPEG headers of a frame, or None if it cannot be rebuilt."""
+        jpegType, q, width, height, interval = header
+        if jpegType & ~RESTART_TYPE not in (0, 1):
+            return None
+        if q < 128:
+            quantizer = (0, q)
+        elif quantizer is not None:
+            if q < 255:
+                self.quantizers[q] = quantizer
+        else:
+            quantizer = self.quantizers.get(q)
+            if quantizer is None:
+                return None
+        key = (jpegType, width, height, interval, quantizer)
+        if key != self.headerKey:
+            precision, tables = quantizer
+            if q < 128:
+                tables = makeTables(q)
+            expected = sum(128 if precision >> table & 1 else 64 for table in (0, 1))
+            if len(tables) < expected:
+                return None
+            self.headers = makeHeaders(jpegType, width, height, precision, tables, interval)
+            self.headerKey = key
+        return self.headers
@@ -0,0 +1,280 @@
+import os, stat, threading, time, urllib.parse, zlib
+
+from FrameIndex import FRAME_HEADER_SIZE
+from JpegPayload import JpegPacketizer, parseJpegInfo
+from MediaCatalog import buildSdp
+from Metrics import metrics
+from Scheduler import MediaClock
+from VideoStream import VideoStream, FRAME_RATE
+
+# Frames guardados no anel de cada canal
+RING_CAPACITY = 64
+
+# Atraso máximo de um assinante (segundos) antes de pular para o frame mais recente
+MAX_SUBSCRIBER_LAG = 0.5
+
+# Intervalo entre consultas de um assinante quando o produtor atrasa um frame
+LIVE_POLL_INTERVAL = 0.005
+
+# Peso do último frame na média móvel do tamanho dos frames
+SIZE_SMOOTHING = 1 / 32
+
+LIVE_PREFIX = "live/"
+
+framesPublished = metrics.counter('live_frames_published_total', "Frames lidos e fragmentados pelo produtor do canal",
+                                  ['channel'])
+framesSkipped = metrics.counter('live_frames_skipped_total', "Frames pulados por assinantes atrasados", ['channel'])
+liveSubscribers = metrics.gauge('live_channel_subscribers', "Sessões assistindo ao canal", ['channel'])
+
+class LiveFrame:
+    """One frame of the ring: its RTP payloads, as views of a buffer written once."""
+    __slots__ = ('seq', 'payloads', 'size', 'published')
+
+    def __init__(self, seq, payloads, size, published):
+        self.seq = seq
+        self.payloads = payloads
+        self.size = size
+        self.published = published
+
+def fileFrames(path):
+    """Yield the frames of an .Mjpeg file in a loop, paced at FRAME_RATE."""
+    stream = VideoStream(path)
+    try:
+        clock = MediaClock(FRAME_RATE)
+        frameIndex = 0
+        while True:
+            data = stream.nextFrame()
+            if not data:
+                if stream.frameNbr() == 0:
+                    return
+                stream.seek(0)
+                continue
+            now = time.monotonic()
+            due = clock.nextDueTime(frameIndex, now)
+            if due > now:
+                time.sleep(due - now)
+            yield data
+            frameIndex += 1
+    finally:
+        stream.close()
+
+def pipeFrames(path):
+    """Yield the frames written to a FIFO in the .Mjpeg format, as they arrive.
+
+    When the writer closes the FIFO, waits for the next one.
+    """
+    while True:
+        with open(path, 'rb') as pipe:
+            while True:
+                header = pipe.read(FRAME_HEADER_SIZE)
+                if len(header) < FRAME_HEADER_SIZE:
+                    break
+                length = int(header)
+                data = pipe.read(length)
+                if len(data) < length:
+                    break
+                yield data
+
+def isPipe(path):
+    try:
+        return stat.S_ISFIFO(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+class LiveChannel:
+    """A live stream read and packetized once, shared by every session watching it.
+
+    One producer thread takes frames from the source (a FIFO fed by an
+    encoder, or an .Mjpeg file played in a loop), splits each one into
+    RFC 2435 payloads in a single buffer and publishes it in a ring of
+    capacity frames. Sessions subscribe at the live edge and read the
+    payloads as memoryviews of that buffer, adding only their own RTP
+    header; a subscriber more than MAX_SUBSCRIBER_LAG behind jumps to the
+    newest frame, so the producer never waits for anyone.
+    """
+
+    def __init__(self, name, source, capacity=RING_CAPACITY):
+        self.name = name
+        self.uri = LIVE_PREFIX + name
+        self.source = source
+        self.capacity = capacity
+        self.maxLag = max(1, min(capacity - 1, int(MAX_SUBSCRIBER_LAG * FRAME_RATE)))
+        self.slots = [None] * capacity
+        # Número do próximo frame a publicar
+        self.head = 0
+        self.published = time.monotonic()
+        self.stopped = False
+        self.thread = None
+        self.packetizer = JpegPacketizer()
+        self.averageSize = 0.0
+        self.width = self.height = 0
+        self.sessionId = zlib.crc32(self.uri.encode('utf-8'))
+        self.version = int(time.time())
+
+    def start(self):
+        """Start the producer thread (once per process)."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="LiveChannel-" + self.name, daemon=True)
+            self.thread.start()
+        return self
+
+    def run(self):
+        frames = pipeFrames(self.source) if isPipe(self.source) else fileFrames(self.source)
+        try:
+            for data in frames:
+                self.publish(data)
+        except (OSError, ValueError) as e:
+            print(f"Erro no canal ao vivo {self.name}:", e)
+        self.stopped = True
+        print(f"Canal ao vivo {self.name} encerrado")
+
+    def publish(self, data):
+        """Packetize a frame into one buffer and put it in the ring."""
+        buffer = bytearray()
+        ends = []
+        for jpegHeader, fragment, last in self.packetizer.packetize(data):
+            buffer += jpegHeader
+            buffer += fragment
+            ends.append(len(buffer))
+        # O bytearray não muda mais: views exportadas impedem até o redimensionamento
+        view = memoryview(buffer)
+        payloads = []
+        start = 0
+        for end in ends:
+            payloads.append(view[start:end])
+            start = end
+
+        seq = self.head
+        if seq == 0:
+            _, self.width, self.height = parseJpegInfo(data)
+            self.averageSize = len(data)
+        self.averageSize += (len(data) - self.averageSize) * SIZE_SMOOTHING
+        now = time.monotonic()
+        # O slot é trocado antes de head avançar: quem lê head já encontra o frame
+        self.slots[seq % self.capacity] = LiveFrame(seq, payloads, len(data), now)
+        self.published = now
+        self.head = seq + 1
+        framesPublished.labels(self.name).inc()
+
+    def frameAt(self, seq):
+        """Return the frame seq, or None if it was overwritten or is not published yet."""
+        frame = self.slots[seq % self.capacity]
+        if frame is None or frame.seq != seq:
+            return None
+        return frame
+
+    def liveEdge(self):
+        """Return the number of the newest frame (the next one before the first frame)."""
+        return max(0, self.head - 1)
+
+    @property
+    def averageBitrate(self):
+        return self.averageSize * 8 * FRAME_RATE
+
+    @property
+    def sdp(self):
+        return buildSdp(self.uri, self.sessionId, self.version, "npt=now-", self.width, self.height, FRAME_RATE,
+                        self.averageBitrate, ["a=type:broadcast"])
+
+    def subscribe(self):
+        return LiveSubscription(self)
+
+class LiveClock:
+    """Due times of a subscriber: each frame as soon as the channel has published it."""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.startTime = time.monotonic()
+
+    def nextDueTime(self, frameIndex, now):
+        channel = self.channel
+        if frameIndex < channel.head or channel.stopped:
+            return now
+        # Ainda não publicado: esperado um intervalo de frame depois do último; se o produtor atrasar,
+        # o assinante volta a olhar a cada LIVE_POLL_INTERVAL
+        expected = channel.published + (frameIndex - channel.head + 1) / FRAME_RATE
+        return max(expected, now + LIVE_POLL_INTERVAL)
+
+class LiveSubscription:
+    """A session's read position in a live channel, used by ServerWorker like a VideoStream."""
+    live = True
+    __slots__ = ('channel', 'filename', 'frameNum', 'subscribers')
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.filename = channel.uri
+        self.frameNum = channel.liveEdge()
+        self.subscribers = liveSubscribers.labels(channel.name)
+        self.subscribers.inc()
+
+    def mediaClock(self):
+        """Return the clock of a new PLAY, which starts at the live edge."""
+        self.frameNum = self.channel.liveEdge()
+        return LiveClock(self.channel)
+
+    def frameReady(self):
+        """Check whether the next frame was published (or the channel ended)."""
+        return self.frameNum < self.channel.head or self.channel.stopped
+
+    def nextPayloads(self):
+        """Get the shared RTP payloads of the next frame; an empty list once the channel ended."""
+        channel = self.channel
+        frame = None
+        if self.frameNum < channel.head:
+            if channel.head - self.frameNum > channel.maxLag:
+                self.skipTo(channel.liveEdge())
+            frame = channel.frameAt(self.frameNum)
+            if frame is None:
+                # Sobrescrito entre a leitura de head e a do slot
+                self.skipTo(channel.liveEdge())
+                frame = channel.frameAt(self.frameNum)
+        if frame is None:
+            return []
+        self.frameNum += 1
+        return frame.payloads
+
+    def skipTo(self, frameNumber):
+        # Assinante lento: pula para o frame mais recente em vez de segurar o produtor
+        framesSkipped.labels(self.channel.name).inc(frameNumber - self.frameNum)
+        self.frameNum = frameNumber
+
+    def frameNbr(self):
+        """Get the channel number of the next frame."""
+        return self.frameNum
+
+    def close(self):
+        if self.channel is not None:
+            self.subscribers.dec()
+            self.channel = None
+
+class LiveChannels:
+    """The live channels of this process, by URI (live/<name>)."""
+
+    def __init__(self):
+        self.channels = {}
+
+    def add(self, name, source, capacity=RING_CAPACITY):
+        channel = LiveChannel(name, source, capacity)
+        self.channels[channel.uri] = channel
+        return channel
+
+    def get(self, uri):
+        """Return the channel of an RTSP URI, or None if it is not a live channel.
+
+        rtsp://host:port/live/NAME, /live/NAME and live/NAME all name the
+        channel live/NAME.
+        """
+        # Sem esquema e autoridade; só uma barra inicial é removida
+        path = urllib.parse.urlsplit(uri).path
+        return self.channels.get(path[1:] if path.startswith('/') else path)
+
+    def hasPipes(self):
+        return any(isPipe(channel.source) for channel in self.channels.values())
+
+    def start(self):
+        """Start the producers (threads do not survive fork: each prefork worker starts its own)."""
+        for channel in self.channels.values():
+            channel.start()
+
+# Canais únicos do processo
+liveChannels = LiveChannels()
@@ -0,0 +1,233 @@
+"""End-to-end load test: N headless clients streaming from a loopback server.
+
+Usage: python LoadTest.py [--sessions 50] [--duration 10] [--mode threaded|async|prefork]
+                          [--transport udp|tcp] [--packetize] [--processes 2] [--output result.json]
+                          [--compare old.json]
+
+A server is started on loopback with a synthetic .Mjpeg file and the sessions
+(ClientEngine without GUI, RTP and RTCP included) are spread over a few client
+processes. After a warm-up every process measures the same window: frames/s,
+Mbit/s, frame loss, packet loss, server CPU, and the latency of each frame from
+its instant on the server's media clock (mapped by the RTCP SR, client and
+server share the wallclock on loopback) until it is complete on the client.
+The result is written as JSON; --compare prints the change against an older run.
+"""
+import argparse, json, multiprocessing, os, platform, subprocess, sys, tempfile, time
+
+from ClientEngine import ClientEngine
+from Rtcp import NTP_EPOCH_OFFSET
+from ServerBenchmark import freePort, processTreeCpu, raiseFileLimit
+from SyntheticVideo import writeSyntheticMjpeg
+from Scheduler import RTP_CLOCK_RATE
+from VideoStream import FRAME_RATE
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+class LoadSession(ClientEngine):
+    """Headless session that counts frames and their latency inside the measured window."""
+    verbose = False
+
+    def __init__(self, *args, **kwargs):
+        self.measuring = False
+        self.latencies = []
+        self.frames = 0
+        # Último SR: (timestamp RTP, instante Unix correspondente no servidor)
+        self.senderClock = None
+        ClientEngine.__init__(self, *args, **kwargs)
+
+    def onSenderReport(self, packet, arrival):
+        ClientEngine.onSenderReport(self, packet, arrival)
+        wallclock = packet['ntpSeconds'] - NTP_EPOCH_OFFSET + packet['ntpFraction'] / (1 << 32)
+        self.senderClock = (packet['rtpTimestamp'], wallclock)
+
+    def onFrame(self, frameNbr, frame, timestamp):
+        if not self.measuring:
+            return
+        self.frames += 1
+        if self.senderClock is not None:
+            rtpTs, wallclock = self.senderClock
+            # Diferença de timestamps com sinal (32 bits)
+            delta = ((timestamp - rtpTs + (1 << 31)) % (1 << 32)) - (1 << 31)
+            self.latencies.append(time.time() - (wallclock + delta / RTP_CLOCK_RATE))
+
+    def packetCounts(self):
+        """Return (expected, received) RTP packets so far."""
+        stats = self.receiverStats
+        if stats.baseSeq is None:
+            return 0, 0
+        return stats.maxSeq - stats.baseSeq + 1, stats.received
+
+    def startMeasuring(self):
+        self.frames = 0
+        self.latencies = []
+        self.bytesAtStart = self.bytesReceived
+        self.packetsAtStart = self.packetCounts()
+        self.framesLostAtStart = self.reassembler.framesLost
+        self.measuring = True
+
+    def stopMeasuring(self):
+        self.measuring = False
+        expected, received = self.packetCounts()
+        return {
+            'frames': self.frames,
+            'bytes': self.bytesReceived - self.bytesAtStart,
+            'packetsExpected': expected - self.packetsAtStart[0],
+            'packetsReceived': received - self.packetsAtStart[1],
+            'framesLost': self.reassembler.framesLost - self.framesLostAtStart,
+            'latencies': self.latencies,
+        }
+
+def openSession(port, videoName, rtpPort, jitterDelay, transport, timeout=5.0):
+    """SETUP and PLAY one session. Return it, or None if the server did not accept it."""
+    session = LoadSession('127.0.0.1', port, rtpPort, videoName, jitterDelay, transport)
+    for request in (session.setupMovie, session.playMovie):
+        request()
+        if not session.waitReply(timeout) or session.state == session.INIT:
+            session.close()
+            return None
+    return session
+
+def runClients(port, videoName, rtpPorts, jitterDelay, transport, warmup, duration, barrier, results):
+    """Client process: open the sessions, wait for the others, measure the window."""
+    raiseFileLimit()
+    sessions = []
+    failed = 0
+    for rtpPort in rtpPorts:
+        session = openSession(port, videoName, rtpPort, jitterDelay, transport)
+        if session is None:
+            failed += 1
+        else:
+            sessions.append(session)
+    time.sleep(warmup)
+    barrier.wait()
+
+    for session in sessions:
+        session.startMeasuring()
+    time.sleep(duration)
+    measured = [session.stopMeasuring() for session in sessions]
+
+    for session in sessions:
+        session.teardownMovie()
+    time.sleep(0.2)
+    for session in sessions:
+        session.close()
+    results.put({'failed': failed, 'sessions': measured})
+
+def percentile(values, p):
+    """Nearest-rank percentile of a list (None if empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+def summarize(parts, duration, serverCpu):
+    sessions = [session for part in parts for session in part['sessions']]
+    latencies = [latency for session in sessions for latency in session['latencies']]
+    frames = sum(session['frames'] for session in sessions)
+    expected = sum(session['packetsExpected'] for session in sessions)
+    received = sum(session['packetsReceived'] for session in sessions)
+    framesLost = sum(session['framesLost'] for session in sessions)
+    return {
+        'sessions': len(sessions),
+        'failedSessions': sum(part['failed'] for part in parts),
+        'framesPerSecond': frames / duration,
+        'framesPerSecondPerSession': frames / duration / len(sessions) if sessions else 0.0,
+        'mbitPerSecond': sum(session['bytes'] for session in sessions) * 8 / duration / 1e6,
+        'latencyP50Ms': None if not latencies else percentile(latencies, 50) * 1000,
+        'latencyP99Ms': None if not latencies else percentile(latencies, 99) * 1000,
+        'packetLoss': 1 - received / expected if expected else 0.0,
+        'frameLoss': framesLost / (frames + framesLost) if frames + framesLost else 0.0,
+        'serverCpu': serverCpu,
+    }
+
+def compare(result, baselineFile):
+    """Print the change of each numeric metric against an older result file."""
+    with open(baselineFile) as file:
+        baseline = json.load(file)['result']
+    print(f"\ncomparação com {baselineFile}:")
+    for name, value in result.items():
+        old = baseline.get(name)
+        if isinstance(value, (int, float)) and isinstance(old, (int, float)):
+            change = "" if not old else f" ({(value - old) / abs(old):+.1%})"
+            print(f"  {name:<26} {old:>12.3f} -> {value:>12.3f}{change}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10.0, help="segundos medidos")
+    parser.add_argument('--warmup', type=float, default=2.0)
+    parser.add_argument('--mode', default='threaded', choices=['threaded', 'async', 'prefork'])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="processos worker do modo prefork")
+    parser.add_argument('--transport', default='udp', choices=['udp', 'tcp'],
+                        help="tcp: RTP intercalado na conexão RTSP")
+    parser.add_argument('--packetize', action='store_true', help="servidor usa o packet store (.pkt) do vídeo")
+    parser.add_argument('--processes', type=int, default=2, help="processos cliente")
+    parser.add_argument('--jitter-ms', type=int, default=0, help="atraso do jitter buffer dos clientes")
+    parser.add_argument('--frame-size', type=int, default=8000, help="bytes por frame JPEG sintético")
+    parser.add_argument('--base-port', type=int, default=40000, help="primeira porta RTP dos clientes")
+    parser.add_argument('--output', default='loadtest.json')
+    parser.add_argument('--compare', help="resultado anterior (JSON) para comparar")
+    args = parser.parse_args()
+
+    raiseFileLimit()
+    processes = max(1, min(args.processes, args.sessions))
+    with tempfile.TemporaryDirectory() as tmp:
+        # Vídeo longo o bastante para não acabar durante o teste, mesmo com um ramp-up lento
+        frames = int(FRAME_RATE * (args.warmup + args.duration + 60))
+        videoFile = writeSyntheticMjpeg(os.path.join(tmp, 'load.Mjpeg'), frames, frameSize=args.frame_size)
+        port = freePort()
+        command = [sys.executable, os.path.join(HERE, 'Server.py'), str(port), '--mode', args.mode]
+        if args.mode == 'prefork':
+            command += ['--workers', str(args.workers)]
+        if args.packetize:
+            command.append('--packetize')
+        server = subprocess.Popen(command,
+                                  cwd=tmp, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        workers = []
+        try:
+            time.sleep(1.0)
+            barrier = multiprocessing.Barrier(processes + 1)
+            results = multiprocessing.Queue()
+            # Cada sessão usa duas portas: RTP e RTCP
+            rtpPorts = [args.base_port + 2 * i for i in range(args.sessions)]
+            for i in range(processes):
+                worker = multiprocessing.Process(
+                    target=runClients,
+                    args=(port, 'load.Mjpeg', rtpPorts[i::processes], args.jitter_ms / 1000,
+                          args.transport, args.warmup, args.duration, barrier, results))
+                worker.start()
+                workers.append(worker)
+
+            barrier.wait()
+            # CPU do servidor inteiro: no modo prefork, supervisor e workers
+            cpuBefore = processTreeCpu(server.pid)
+            time.sleep(args.duration)
+            cpuAfter = processTreeCpu(server.pid)
+            parts = [results.get() for _ in workers]
+        finally:
+            for worker in workers:
+                worker.join(5)
+            # terminate: o supervisor do prefork encerra os seus workers
+            server.terminate()
+            server.wait()
+
+    serverCpu = None if cpuBefore is None else (cpuAfter - cpuBefore) / args.duration
+    result = summarize(parts, args.duration, serverCpu)
+    output = {
+        'config': {name: value for name, value in vars(args).items() if name not in ('output', 'compare')},
+        'result': result,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+    }
+    with open(args.output, 'w') as file:
+        json.dump(output, file, indent=2)
+
+    for name, value in result.items():
+        print(f"{name:<26} {'?' if value is None else round(value, 3)}")
+    print(f"resultado salvo em {args.output}")
+    if args.compare:
+        compare(result, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import os, threading, time, zlib
+
+from Fec import FecEncoder, FEC_PT, sdpLines
+from FrameIndex import FrameIndex, FRAME_HEADER_SIZE
+from Retransmit import RetransmitRing
+from JpegPayload import JFIF_TYPE, parseJpegInfo
+from Metrics import metrics
+from Scheduler import RTP_CLOCK_RATE
+from VideoStream import FRAME_RATE
+
+# Payload type do JPEG no perfil RTP/AVP (RFC 3551)
+MJPEG_PT = 26
+
+MEDIA_EXT = ".mjpeg"
+
+# Intervalo entre as varreduras do diretório de mídia (só arquivos alterados são relidos)
+SCAN_INTERVAL = 10.0
+
+# Bytes lidos do início do primeiro frame para achar o marcador SOF
+SOF_SEARCH_SIZE = 64 * 1024
+
+class MediaInfo:
+    """What the catalog knows about one video, with its SDP description built once."""
+
+    def __init__(self, path, mtime, size, frameCount, width, height, jpegType, mediaBytes):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.mtime = mtime
+        self.size = size
+        self.frameCount = frameCount
+        self.frameRate = FRAME_RATE
+        self.duration = frameCount / FRAME_RATE
+        self.width = width
+        self.height = height
+        self.jpegType = jpegType
+        # Taxa média dos frames JPEG (bits/s), sem os prefixos de tamanho do .Mjpeg
+        self.averageBitrate = mediaBytes * 8 / self.duration if frameCount else 0
+        self.sdp = self.buildSdp()
+
+    def buildSdp(self):
+        """Return the SDP (RFC 4566) of the video, as sent in the DESCRIBE reply."""
+        # Id estável entre processos (prefork); a versão muda quando o arquivo é regravado
+        return buildSdp(self.name, zlib.crc32(self.path.encode('utf-8')), self.mtime // 10**9,
+                        f"npt=0-{self.duration:.3f}", self.width, self.height, self.frameRate,
+                        self.averageBitrate, [f"a=x-framecount:{self.frameCount}"])
+
+def buildSdp(name, sessionId, version, range, width, height, frameRate, averageBitrate, extra=()):
+    """Return the SDP of an MJPEG stream: CRLF lines, one video media with RTP/AVP payload type 26.
+
+    When the server offers FEC, the media also lists the parity payload type;
+    when it offers retransmission, the JPEG payload type accepts generic NACKs.
+    The fmtp line declares the dynamic RFC 2435 type of frames sent whole.
+    """
+    fecGroup = FecEncoder.group
+    payloadTypes = f"{MJPEG_PT} {FEC_PT}" if fecGroup else f"{MJPEG_PT}"
+    lines = [
+        "v=0",
+        f"o=- {sessionId} {version} IN IP4 0.0.0.0",
+        f"s={name}",
+        f"i=MJPEG {width}x{height}, {frameRate} fps",
+        "t=0 0",
+        "a=control:*",
+        f"a=range:{range}",
+        f"m=video 0 RTP/AVP {payloadTypes}",
+        "c=IN IP4 0.0.0.0",
+        f"b=AS:{int(round(averageBitrate / 1000))}",
+        f"a=rtpmap:{MJPEG_PT} JPEG/{RTP_CLOCK_RATE}",
+        f"a=fmtp:{MJPEG_PT} x-jfif-type={JFIF_TYPE}",
+        *sdpLines(fecGroup),
+        *([f"a=rtcp-fb:{MJPEG_PT} nack"] if RetransmitRing.enabled else []),
+        f"a=framerate:{frameRate}",
+        f"a=x-dimensions:{width},{height}",
+    ]
+    lines.extend(extra)
+    lines.append("a=control:streamid=0")
+    return "\r\n".join(lines) + "\r\n"
+
+def describeFile(path):
+    """Read the metadata of an .Mjpeg file (frame index and the SOF of its first frame)."""
+    stat = os.stat(path)
+    index = FrameIndex(path)
+    try:
+        frameCount = index.frameCount()
+        width = height = 0
+        jpegType = 1
+        mediaBytes = 0
+        if frameCount:
+            start, length = index.frameSpan(0)
+            with open(path, 'rb') as file:
+                file.seek(start)
+                jpegType, width, height = parseJpegInfo(file.read(min(length, SOF_SEARCH_SIZE)))
+            # Todos os bytes dos frames menos os prefixos de tamanho
+            mediaBytes = index.offsets[frameCount] - FRAME_HEADER_SIZE * frameCount
+    finally:
+        index.close()
+    return MediaInfo(path, stat.st_mtime_ns, stat.st_size, frameCount, width, height, jpegType, mediaBytes)
+
+class MediaCatalog:
+    """Metadata and SDP of the videos in the media directory, kept in memory.
+
+    A background thread scans the directory at startup and every
+    SCAN_INTERVAL, describing only the files that are new or whose mtime or
+    size changed, and dropping the entries of files that were removed or
+    changed elsewhere. lookup() answers from memory; a video the scan has
+    not reached yet is described on first use. Names are resolved against
+    the media directory: whatever falls outside it, or is not a regular
+    .mjpeg file, is not found.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.directory = None
+        self.lock = threading.Lock()
+        self.scans = 0
+
+    def start(self, directory='.'):
+        """Start the background scan of directory (once per process)."""
+        if self.directory is not None:
+            return self
+        self.directory = directory
+        threading.Thread(target=self.run, name="MediaCatalog", daemon=True).start()
+        return self
+
+    def run(self):
+        while True:
+            try:
+                self.scan()
+            except OSError as e:
+                print("Erro ao varrer o diretório de mídia:", e)
+            time.sleep(SCAN_INTERVAL)
+
+    def scan(self):
+        """Refresh the entries of the media directory, describing only the files that changed."""
+        seen = set()
+        for entry in os.scandir(self.directory):
+            if not entry.name.lower().endswith(MEDIA_EXT) or not entry.is_file():
+                continue
+            path = os.path.realpath(entry.path)
+            seen.add(path)
+            stat = entry.stat()
+            info = self.entries.get(path)
+            if info is not None and info.mtime == stat.st_mtime_ns and info.size == stat.st_size:
+                continue
+            try:
+                self.update(describeFile(path))
+            except OSError:
+                continue
+
+        # Vídeos de subdiretórios, descritos sob demanda: descartados se mudaram ou sumiram (serão descritos de novo)
+        for path, info in list(self.entries.items()):
+            if path in seen:
+                continue
+            try:
+                stat = os.stat(path)
+                if info.mtime == stat.st_mtime_ns and info.size == stat.st_size:
+                    continue
+            except OSError:
+                pass
+            with self.lock:
+                if self.entries.get(path) is info:
+                    del self.entries[path]
+        self.scans += 1
+
+    def update(self, info):
+        with self.lock:
+            self.entries[info.path] = info
+
+    def resolve(self, filename):
+        """Return the real path of filename in the media directory, or None if it falls outside it."""
+        root = os.path.realpath(self.directory or '.')
+        path = os.path.realpath(os.path.join(root, filename))
+        if os.path.commonpath((root, path)) != root or not path.lower().endswith(MEDIA_EXT):
+            return None
+        return path
+
+    def lookup(self, filename):
+        """Return the MediaInfo of filename, or None if it is not a video of the media directory."""
+        path = self.resolve(filename)
+        if path is None:
+            return None
+        info = self.entries.get(path)
+        if info is None:
+            # Só arquivos regulares: abrir um FIFO bloquearia o worker
+            if not os.path.isfile(path):
+                return None
+            try:
+                info = describeFile(path)
+            except OSError:
+                return None
+            self.update(info)
+        return info
+
+# Catálogo único do processo
+mediaCatalog = MediaCatalog()
+
+metrics.gauge('media_catalog_files', "Vídeos descritos no catálogo de mídia", function=lambda: len(mediaCatalog.entries))
@@ -0,0 +1,289 @@
+"""Process-wide counters, gauges and histograms in the Prometheus text format.
+
+Usage: python Metrics.py host:rtsp_port [name ...]
+       (prints the server metrics fetched with RTSP GET_PARAMETER)
+
+The server exposes them on an optional local HTTP /metrics endpoint
+(Server.py --metrics-port) and in the body of GET_PARAMETER replies.
+"""
+import bisect, socket, sys, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from RtspMessage import RtspMessage, RtspParser
+
+# Limites dos buckets (segundos): chamadas de envio e leituras de frame ficam na faixa de microssegundos
+FAST_BUCKETS = (5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 1e-2, 5e-2)
+REQUEST_BUCKETS = (1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.5, 1.0)
+
+class CounterValue:
+    """One labelled series of a counter or gauge."""
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def snapshot(self):
+        return self.value
+
+    def merge(self, value):
+        self.inc(value)
+
+    def samples(self, name, labels):
+        return [(name, labels, self.value)]
+
+class HistogramValue:
+    """One labelled series of a histogram: per-bucket counts, sum and count."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def observeMany(self, values):
+        """Record a batch of observations under a single lock acquisition."""
+        indexes = [bisect.bisect_left(self.buckets, value) for value in values]
+        with self.lock:
+            for i in indexes:
+                self.counts[i] += 1
+            self.sum += sum(values)
+            self.count += len(values)
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+    def merge(self, value):
+        counts, total, count = value
+        with self.lock:
+            for i, bucketCount in enumerate(counts):
+                self.counts[i] += bucketCount
+            self.sum += total
+            self.count += count
+
+    def samples(self, name, labels):
+        with self.lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        samples = []
+        cumulative = 0
+        for bound, bucketCount in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucketCount
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            samples.append((name + '_bucket', labels + (('le', le),), cumulative))
+        samples.append((name + '_sum', labels, total))
+        samples.append((name + '_count', labels, count))
+        return samples
+
+class Metric:
+    """A metric family: one series per combination of label values.
+
+    Hot paths keep the series returned by labels() and update it directly.
+    A metric created with function= has no series: its value is read when
+    the metrics are rendered.
+    """
+
+    def __init__(self, name, help, type, labelNames=(), buckets=None, function=None):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.labelNames = tuple(labelNames)
+        self.buckets = buckets
+        self.function = function
+        self.series = {}
+        self.lock = threading.Lock()
+        if not self.labelNames and function is None:
+            # Série única criada já: aparece com valor zero antes do primeiro incremento
+            self.labels()
+
+    def labels(self, *values):
+        """Return the series of the given label values, creating it on first use."""
+        series = self.series.get(values)
+        if series is None:
+            with self.lock:
+                series = self.series.get(values)
+                if series is None:
+                    series = HistogramValue(self.buckets) if self.type == 'histogram' else CounterValue()
+                    self.series[values] = series
+        return series
+
+    # Métricas sem labels: atalhos para a série única
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def observeMany(self, values):
+        self.labels().observeMany(values)
+
+    def snapshot(self):
+        """Return the current values as plain data: {label values: value}."""
+        if self.function is not None:
+            return {(): self.function()}
+        return {values: series.snapshot() for values, series in list(self.series.items())}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        if self.function is not None:
+            lines.append(f"{self.name} {formatValue(self.function())}")
+            return lines
+        for values, series in sorted(self.series.items()):
+            labels = tuple(zip(self.labelNames, values))
+            for name, sampleLabels, value in series.samples(self.name, labels):
+                lines.append(f"{name}{formatLabels(sampleLabels)} {formatValue(value)}")
+        return lines
+
+def formatLabels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+def formatValue(value):
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+class MetricsRegistry:
+    """Every metric of the process, by name."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, name, help, type, labelNames=(), buckets=None, function=None):
+        # Registrar de novo devolve a métrica existente (módulos podem ser importados mais de uma vez)
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = Metric(name, help, type, labelNames, buckets, function)
+                self.metrics[name] = metric
+            return metric
+
+    def counter(self, name, help, labelNames=(), function=None):
+        return self.register(name, help, 'counter', labelNames, function=function)
+
+    def gauge(self, name, help, labelNames=(), function=None):
+        return self.register(name, help, 'gauge', labelNames, function=function)
+
+    def histogram(self, name, help, labelNames=(), buckets=REQUEST_BUCKETS):
+        return self.register(name, help, 'histogram', labelNames, tuple(buckets))
+
+    def snapshot(self):
+        """Return every metric as picklable data, e.g. to send it to another process."""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return {metric.name: (metric.help, metric.type, metric.labelNames, metric.buckets, metric.snapshot())
+                for metric in metrics}
+
+    def merge(self, snapshot, gauges=True):
+        """Add the values of a snapshot to this registry (gauges=False skips the gauges)."""
+        for name, (help, type, labelNames, buckets, series) in snapshot.items():
+            if type == 'gauge' and not gauges:
+                continue
+            metric = self.register(name, help, type, labelNames, buckets)
+            for values, value in series.items():
+                metric.labels(*values).merge(value)
+
+    def render(self, names=None):
+        """Return the metrics (or only the named ones) in the Prometheus text format."""
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            if names is None or metric.name in names:
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+def mergeSnapshots(snapshots):
+    """Return a new registry with the sum of several snapshots (one per process)."""
+    registry = MetricsRegistry()
+    for snapshot in snapshots:
+        registry.merge(snapshot)
+    return registry
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Sem uma linha de log a cada coleta
+        pass
+
+class MetricsServer:
+    """HTTP server answering GET /metrics on a background thread.
+
+    registry is anything with a render() method; by default the process registry.
+    """
+
+    def __init__(self, port, registry=None, host='127.0.0.1'):
+        self.httpServer = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.httpServer.daemon_threads = True
+        self.httpServer.registry = registry or metrics
+
+    def start(self):
+        threading.Thread(target=self.httpServer.serve_forever, name="MetricsServer", daemon=True).start()
+        return self
+
+    def close(self):
+        self.httpServer.shutdown()
+        self.httpServer.server_close()
+
+def fetchRtspMetrics(host, port, names=()):
+    """Fetch the server metrics with an RTSP GET_PARAMETER request. Return the reply body."""
+    body = "".join(name + "\n" for name in names)
+    request = RtspMessage.request('GET_PARAMETER', '*', 1, {'Content-Type': 'text/parameters'}, body)
+    parser = RtspParser()
+    with socket.create_connection((host, port)) as sock:
+        sock.sendall(request.serialize())
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                return ""
+            replies = parser.feed(chunk)
+            if replies:
+                return replies[0].bodyText()
+
+# Registro único do processo
+metrics = MetricsRegistry()
+
+if __name__ == "__main__":
+    try:
+        host, port = sys.argv[1].rsplit(':', 1)
+    except (IndexError, ValueError):
+        print("[Usage: Metrics.py host:rtsp_port [name ...]]")
+        sys.exit()
+    print(fetchRtspMetrics(host, int(port), sys.argv[2:]), end="")
@@ -0,0 +1,266 @@
+"""Microbenchmark and regression suite of the server and client hot paths.
+
+Usage: python MicroBenchmark.py [--seconds 0.3] [--repeat 3] [--baseline microbench.json]
+                                [--save] [--threshold 0.25] [--only name]
+                                [--sessions 10000]
+
+Synthetic .Mjpeg files of several resolutions and frame sizes are generated
+in a temporary directory. For each hot function (RTP encode/decode, frame
+reads, from the file and from the frame cache, packetization of a frame,
+RTSP request parsing and the client's reply handling) the suite measures
+calls per second (best of --repeat runs) and, with tracemalloc, the peak
+and retained memory allocated per call. --save
+stores the results as the baseline; otherwise they are compared with it and
+the exit status is 1 when a function got slower, or allocates more, by more
+than --threshold.
+
+It also opens --sessions idle READY sessions (a real SETUP on each, over a
+connection that discards the replies) and prints the bytes they take each;
+test_SessionMemory.py checks them against SESSION_MEMORY_BUDGET.
+"""
+import argparse, contextlib, gc, json, os, platform, sys, tempfile, time, tracemalloc
+
+from ClientEngine import ClientEngine
+from FrameCache import frameCache
+from MediaCatalog import mediaCatalog, MJPEG_PT
+from RtpBenchmark import measure
+from RtpPacket import RtpPacket, RtpHeaderTemplate
+from RtspMessage import RtspMessage, RtspParser
+from ServerWorker import ServerWorker
+from Session import Session
+from SyntheticVideo import writeSyntheticMjpeg
+from VideoStream import VideoStream
+
+# Resoluções e tamanhos médios de frame dos vídeos sintéticos
+VIDEOS = ((320, 240, 8000), (640, 480, 30000), (1280, 720, 80000))
+VIDEO_FRAMES = 64
+
+# Chamadas rastreadas pelo tracemalloc em cada função
+ALLOC_CALLS = 200
+
+# Diferença de alocação (bytes por chamada) ignorada na comparação: ruído do próprio interpretador
+ALLOC_SLACK = 256
+
+SETUP_REQUEST = (b"SETUP movie.Mjpeg RTSP/1.0\r\nCSeq: 2\r\n"
+                 b"Transport: RTP/AVP;unicast;client_port=25000-25001\r\n\r\n")
+PLAY_REPLY = b"RTSP/1.0 200 OK\r\nCSeq: 3\r\nSession: 123456;timeout=60\r\nRange: npt=0.000-\r\n\r\n"
+
+# Memória máxima (bytes) de uma sessão ociosa em READY: objeto da sessão, worker, parser e stream
+SESSION_MEMORY_BUDGET = 2048
+IDLE_SESSIONS = 10000
+
+def allocations(function, calls=ALLOC_CALLS):
+    """Return the (peak, retained) bytes allocated per call of function, traced with tracemalloc."""
+    # Primeira chamada fora da medição: caches e imports preguiçosos
+    function()
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        peaks = 0
+        for _ in range(calls):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            function()
+            _, peak = tracemalloc.get_traced_memory()
+            peaks += peak - before
+        end, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peaks / calls, (end - start) / calls
+
+class OfflineEngine(ClientEngine):
+    """Client engine that never connects: only its reply handling is measured."""
+    verbose = False
+
+    def connectToServer(self):
+        pass
+
+class DiscardConnection:
+    """Control connection of the idle sessions: the replies are dropped."""
+
+    def sendall(self, data):
+        pass
+
+    def shutdown(self, how):
+        pass
+
+def idleSessionBytes(filename, count):
+    """Return the bytes allocated per session by count idle sessions after SETUP (UDP transport)."""
+    request = RtspMessage.request('SETUP', filename, 1, {'Transport': 'RTP/AVP;unicast;client_port=25000-25001'})
+    workers = []
+
+    def openSession():
+        worker = ServerWorker({'rtspSocket': (DiscardConnection(), ('127.0.0.1', 25000))})
+        worker.processRtspRequest(request)
+        workers.append(worker)
+
+    # Os prints dos requests não interessam aqui
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            # Aquecimento: arquivo compartilhado, canal RTCP e sockets do egress já abertos
+            for _ in range(100):
+                openSession()
+            gc.collect()
+            tracemalloc.start()
+            try:
+                before, _ = tracemalloc.get_traced_memory()
+                for _ in range(count):
+                    openSession()
+                gc.collect()
+                after, _ = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            if any(worker.state != ServerWorker.READY for worker in workers):
+                raise RuntimeError("SETUP das sessões ociosas falhou")
+        finally:
+            for worker in workers:
+                worker.closeSession()
+    return (after - before) / count
+
+def rtpCases():
+    payload = bytes(1380)
+    rtpPacket = RtpPacket()
+
+    def encode():
+        rtpPacket.encode(2, 0, 0, 0, 1, 0, MJPEG_PT, 0x1234, payload, 1)
+        return rtpPacket.getPacket()
+
+    packet = encode()
+    decoder = RtpPacket()
+    yield "RtpPacket.encode", encode
+    yield "RtpPacket.decode", lambda: decoder.decode(packet)
+
+def videoCases(directory, streams):
+    worker = ServerWorker({})
+    worker.session = Session(1, worker)
+    worker.session.rtpHeader = RtpHeaderTemplate(MJPEG_PT, worker.session.ssrc)
+    for width, height, frameSize in VIDEOS:
+        path = os.path.join(directory, f"bench_{width}x{height}.Mjpeg")
+        writeSyntheticMjpeg(path, VIDEO_FRAMES, width, height, frameSize)
+        stream = VideoStream(path)
+        streams.append(stream)
+
+        def nextFrame(stream=stream):
+            data = stream.nextFrame()
+            if not data:
+                stream.seek(0)
+                data = stream.nextFrame()
+            return data
+
+        def readFrame(nextFrame=nextFrame):
+            # Sem o cache de frames, que atenderia todas as chamadas depois da primeira: mede o índice e o mmap,
+            # e o frame não fica retido no cache entre as chamadas medidas pelo tracemalloc
+            frameCache.clear()
+            data = nextFrame()
+            frameCache.clear()
+            return data
+
+        frame = nextFrame()
+        yield f"VideoStream.nextFrame[{width}x{height}]", readFrame
+        yield f"VideoStream.nextFrame[{width}x{height},cache]", nextFrame
+        # O gerador é consumido como no envio: um cabeçalho RTP por fragmento
+        yield f"ServerWorker.makeRtp[{width}x{height}]", lambda frame=frame: list(worker.makeRtp(frame, 1))
+
+def rtspCases():
+    parser = RtspParser()
+    yield "RtspParser.feed[SETUP]", lambda: parser.feed(SETUP_REQUEST)
+
+    engine = OfflineEngine('127.0.0.1', 0, 0, 'movie.Mjpeg')
+    engine.sessionId = 123456
+    replyParser = RtspParser()
+
+    def parseReply():
+        engine.pending[3] = engine.PLAY
+        for reply in replyParser.feed(PLAY_REPLY):
+            engine.parseRtspReply(reply)
+
+    yield "ClientEngine.parseRtspReply[PLAY]", parseReply
+
+def runCases(cases, seconds, repeat):
+    """Measure every (name, function). Return {name: result}."""
+    results = {}
+    for name, function in cases:
+        opsPerSecond = max(measure(function, seconds) for _ in range(repeat))
+        peak, retained = allocations(function)
+        results[name] = {'opsPerSecond': opsPerSecond, 'peakBytes': peak, 'retainedBytes': retained}
+        print(f"  {name:<40} {opsPerSecond:>12,.0f} ops/s {peak:>10,.0f} B pico {retained:>8,.0f} B retidos")
+    return results
+
+def compare(results, baseline, threshold):
+    """Print the change against the baseline. Return the names of the functions that regressed."""
+    regressions = []
+    print(f"\ncomparação com a linha de base (limite {threshold:.0%}):")
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            print(f"  {name:<40} sem linha de base")
+            continue
+        speed = result['opsPerSecond'] / old['opsPerSecond'] - 1
+        problems = []
+        if speed < -threshold:
+            problems.append("mais lento")
+        for key in ('peakBytes', 'retainedBytes'):
+            if result[key] > old[key] * (1 + threshold) + ALLOC_SLACK:
+                problems.append("aloca mais" if key == 'peakBytes' else "retém mais")
+        status = "REGRESSÃO (" + ", ".join(problems) + ")" if problems else "ok"
+        print(f"  {name:<40} {speed:>+8.1%} ops/s {result['peakBytes'] - old['peakBytes']:>+10,.0f} B pico  {status}")
+        if problems:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=0.3, help="duração de cada medição de ops/s")
+    parser.add_argument('--repeat', type=int, default=3, help="medições por função (vale a melhor)")
+    parser.add_argument('--baseline', default='microbench.json', help="arquivo JSON da linha de base")
+    parser.add_argument('--save', action='store_true', help="grava os resultados como nova linha de base")
+    parser.add_argument('--threshold', type=float, default=0.25, help="piora tolerada (fração)")
+    parser.add_argument('--only', help="mede só as funções cujo nome contém este texto")
+    parser.add_argument('--sessions', type=int, default=IDLE_SESSIONS,
+                        help="sessões ociosas abertas na medição de memória (0 desliga)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Catálogo no diretório dos vídeos sintéticos: o SETUP só encontra vídeos de dentro dele
+        mediaCatalog.start(directory)
+        streams = []
+        cases = [*rtpCases(), *videoCases(directory, streams), *rtspCases()]
+        if args.only:
+            cases = [(name, function) for name, function in cases if args.only in name]
+        print(f"{len(cases)} funções, Python {platform.python_version()}")
+        try:
+            results = runCases(cases, args.seconds, args.repeat)
+            if args.sessions > 0:
+                sessionBytes = idleSessionBytes(streams[0].filename, args.sessions)
+                print(f"  {args.sessions} sessões ociosas em READY: {sessionBytes:,.0f} B por sessão "
+                      f"(limite {SESSION_MEMORY_BUDGET:,} B)")
+        finally:
+            # Os vídeos sintéticos são apagados com o diretório temporário
+            for stream in streams:
+                stream.close()
+    if args.save:
+        output = {
+            'results': results,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+        }
+        with open(args.baseline, 'w') as file:
+            json.dump(output, file, indent=2)
+        print(f"linha de base salva em {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"sem linha de base em {args.baseline}: rode com --save para criá-la")
+        return
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    if baseline.get('python') != platform.python_version():
+        print(f"aviso: linha de base medida com Python {baseline.get('python')}")
+    regressions = compare(results, baseline['results'], args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} função(ões) pioraram além do limite: " + ", ".join(regressions))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Many RTSP streams tiled in one window, for video walls and monitoring.
+
+Usage: python MosaicClient.py Server_name Server_port First_RTP_port video.Mjpeg [...]
+                              [--columns N] [--tile 192x144] [--jitter-ms 100] [--transport udp|tcp|fec|nack]
+
+Every video gets a tile with its own RTSP session on RTP port
+First_RTP_port + 2 * i (RTCP on the next one). The RTP of all of them is
+received by the single RtpReceiver loop of the process, each tile decodes
+on one FrameDecoder worker at the tile size, and one Tk timer shows the
+newest frame of every tile. The sessions start playing as soon as they are
+set up; a click on a tile pauses or resumes it.
+"""
+import argparse, math, threading
+from tkinter import *
+
+from ClientEngine import ClientEngine
+from FrameDecoder import FrameDecoder
+
+# Intervalo (ms) do timer que mostra os frames de todos os tiles
+POLL_INTERVAL = 20
+
+class Tile(ClientEngine):
+    """One stream of the mosaic: a ClientEngine shown in a label of the grid."""
+    # Dezenas de sessões: só os erros vão para o console
+    verbose = False
+
+    def __init__(self, master, row, column, tileSize, serveraddr, serverport, rtpport, filename, jitterDelay=0.1,
+                 transport='udp', fec=False, nack=False):
+        # Imagem vazia do tamanho do tile: a grade não muda de tamanho quando os frames chegam
+        self.blank = PhotoImage(width=tileSize[0], height=tileSize[1])
+        self.label = Label(master, image=self.blank, text=filename, compound=TOP, bg='black', fg='white', bd=0)
+        self.label.grid(row=row, column=column, padx=1, pady=1)
+        self.label.bind('<Button-1>', self.toggle)
+        # Sem start(): o timer do mosaico chama showNewest() de todos os tiles
+        self.decoder = FrameDecoder(master, self.updateMovie, displaySize=tileSize, workers=1)
+        ClientEngine.__init__(self, serveraddr, serverport, rtpport, filename, jitterDelay, transport, fec, nack)
+
+    def onFrame(self, frameNbr, frame, timestamp):
+        self.decoder.submit(frameNbr, frame)
+
+    def updateMovie(self, photo):
+        """Show a decoded frame in the tile (runs on the Tk main loop)."""
+        self.label.configure(image=photo)
+        self.label.image = photo
+
+    def toggle(self, event=None):
+        """Click handler: pause a playing tile, resume a paused one."""
+        if self.state == self.PLAYING:
+            self.pauseMovie()
+            self.label.configure(text=self.fileName + " (pausa)")
+        elif self.state == self.READY:
+            self.playMovie()
+            self.label.configure(text=self.fileName)
+
+class Mosaic:
+    """Tk window with a grid of tiles and buttons acting on all of them."""
+
+    def __init__(self, master, serveraddr, serverport, firstRtpPort, filenames, columns=None, tileSize=(192, 144),
+                 jitterDelay=0.1, transport='udp', fec=False, nack=False):
+        self.master = master
+        self.master.protocol("WM_DELETE_WINDOW", self.exitClient)
+        columns = columns or math.ceil(math.sqrt(len(filenames)))
+        self.tiles = []
+        for i, filename in enumerate(filenames):
+            row, column = divmod(i, columns)
+            self.tiles.append(Tile(self.master, row, column, tileSize, serveraddr, serverport, firstRtpPort + 2 * i,
+                                   filename, jitterDelay, transport, fec, nack))
+        self.createWidgets(math.ceil(len(filenames) / columns), columns)
+        # SETUP de todos antes dos PLAYs, fora da thread do Tk (cada resposta é esperada)
+        threading.Thread(target=self.startAll, daemon=True).start()
+        self.pollId = self.master.after(POLL_INTERVAL, self.poll)
+
+    def createWidgets(self, row, columns):
+        """Build the button bar below the grid."""
+        buttons = Frame(self.master)
+        buttons.grid(row=row, column=0, columnspan=columns, pady=2)
+        for column, (text, command) in enumerate((("Play", self.playAll), ("Pause", self.pauseAll),
+                                                  ("Teardown", self.exitClient))):
+            Button(buttons, text=text, command=command, width=12, padx=3, pady=3).grid(row=0, column=column, padx=2)
+
+    def startAll(self):
+        for tile in self.tiles:
+            tile.setupMovie()
+        for tile in self.tiles:
+            if tile.waitReply(5):
+                tile.playMovie()
+
+    def playAll(self):
+        for tile in self.tiles:
+            tile.playMovie()
+            tile.label.configure(text=tile.fileName)
+
+    def pauseAll(self):
+        for tile in self.tiles:
+            tile.pauseMovie()
+
+    def poll(self):
+        """Show the newest decoded frame of every tile (runs on the Tk main loop)."""
+        for tile in self.tiles:
+            tile.decoder.showNewest()
+        self.pollId = self.master.after(POLL_INTERVAL, self.poll)
+
+    def exitClient(self):
+        """Teardown button and window close: leave every session and close the window."""
+        self.master.after_cancel(self.pollId)
+        for tile in self.tiles:
+            tile.teardownMovie()
+            tile.decoder.stop()
+        try:
+            self.master.destroy()
+        except:
+            pass
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('server')
+    parser.add_argument('port', type=int)
+    parser.add_argument('rtpPort', type=int, help="porta RTP do primeiro tile; cada tile usa duas")
+    parser.add_argument('files', nargs='+', metavar='video.Mjpeg')
+    parser.add_argument('--columns', type=int, help="tiles por linha (padrão: grade quadrada)")
+    parser.add_argument('--tile', default="192x144", help="tamanho de cada tile, LARGURAxALTURA")
+    parser.add_argument('--jitter-ms', type=int, default=100, help="atraso do jitter buffer")
+    parser.add_argument('--transport', default='udp', choices=['udp', 'tcp', 'fec', 'nack'])
+    args = parser.parse_args()
+    try:
+        tileSize = tuple(int(side) for side in args.tile.lower().split('x'))
+        if len(tileSize) != 2:
+            raise ValueError
+    except ValueError:
+        parser.error("--tile deve ser LARGURAxALTURA, por exemplo 192x144")
+
+    root = Tk()
+    root.title("RTPClient - mosaico")
+    fec = args.transport == 'fec'
+    nack = args.transport == 'nack'
+    transport = 'tcp' if args.transport == 'tcp' else 'udp'
+    Mosaic(root, args.server, args.port, args.rtpPort, args.files, args.columns, tileSize, args.jitter_ms / 1000,
+           transport, fec, nack)
+    root.mainloop()
+
+if __name__ == "__main__":
+    main()
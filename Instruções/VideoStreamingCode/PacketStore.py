@@ -0,0 +1,196 @@
+"""Pre-packetized RTP payloads of .Mjpeg files, memory-mapped from a sidecar.
+
+Usage: python PacketStore.py [--benchmark] video.Mjpeg [...]
+       (builds the <video>.pkt store of each file; --benchmark compares the
+       per-frame cost of reading + packetizing with reading from the store)
+"""
+import argparse, mmap, os, struct, sys, time
+from array import array
+
+from FrameIndex import FrameIndex
+from JpegPayload import JpegPacketizer, MAX_PACKET_SIZE
+
+PACKETS_EXT = ".pkt"
+PACKETS_MAGIC = b"MJPK"
+PACKETS_VERSION = 2
+
+# magic, versão, mtime (ns) e tamanho do .Mjpeg, tamanho máximo do pacote, número de frames e de pacotes
+PACKETS_HEADER = struct.Struct("<4sIqQIQQ")
+
+class PacketStore:
+    """Ready-to-send RFC 2435 payloads (payload header + fragment) of every frame of a video.
+
+    The sidecar <filename>.pkt holds the payloads back to back, followed by
+    two tables: the first packet of each frame and the offset of each
+    packet. Serving a frame is then a table lookup and slices of the mmap:
+    the sender only adds the session's RTP header (sequence number,
+    timestamp, marker and SSRC), whatever the size of the frame. Like the
+    frame index, the store records the mtime and size of the video and the
+    packet size it was built with, and is stale when they no longer match.
+    """
+
+    def __init__(self, filename, maxPacketSize=MAX_PACKET_SIZE):
+        self.filename = filename
+        self.storeFile = filename + PACKETS_EXT
+        self.maxPacketSize = maxPacketSize
+        stat = os.stat(filename)
+        self.mtime = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.mm = None
+        self.view = None
+        # firstPacket[n] é o primeiro pacote do frame n; firstPacket[-1] é o total de pacotes
+        self.firstPacket = None
+        # packetOffsets[p] é a posição do payload p; packetOffsets[-1] é o fim do último
+        self.packetOffsets = None
+
+    @classmethod
+    def open(cls, filename, build=False, maxPacketSize=MAX_PACKET_SIZE):
+        """Return the store of filename, building it if build is set. None if there is no valid store."""
+        store = cls(filename, maxPacketSize)
+        if store.load():
+            return store
+        if build:
+            try:
+                store.build()
+            except OSError:
+                # Diretório sem permissão de escrita: o vídeo é servido sem o store
+                return None
+            if store.load():
+                return store
+        return None
+
+    def build(self):
+        """Packetize every frame of the video and write the sidecar."""
+        packetizer = JpegPacketizer(self.maxPacketSize)
+        index = FrameIndex(self.filename)
+        firstPacket = array('Q', [0])
+        packetOffsets = array('Q', [0])
+        # Temporário por processo: workers do prefork podem criar o mesmo store ao mesmo tempo
+        tmpFile = f"{self.storeFile}.{os.getpid()}.tmp"
+        try:
+            with open(self.filename, 'rb') as video, open(tmpFile, 'wb') as file:
+                file.write(bytes(PACKETS_HEADER.size))
+                position = 0
+                for frameNumber in range(index.frameCount()):
+                    start, length = index.frameSpan(frameNumber)
+                    video.seek(start)
+                    for jpegHeader, fragment, last in packetizer.packetize(video.read(length)):
+                        file.write(jpegHeader)
+                        file.write(fragment)
+                        position += len(jpegHeader) + len(fragment)
+                        packetOffsets.append(position)
+                    firstPacket.append(len(packetOffsets) - 1)
+                # Tabelas alinhadas em 8 bytes, depois dos payloads
+                file.write(bytes(-(PACKETS_HEADER.size + position) % 8))
+                file.write(firstPacket.tobytes())
+                file.write(packetOffsets.tobytes())
+                file.seek(0)
+                file.write(PACKETS_HEADER.pack(PACKETS_MAGIC, PACKETS_VERSION, self.mtime, self.size,
+                                               self.maxPacketSize, len(firstPacket) - 1, len(packetOffsets) - 1))
+            os.replace(tmpFile, self.storeFile)
+        finally:
+            index.close()
+            if os.path.exists(tmpFile):
+                os.remove(tmpFile)
+
+    def load(self):
+        """Memory-map the sidecar. Return False if it is missing or stale."""
+        try:
+            with open(self.storeFile, 'rb') as file:
+                mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+
+        valid = False
+        if len(mm) >= PACKETS_HEADER.size:
+            magic, version, mtime, size, maxPacketSize, frames, packets = PACKETS_HEADER.unpack_from(mm)
+            if (magic == PACKETS_MAGIC and version == PACKETS_VERSION and mtime == self.mtime
+                    and size == self.size and maxPacketSize == self.maxPacketSize):
+                tables = len(mm) - 8 * (frames + 1) - 8 * (packets + 1)
+                valid = tables >= PACKETS_HEADER.size and tables % 8 == 0
+        if not valid:
+            mm.close()
+            return False
+
+        self.close()
+        self.mm = mm
+        self.view = memoryview(mm)
+        self.firstPacket = self.view[tables:tables + 8 * (frames + 1)].cast('Q')
+        self.packetOffsets = self.view[tables + 8 * (frames + 1):].cast('Q')
+        return True
+
+    def frameCount(self):
+        """Return the number of frames in the store."""
+        return len(self.firstPacket) - 1
+
+    def framePayloads(self, frameNumber):
+        """Return the payloads of a 0-based frame number, as views of the mmap."""
+        first = self.firstPacket[frameNumber]
+        last = self.firstPacket[frameNumber + 1]
+        offsets = self.packetOffsets
+        base = PACKETS_HEADER.size
+        view = self.view
+        return [view[base + offsets[p]:base + offsets[p + 1]] for p in range(first, last)]
+
+    def close(self):
+        """Release the memory-mapped sidecar."""
+        if self.mm is None:
+            return
+        self.firstPacket.release()
+        self.packetOffsets.release()
+        self.view.release()
+        try:
+            self.mm.close()
+        except BufferError:
+            # Payloads ainda em envio: o mmap é desfeito quando a última view for liberada
+            pass
+        self.mm = None
+        self.view = None
+        self.firstPacket = None
+        self.packetOffsets = None
+
+def benchmark(filename, store, seconds=1.0):
+    """Print the per-frame cost of packetizing from the .Mjpeg and of reading the store."""
+    packetizer = JpegPacketizer(store.maxPacketSize)
+    index = FrameIndex(filename)
+    with open(filename, 'rb') as file:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    frames = index.frameCount()
+
+    def packetized(frameNumber):
+        start, length = index.frameSpan(frameNumber)
+        return packetizer.packetize(data[start:start + length])
+
+    for name, function in (("leitura + packetize", packetized), ("packet store", store.framePayloads)):
+        calls = 0
+        started = time.perf_counter()
+        while time.perf_counter() - started < seconds:
+            for frameNumber in range(min(frames, 1000)):
+                function(frameNumber)
+            calls += min(frames, 1000)
+        elapsed = time.perf_counter() - started
+        print(f"  {name:<22} {elapsed / calls * 1e6:>8.2f} us/frame")
+    index.close()
+    data.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='+', metavar='video.Mjpeg')
+    parser.add_argument('--benchmark', action='store_true', help="mede o custo por frame com e sem o store")
+    args = parser.parse_args()
+
+    for filename in args.files:
+        started = time.perf_counter()
+        store = PacketStore.open(filename, build=True)
+        if store is None:
+            print(f"{filename}: não foi possível criar {filename + PACKETS_EXT}")
+            sys.exit(1)
+        packets = len(store.packetOffsets) - 1
+        print(f"{store.storeFile}: {store.frameCount()} frames, {packets} pacotes, "
+              f"{len(store.mm):,} bytes ({time.perf_counter() - started:.2f} s)")
+        if args.benchmark and store.frameCount():
+            benchmark(filename, store)
+        store.close()
+
+if __name__ == "__main__":
+    main()
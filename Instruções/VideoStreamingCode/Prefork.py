@@ -0,0 +1,183 @@
+import multiprocessing, os, signal, socket, sys, threading, time
+from multiprocessing.connection import wait
+
+from Metrics import metrics, mergeSnapshots, MetricsRegistry, MetricsServer
+from MediaCatalog import mediaCatalog
+from LiveChannel import liveChannels
+
+# SO_REUSEPORT: cada worker abre o seu socket na mesma porta e o kernel distribui as conexões
+HAS_REUSEPORT = hasattr(socket, 'SO_REUSEPORT')
+
+# Intervalo com que cada worker envia suas métricas ao supervisor
+STATS_INTERVAL = 1.0
+
+# Os workers recebem pelo fork a configuração do servidor (classes e singletons ajustados pelo Server.py) e os canais
+# ao vivo; com spawn ou forkserver (padrão no Windows, no macOS e no Linux a partir do Python 3.14) eles rodariam
+# com os valores padrão. Sem fork (Windows) o modo prefork não está disponível
+HAS_FORK = 'fork' in multiprocessing.get_all_start_methods()
+
+# Espera antes de recriar um worker que morreu (evita um laço de falhas consumindo a CPU)
+RESTART_DELAY = 1.0
+
+def listeningSocket(port, reusePort):
+    """Open the RTSP listening socket, with SO_REUSEPORT if asked."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reusePort:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(('', port))
+    sock.listen(128)
+    return sock
+
+def reportStats(conn, supervisorPid):
+    """Worker thread: send a metrics snapshot to the supervisor every STATS_INTERVAL."""
+    while True:
+        time.sleep(STATS_INTERVAL)
+        try:
+            conn.send(metrics.snapshot())
+        except (OSError, EOFError):
+            os._exit(0)
+        # Supervisor terminou (o worker foi adotado por outro processo): não fica órfão
+        if os.getppid() != supervisorPid:
+            os._exit(0)
+
+def runWorker(port, workerMode, egressSockets, sock, conn, supervisorPid):
+    """Entry point of a worker process: serve RTSP sessions on the shared port."""
+    if sock is None:
+        sock = listeningSocket(port, True)
+    threading.Thread(target=reportStats, args=(conn, supervisorPid), name="PreforkStats", daemon=True).start()
+    # Threads não sobrevivem ao fork: cada worker mantém o seu catálogo de mídia e os produtores dos canais
+    mediaCatalog.start()
+    liveChannels.start()
+
+    if workerMode == 'async':
+        from AsyncServer import AsyncServer
+        AsyncServer(port, egressSockets, sock).main()
+    else:
+        from Server import Server
+        from Egress import egress
+        # Sockets de egress próprios: os herdados do supervisor pelo fork seriam compartilhados
+        egress.reopen(egressSockets)
+        Server().acceptLoop(sock)
+
+class WorkerProcess:
+    """Supervisor-side state of one worker slot."""
+
+    def __init__(self, slot):
+        self.slot = slot
+        self.process = None
+        self.conn = None
+        self.snapshot = {}
+        self.restartAt = 0.0
+
+class PreforkServer:
+    """Supervisor of N worker processes serving the same RTSP port.
+
+    Each worker runs a threaded or asyncio server with its own egress and
+    RTCP sockets (so the ports in the Transport reply are the worker's) and
+    sends its metrics to the supervisor. Workers that exit are recreated;
+    the counters and histograms they had reported are kept, so the merged
+    metrics on the supervisor's /metrics do not go backwards.
+    """
+
+    def __init__(self, port, workers, workerMode='async', egressSockets=1, metricsPort=None, reusePort=True):
+        self.port = port
+        self.workerMode = workerMode
+        self.egressSockets = egressSockets
+        self.metricsPort = metricsPort
+        self.reusePort = reusePort and HAS_REUSEPORT
+        self.sock = None
+        self.workers = [WorkerProcess(slot) for slot in range(max(1, workers))]
+        # Contadores de workers que já terminaram
+        self.retired = {}
+        # Métricas do próprio supervisor, fora do registro que os workers herdam no fork
+        self.metrics = MetricsRegistry()
+        self.workersAlive = self.metrics.gauge('prefork_workers', "Processos worker vivos")
+        self.workerRestarts = self.metrics.counter('prefork_worker_restarts_total', "Workers recriados após terminarem")
+
+    def startWorker(self, worker):
+        context = multiprocessing.get_context('fork')
+        parentConn, childConn = context.Pipe(duplex=False)
+        worker.conn = parentConn
+        worker.snapshot = {}
+        worker.process = context.Process(
+            target=runWorker, name=f"RtspWorker-{worker.slot}",
+            args=(self.port, self.workerMode, self.egressSockets, self.sock, childConn, os.getpid()))
+        worker.process.daemon = True
+        worker.process.start()
+        childConn.close()
+        self.workersAlive.inc()
+        print(f"Worker {worker.slot} iniciado (pid {worker.process.pid})")
+
+    def retireWorker(self, worker):
+        """Account for a worker that exited and schedule its replacement."""
+        print(f"Worker {worker.slot} (pid {worker.process.pid}) terminou com código {worker.process.exitcode}")
+        # Drena o último snapshot enviado antes de morrer
+        try:
+            while worker.conn.poll():
+                worker.snapshot = worker.conn.recv()
+        except (OSError, EOFError):
+            pass
+        worker.conn.close()
+        retired = mergeSnapshots([self.retired])
+        retired.merge(worker.snapshot, gauges=False)
+        self.retired = retired.snapshot()
+        worker.process = None
+        worker.snapshot = {}
+        worker.restartAt = time.monotonic() + RESTART_DELAY
+        self.workersAlive.dec()
+
+    def render(self, names=None):
+        """Metrics of every worker summed, plus the supervisor's own."""
+        snapshots = [self.retired, self.metrics.snapshot()] + [worker.snapshot for worker in self.workers]
+        return mergeSnapshots(snapshots).render(names)
+
+    def main(self):
+        if not self.reusePort:
+            # Sem SO_REUSEPORT: um único socket de escuta herdado por todos os workers
+            self.sock = listeningSocket(self.port, False)
+        if self.metricsPort:
+            MetricsServer(self.metricsPort, self).start()
+            print("Métricas em http://127.0.0.1:%d/metrics" % self.metricsPort)
+
+        # SIGTERM encerra o supervisor pelo mesmo caminho do Ctrl-C, terminando os workers
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        for worker in self.workers:
+            self.startWorker(worker)
+        print(f"Servidor prefork escutando na porta {self.port} com {len(self.workers)} workers "
+              f"({'SO_REUSEPORT' if self.reusePort else 'socket herdado'})")
+        try:
+            self.supervise()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for worker in self.workers:
+                if worker.process is not None:
+                    worker.process.terminate()
+
+    def supervise(self):
+        while True:
+            running = [worker for worker in self.workers if worker.process is not None]
+            waitables = [worker.conn for worker in running] + [worker.process.sentinel for worker in running]
+            if waitables:
+                ready = wait(waitables, timeout=STATS_INTERVAL)
+            else:
+                # Todos os workers aguardam recriação
+                time.sleep(RESTART_DELAY)
+                ready = []
+
+            for worker in running:
+                if worker.conn in ready:
+                    try:
+                        worker.snapshot = worker.conn.recv()
+                    except (OSError, EOFError):
+                        pass
+                if worker.process.sentinel in ready:
+                    worker.process.join()
+                    self.retireWorker(worker)
+
+            now = time.monotonic()
+            for worker in self.workers:
+                if worker.process is None and now >= worker.restartAt:
+                    self.workerRestarts.inc()
+                    self.startWorker(worker)
@@ -0,0 +1,333 @@
+"""Lower-quality renditions of .Mjpeg files and the per-session choice between them.
+
+Usage: python Renditions.py [--workers N] video.Mjpeg [...]
+       (builds the rendition sidecars of each file with Pillow)
+"""
+import argparse, collections, io, os, queue, sys, threading, time
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:
+    # Sem Pillow as renditions não são criadas, mas as que já existem em disco são servidas
+    Image = None
+
+from FrameIndex import FrameIndex, FRAME_HEADER_SIZE
+from Metrics import metrics
+from VideoStream import VideoStream, MediaFile, FRAME_RATE
+
+RENDITION_EXT = ".rnd"
+
+# Degraus abaixo do original, do melhor para o pior: (escala da resolução, qualidade JPEG)
+RENDITIONS = ((1.0, 50), (0.75, 40), (0.5, 30))
+
+# Frames por tarefa enviada ao pool de processos
+CHUNK_FRAMES = 32
+
+# O .Mjpeg guarda o tamanho do frame em 5 dígitos
+MAX_FRAME_SIZE = 99999
+
+# Perda (fração do último RR) acima da qual a sessão desce um degrau, e abaixo da qual conta como limpa
+LOSS_DOWN = 0.05
+LOSS_UP = 0.01
+
+# RRs limpos seguidos antes de tentar o degrau de cima; dobra quando a tentativa falha, até MAX_HOLD_REPORTS
+HOLD_REPORTS = 4
+MAX_HOLD_REPORTS = 32
+
+# Peso do último RR na média móvel da vazão
+THROUGHPUT_SMOOTHING = 0.5
+
+renditionsBuilt = metrics.counter('renditions_built_total', "Renditions criadas pelo servidor")
+levelSwitches = metrics.counter('abr_switches_total', "Trocas de rendition das sessões", ['direction'])
+
+def renditionPath(filename, scale, quality):
+    """Return the sidecar of the rendition (scale, quality) of filename: <filename>.s<scale%>q<quality>.rnd."""
+    return f"{filename}.s{round(scale * 100)}q{quality}{RENDITION_EXT}"
+
+def isCurrent(path, source):
+    """Check whether the rendition at path was written after the source video last changed."""
+    try:
+        return os.stat(path).st_mtime_ns >= os.stat(source).st_mtime_ns
+    except OSError:
+        return False
+
+def encodeFrames(frames, scale, quality):
+    """Re-encode JPEG frames at scale and quality (runs in the pool's processes).
+
+    A frame that cannot be decoded, or that would not fit the .Mjpeg length
+    prefix, keeps its original bytes: every rendition has the same frames
+    as the source, in the same positions.
+    """
+    encoded = []
+    for data in frames:
+        try:
+            image = Image.open(io.BytesIO(data))
+            # Dimensões múltiplas de 16: blocos inteiros no 4:2:0 e no cabeçalho RFC 2435 (em unidades de 8)
+            size = tuple(max(16, int(side * scale) // 16 * 16) for side in image.size)
+            # Draft: o decodificador já reduz a escala na DCT
+            image.draft('RGB', size)
+            image = image.convert('RGB')
+            if image.size != size:
+                image = image.resize(size, Image.BILINEAR)
+            output = io.BytesIO()
+            # Baseline 4:2:0 (tipo 1 da RFC 2435), sem modo progressivo
+            image.save(output, 'JPEG', quality=quality, subsampling=2)
+            frame = output.getvalue()
+        except Exception:
+            frame = data
+        encoded.append(frame if len(frame) <= MAX_FRAME_SIZE else data)
+    return encoded
+
+def buildRendition(executor, filename, scale, quality, workers):
+    """Write the rendition (scale, quality) of filename, keeping at most 2 * workers chunks in flight."""
+    target = renditionPath(filename, scale, quality)
+    # Temporário por processo: workers do prefork podem criar a mesma rendition ao mesmo tempo
+    tmpFile = f"{target}.{os.getpid()}.tmp"
+    index = FrameIndex(filename)
+    try:
+        with open(filename, 'rb') as video, open(tmpFile, 'wb') as file:
+            pending = collections.deque()
+            frameCount = index.frameCount()
+            for first in range(0, frameCount, CHUNK_FRAMES):
+                frames = []
+                for frameNumber in range(first, min(first + CHUNK_FRAMES, frameCount)):
+                    start, length = index.frameSpan(frameNumber)
+                    video.seek(start)
+                    frames.append(video.read(length))
+                pending.append(executor.submit(encodeFrames, frames, scale, quality))
+                if len(pending) >= 2 * workers:
+                    writeFrames(file, pending.popleft().result())
+            while pending:
+                writeFrames(file, pending.popleft().result())
+        os.replace(tmpFile, target)
+    except BaseException:
+        try:
+            os.remove(tmpFile)
+        except OSError:
+            pass
+        raise
+    finally:
+        index.close()
+    renditionsBuilt.inc()
+    return target
+
+def writeFrames(file, frames):
+    for frame in frames:
+        file.write(b"%05d" % len(frame))
+        file.write(frame)
+
+class AdaptiveStream(VideoStream):
+    """A video and its renditions, read at the same frame position; setLevel picks the one served.
+
+    Level 0 is the original file and each level above it a lower-quality
+    rendition. All of them share the frame numbering, so switching only
+    changes which shared MediaFile (frame cache, packet store) the next
+    frame comes from.
+    """
+    __slots__ = ('levels', 'level')
+
+    def __init__(self, filename, renditionFiles):
+        super().__init__(filename)
+        self.levels = [self.media]
+        for renditionFile in renditionFiles:
+            try:
+                media = MediaFile.acquire(renditionFile)
+            except OSError:
+                continue
+            # Rendition de outra versão do vídeo: fica de fora
+            if media.index.frameCount() != self.index.frameCount():
+                media.release()
+                continue
+            self.levels.append(media)
+        self.level = 0
+
+    def setLevel(self, level):
+        """Serve the next frames from level (0 is the original)."""
+        if level != self.level:
+            self.level = level
+            self.media = self.levels[level]
+
+    def bitrates(self):
+        """Return the average bitrate (bits/s) of each level."""
+        frameCount = self.index.frameCount()
+        duration = frameCount / FRAME_RATE
+        return [(media.index.offsets[frameCount] - FRAME_HEADER_SIZE * frameCount) * 8 / duration if frameCount else 0
+                for media in self.levels]
+
+    def close(self):
+        if self.levels:
+            for media in self.levels:
+                media.release()
+            self.levels = []
+            self.media = None
+
+class RateController:
+    """Chooses the rendition of a session from the client's RTCP receiver reports.
+
+    A report with more than LOSS_DOWN loss moves the session down: at least
+    one level, and further while the level's bitrate exceeds the throughput
+    the client is measured to receive. After hold clean reports (at most
+    LOSS_UP loss) it tries the level above; when that try ends in loss, the
+    wait before the next one doubles, up to MAX_HOLD_REPORTS. Frames dropped
+    by the bandwidth limits also move it down.
+    """
+    __slots__ = ('bitrates', 'level', 'cleanReports', 'hold', 'probing', 'throughput', 'lastReport', 'lastOctets')
+
+    def __init__(self, bitrates):
+        self.bitrates = bitrates
+        self.level = 0
+        self.cleanReports = 0
+        self.hold = HOLD_REPORTS
+        self.probing = False
+        # Vazão recebida pelo cliente (bits/s): octetos enviados entre dois RRs menos a fração perdida
+        self.throughput = None
+        self.lastReport = None
+        self.lastOctets = 0
+
+    def onReport(self, fractionLost, octetsSent, now):
+        """Update the level with a receiver report (called from the RTCP thread)."""
+        if self.lastReport is not None and now > self.lastReport:
+            throughput = (octetsSent - self.lastOctets) * 8 * (1 - fractionLost) / (now - self.lastReport)
+            if self.throughput is None:
+                self.throughput = throughput
+            else:
+                self.throughput += (throughput - self.throughput) * THROUGHPUT_SMOOTHING
+        self.lastReport = now
+        self.lastOctets = octetsSent
+
+        if fractionLost > LOSS_DOWN:
+            level = self.level + 1
+            while (level < len(self.bitrates) - 1 and self.throughput is not None
+                   and self.bitrates[level] > self.throughput):
+                level += 1
+            self.stepDown(level)
+        elif fractionLost <= LOSS_UP:
+            self.cleanReports += 1
+            if self.cleanReports >= self.hold:
+                self.cleanReports = 0
+                if self.probing:
+                    # A última subida se manteve
+                    self.probing = False
+                    self.hold = HOLD_REPORTS
+                elif self.level > 0:
+                    self.probing = True
+                    self.switch(self.level - 1)
+
+    def onThrottled(self):
+        """A frame was dropped by the bandwidth limits: the current level does not fit."""
+        self.stepDown(self.level + 1)
+
+    def stepDown(self, level):
+        self.cleanReports = 0
+        if self.probing:
+            # O degrau de cima não coube: espera mais antes de tentar de novo
+            self.hold = min(self.hold * 2, MAX_HOLD_REPORTS)
+            self.probing = False
+        self.switch(level)
+
+    def switch(self, level):
+        level = max(0, min(level, len(self.bitrates) - 1))
+        if level != self.level:
+            levelSwitches.labels('down' if level > self.level else 'up').inc()
+            self.level = level
+
+class RenditionCache:
+    """Opens videos with their renditions and creates the missing ones in the background.
+
+    When enabled (Server.py --renditions), a video opened without current
+    renditions is queued for a builder thread that re-encodes it with Pillow
+    on a process pool and writes one sidecar per RENDITIONS entry; sessions
+    opened after that get an AdaptiveStream. Renditions already on disk are
+    served even when building is off or Pillow is missing.
+    """
+
+    def __init__(self):
+        self.build = False
+        self.workers = os.cpu_count() or 1
+        self.queue = queue.Queue()
+        self.queued = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def configure(self, build=False, workers=None):
+        if build and Image is None:
+            print("Pillow não instalado: as renditions não serão criadas")
+            build = False
+        self.build = build
+        if workers:
+            self.workers = workers
+
+    def open(self, filename):
+        """Return a stream of filename: an AdaptiveStream if it has current renditions, else a VideoStream."""
+        path = os.path.realpath(filename)
+        renditionFiles = [renditionPath(path, scale, quality) for scale, quality in RENDITIONS]
+        current = [renditionFile for renditionFile in renditionFiles if isCurrent(renditionFile, path)]
+        if len(current) < len(renditionFiles):
+            self.schedule(path)
+        if not current:
+            return VideoStream(filename)
+        return AdaptiveStream(filename, current)
+
+    def schedule(self, path):
+        """Queue path for the builder thread (once per process)."""
+        if not self.build:
+            return
+        with self.lock:
+            if path in self.queued:
+                return
+            self.queued.add(path)
+            if self.thread is None:
+                # Threads não sobrevivem ao fork: cada worker do prefork cria a sua na primeira abertura
+                self.thread = threading.Thread(target=self.run, name="RenditionBuilder", daemon=True)
+                self.thread.start()
+        self.queue.put(path)
+
+    def run(self):
+        executor = ProcessPoolExecutor(max_workers=self.workers)
+        while True:
+            path = self.queue.get()
+            try:
+                for scale, quality in RENDITIONS:
+                    if isCurrent(renditionPath(path, scale, quality), path):
+                        continue
+                    started = time.perf_counter()
+                    try:
+                        target = buildRendition(executor, path, scale, quality, self.workers)
+                    except BrokenExecutor as e:
+                        # Um processo do pool morreu: o pool não aceita mais tarefas e é recriado
+                        print("Pool de codificação quebrado ao criar rendition de", path + ":", e)
+                        executor.shutdown(wait=False)
+                        executor = ProcessPoolExecutor(max_workers=self.workers)
+                        continue
+                    except Exception as e:
+                        # Só esta rendition falha; a thread segue com as próximas e os próximos vídeos
+                        print("Erro ao criar rendition de", path + ":", repr(e))
+                        continue
+                    print(f"Rendition criada: {target} ({time.perf_counter() - started:.1f} s)")
+            finally:
+                # Sai da fila mesmo com erro: a próxima abertura do vídeo tenta de novo o que faltou
+                with self.lock:
+                    self.queued.discard(path)
+
+# Cache único do processo
+renditionCache = RenditionCache()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='+', metavar='video.Mjpeg')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="processos de codificação")
+    args = parser.parse_args()
+    if Image is None:
+        print("Pillow não instalado: pip install Pillow")
+        sys.exit(1)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for filename in args.files:
+            for scale, quality in RENDITIONS:
+                started = time.perf_counter()
+                target = buildRendition(executor, filename, scale, quality, args.workers)
+                print(f"{target}: {os.path.getsize(target):,} bytes ({time.perf_counter() - started:.1f} s)")
+
+if __name__ == "__main__":
+    main()
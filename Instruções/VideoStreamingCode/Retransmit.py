@@ -0,0 +1,69 @@
+from Metrics import metrics
+from SessionManager import TokenBucket
+
+# Pacotes guardados por sessão: alguns frames grandes, bem mais que o atraso do jitter buffer do cliente
+RETRANSMIT_CAPACITY = 512
+
+# Idade máxima (s) de um pacote retransmitido: depois disso o jitter buffer do cliente já desistiu dele
+RETRANSMIT_MAX_AGE = 0.5
+
+# Banda das retransmissões: fração da taxa média do vídeo, com um mínimo (bytes/s) para vídeos sem taxa conhecida
+RETRANSMIT_SHARE = 0.1
+MIN_RETRANSMIT_RATE = 32 * 1024
+
+packetsRetransmitted = metrics.counter('rtp_retransmitted_packets_total', "Pacotes RTP reenviados após NACK")
+retransmitsRefused = metrics.counter('rtp_retransmit_refused_total', "Pacotes pedidos em NACK e não reenviados",
+                                     ['reason'])
+
+class RetransmitRing:
+    """The last RTP packets of a session, resent when the client asks for them in a generic NACK (RFC 4585).
+
+    A slot holds the buffer list that went to the egress (header copy and
+    views of the frame or of the packet store), so keeping a packet costs
+    no copy. A packet is resent at most once, only while it is younger than
+    RETRANSMIT_MAX_AGE, and within a token bucket of RETRANSMIT_SHARE of
+    the video's bitrate: a client on a bad link cannot make the server
+    send its stream twice.
+    """
+    # Oferecido pelo servidor (Server.py --nack); o cliente pede com x-nack no SETUP
+    enabled = False
+
+    __slots__ = ('capacity', 'seqs', 'packets', 'sentAt', 'bucket')
+
+    def __init__(self, rate, capacity=RETRANSMIT_CAPACITY):
+        self.capacity = capacity
+        self.seqs = [-1] * capacity
+        self.packets = [None] * capacity
+        self.sentAt = [0.0] * capacity
+        self.bucket = TokenBucket(max(rate * RETRANSMIT_SHARE, MIN_RETRANSMIT_RATE))
+
+    def add(self, buffers, now):
+        """Keep a packet just queued for sending (buffers[0] is its RTP header)."""
+        header = buffers[0]
+        seq = (header[2] << 8) | header[3]
+        slot = seq % self.capacity
+        self.seqs[slot] = seq
+        self.packets[slot] = buffers
+        self.sentAt[slot] = now
+
+    def take(self, seq, now):
+        """Return the buffers of packet seq to resend, or None if it is gone, too old or over the budget."""
+        slot = seq % self.capacity
+        if self.seqs[slot] != seq or now - self.sentAt[slot] > RETRANSMIT_MAX_AGE:
+            retransmitsRefused.labels('expired').inc()
+            return None
+        buffers = self.packets[slot]
+        if not self.bucket.consume(sum(len(b) for b in buffers), now):
+            retransmitsRefused.labels('budget').inc()
+            return None
+        # Uma retransmissão por pacote: NACKs repetidos do mesmo buraco não multiplicam o tráfego
+        self.seqs[slot] = -1
+        self.packets[slot] = None
+        packetsRetransmitted.inc()
+        return buffers
+
+    def clear(self):
+        """Drop every packet (the views must go before the video file is closed)."""
+        for slot in range(self.capacity):
+            self.seqs[slot] = -1
+            self.packets[slot] = None
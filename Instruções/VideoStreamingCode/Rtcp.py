@@ -0,0 +1,273 @@
+import socket, struct, threading, time
+
+from JitterBuffer import SequenceExtender, RTP_SEQ_MOD
+
+# Tipos de pacote RTCP (RFC 3550)
+RTCP_SR = 200
+RTCP_RR = 201
+RTCP_BYE = 203
+# Feedback de transporte (RFC 4585); o formato 1 é o NACK genérico
+RTCP_RTPFB = 205
+NACK_FMT = 1
+
+# Intervalo entre relatórios. Bem abaixo dos 5 s da RFC 3550: é unicast e o tráfego RTCP é mínimo
+RTCP_INTERVAL = 1.0
+
+# Diferença entre as épocas NTP (1900) e Unix (1970)
+NTP_EPOCH_OFFSET = 2208988800
+
+RTCP_HEADER = struct.Struct("!BBH")
+SENDER_INFO = struct.Struct("!IIIII")
+REPORT_BLOCK = struct.Struct("!IIIIII")
+# PID (primeiro pacote perdido) e BLP (bitmask dos 16 seguintes)
+NACK_FCI = struct.Struct("!HH")
+
+# Buraco maior que isso na sequência não é perda a reparar (nova posição do vídeo, rajada longa demais)
+MAX_NACK_GAP = 64
+
+def ntpTimestamp(now=None):
+    """Return the 64-bit NTP timestamp of a Unix time as (seconds, fraction)."""
+    ntp = (time.time() if now is None else now) + NTP_EPOCH_OFFSET
+    seconds = int(ntp)
+    return seconds & 0xFFFFFFFF, int((ntp - seconds) * (1 << 32)) & 0xFFFFFFFF
+
+def ntpMiddle(seconds, fraction):
+    """Return the middle 32 bits of an NTP timestamp (the LSR format), in 1/65536 s."""
+    return ((seconds & 0xFFFF) << 16) | (fraction >> 16)
+
+def rtcpHeader(count, packetType, body):
+    # Comprimento em palavras de 32 bits menos um, contando o cabeçalho
+    return RTCP_HEADER.pack(0x80 | count, packetType, (len(body) + 4) // 4 - 1) + body
+
+def reportBlock(block):
+    """Pack a report block dict (ssrc, fractionLost, cumulativeLost, highestSeq, jitter, lsr, dlsr)."""
+    lost = block['cumulativeLost'] & 0xFFFFFF
+    return REPORT_BLOCK.pack(block['ssrc'], (block['fractionLost'] << 24) | lost, block['highestSeq'],
+                             block['jitter'], block['lsr'], block['dlsr'])
+
+def buildSenderReport(ssrc, rtpTimestamp, packetCount, octetCount, blocks=()):
+    """Build an SR packet with the current wallclock time."""
+    seconds, fraction = ntpTimestamp()
+    body = struct.pack("!I", ssrc) + SENDER_INFO.pack(seconds, fraction, rtpTimestamp & 0xFFFFFFFF,
+                                                      packetCount & 0xFFFFFFFF, octetCount & 0xFFFFFFFF)
+    body += b''.join(reportBlock(block) for block in blocks)
+    return rtcpHeader(len(blocks), RTCP_SR, body)
+
+def buildReceiverReport(ssrc, blocks):
+    """Build an RR packet."""
+    body = struct.pack("!I", ssrc) + b''.join(reportBlock(block) for block in blocks)
+    return rtcpHeader(len(blocks), RTCP_RR, body)
+
+def buildBye(ssrc):
+    """Build a BYE packet for one SSRC."""
+    return rtcpHeader(1, RTCP_BYE, struct.pack("!I", ssrc))
+
+def buildNack(ssrc, mediaSsrc, lost):
+    """Build a generic NACK (RFC 4585, section 6.2.1) for the 16-bit sequence numbers in lost, in order."""
+    fci = []
+    pid = blp = None
+    for seq in lost:
+        distance = (seq - pid) & 0xFFFF if pid is not None else 0
+        if pid is not None and 0 < distance <= 16:
+            blp |= 1 << (distance - 1)
+            continue
+        if pid is not None:
+            fci.append(NACK_FCI.pack(pid, blp))
+        pid, blp = seq & 0xFFFF, 0
+    if pid is not None:
+        fci.append(NACK_FCI.pack(pid, blp))
+    return rtcpHeader(NACK_FMT, RTCP_RTPFB, struct.pack("!II", ssrc, mediaSsrc) + b''.join(fci))
+
+def parseRtcp(data):
+    """Parse a (compound) RTCP packet. Return a list of dicts, one per RTCP packet."""
+    packets = []
+    pos = 0
+    while pos + RTCP_HEADER.size <= len(data):
+        first, packetType, length = RTCP_HEADER.unpack_from(data, pos)
+        end = pos + (length + 1) * 4
+        if first >> 6 != 2 or end > len(data):
+            break
+        count = first & 0x1F
+        body = pos + RTCP_HEADER.size
+        packet = {'type': packetType, 'count': count}
+        if packetType in (RTCP_SR, RTCP_RR):
+            packet['ssrc'] = struct.unpack_from("!I", data, body)[0]
+            body += 4
+            if packetType == RTCP_SR:
+                seconds, fraction, rtpTs, packetCount, octetCount = SENDER_INFO.unpack_from(data, body)
+                packet.update(ntpSeconds=seconds, ntpFraction=fraction, rtpTimestamp=rtpTs,
+                              packetCount=packetCount, octetCount=octetCount)
+                body += SENDER_INFO.size
+            blocks = []
+            for _ in range(count):
+                if body + REPORT_BLOCK.size > end:
+                    break
+                ssrc, lostWord, highestSeq, jitter, lsr, dlsr = REPORT_BLOCK.unpack_from(data, body)
+                cumulativeLost = lostWord & 0xFFFFFF
+                # Campo de 24 bits com sinal
+                if cumulativeLost & 0x800000:
+                    cumulativeLost -= 1 << 24
+                blocks.append({'ssrc': ssrc, 'fractionLost': lostWord >> 24, 'cumulativeLost': cumulativeLost,
+                               'highestSeq': highestSeq, 'jitter': jitter, 'lsr': lsr, 'dlsr': dlsr})
+                body += REPORT_BLOCK.size
+            packet['blocks'] = blocks
+        elif packetType == RTCP_BYE:
+            packet['sources'] = [struct.unpack_from("!I", data, body + 4 * i)[0]
+                                 for i in range(count) if body + 4 * i + 4 <= end]
+        elif packetType == RTCP_RTPFB and body + 8 <= end:
+            # No feedback o campo count é o formato (FMT)
+            packet['ssrc'], packet['mediaSsrc'] = struct.unpack_from("!II", data, body)
+            if count == NACK_FMT:
+                lost = []
+                for offset in range(body + 8, end - NACK_FCI.size + 1, NACK_FCI.size):
+                    pid, blp = NACK_FCI.unpack_from(data, offset)
+                    lost.append(pid)
+                    lost.extend((pid + bit + 1) & 0xFFFF for bit in range(16) if blp & (1 << bit))
+                packet['lost'] = lost
+        packets.append(packet)
+        pos = end
+    return packets
+
+class ReceiverStats:
+    """RFC 3550 reception statistics of one RTP source (A.3 loss and A.8 interarrival jitter)."""
+
+    def __init__(self, clockRate=90000):
+        self.clockRate = clockRate
+        self.extender = SequenceExtender(RTP_SEQ_MOD)
+        self.ssrc = None
+        self.baseSeq = None
+        self.maxSeq = None
+        self.received = 0
+        self.expectedPrior = 0
+        self.receivedPrior = 0
+        self.transit = None
+        self.jitter = 0.0
+        # Último SR recebido: (LSR, instante local em que chegou)
+        self.lastSr = None
+
+    def update(self, rtpPacket, arrival):
+        """Account for one received RTP packet; arrival is a wallclock time in seconds."""
+        seq = self.extender.extend(rtpPacket.seqNum())
+        if self.baseSeq is None:
+            self.ssrc = rtpPacket.ssrc()
+            self.baseSeq = self.maxSeq = seq
+        self.maxSeq = max(self.maxSeq, seq)
+        self.received += 1
+
+        # Jitter entre chegadas, em unidades do relógio RTP
+        transit = int(arrival * self.clockRate) - rtpPacket.timestamp()
+        if self.transit is not None:
+            d = abs(((transit - self.transit) + (1 << 31)) % (1 << 32) - (1 << 31))
+            self.jitter += (d - self.jitter) / 16
+        self.transit = transit
+
+    def onSenderReport(self, packet, arrival):
+        """Remember the last SR so the next report carries LSR/DLSR."""
+        self.lastSr = (ntpMiddle(packet['ntpSeconds'], packet['ntpFraction']), arrival)
+
+    def reportBlock(self, now):
+        """Return the report block for an RR sent at wallclock time now, or None before any packet."""
+        if self.baseSeq is None:
+            return None
+        expected = self.maxSeq - self.baseSeq + 1
+        lost = expected - self.received
+        expectedInterval = expected - self.expectedPrior
+        receivedInterval = self.received - self.receivedPrior
+        self.expectedPrior = expected
+        self.receivedPrior = self.received
+        lostInterval = expectedInterval - receivedInterval
+        fraction = 0 if expectedInterval <= 0 or lostInterval <= 0 else (lostInterval << 8) // expectedInterval
+
+        lsr = dlsr = 0
+        if self.lastSr is not None:
+            lsr = self.lastSr[0]
+            dlsr = int((now - self.lastSr[1]) * 65536)
+        return {
+            'ssrc': self.ssrc,
+            'fractionLost': min(fraction, 255),
+            'cumulativeLost': max(min(lost, 0x7FFFFF), -0x800000),
+            'highestSeq': self.maxSeq & 0xFFFFFFFF,
+            'jitter': int(self.jitter),
+            'lsr': lsr,
+            'dlsr': dlsr & 0xFFFFFFFF,
+        }
+
+class NackTracker:
+    """Finds the gaps in the sequence numbers a client receives, to be asked for again in a NACK."""
+
+    def __init__(self):
+        self.extender = SequenceExtender(RTP_SEQ_MOD)
+        self.highest = None
+        self.requested = 0
+
+    def update(self, seq):
+        """Account for a received RTP sequence number. Return the 16-bit numbers skipped since the highest one."""
+        seq = self.extender.extend(seq)
+        if self.highest is None or seq <= self.highest:
+            # Primeiro pacote, ou reordenado/retransmitido: nenhum buraco novo
+            if self.highest is None:
+                self.highest = seq
+            return []
+        gap = seq - self.highest - 1
+        first = self.highest + 1
+        self.highest = seq
+        if gap == 0 or gap > MAX_NACK_GAP:
+            return []
+        self.requested += gap
+        return [s & 0xFFFF for s in range(first, seq)]
+
+class RtcpChannel:
+    """Server RTCP socket: sends SRs and dispatches incoming RR/BYE/NACK to sessions by media SSRC."""
+
+    def __init__(self):
+        self.sock = None
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def port(self):
+        """Return the local RTCP port, opening the socket on first use."""
+        with self.lock:
+            if self.sock is None:
+                self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.sock.bind(('', 0))
+                threading.Thread(target=self.run, name="RtcpChannel", daemon=True).start()
+            return self.sock.getsockname()[1]
+
+    def register(self, ssrc, worker):
+        self.sessions[ssrc] = worker
+
+    def unregister(self, ssrc):
+        self.sessions.pop(ssrc, None)
+
+    def send(self, packet, address):
+        try:
+            self.sock.sendto(packet, address)
+        except OSError:
+            pass
+
+    def run(self):
+        while True:
+            try:
+                data, address = self.sock.recvfrom(2048)
+            except OSError:
+                return
+            arrival = time.time()
+            for packet in parseRtcp(data):
+                if packet['type'] in (RTCP_SR, RTCP_RR):
+                    for block in packet['blocks']:
+                        worker = self.sessions.get(block['ssrc'])
+                        if worker is not None:
+                            worker.onReceiverReport(block, packet['ssrc'], arrival)
+                elif packet['type'] == RTCP_RTPFB and 'lost' in packet:
+                    worker = self.sessions.get(packet['mediaSsrc'])
+                    if worker is not None:
+                        worker.onNack(packet['lost'])
+                elif packet['type'] == RTCP_BYE:
+                    # O BYE traz o SSRC do receptor; encontra a sessão que fala com ele
+                    for worker in list(self.sessions.values()):
+                        session = worker.session
+                        if session is not None and session.receiverSsrc in packet['sources']:
+                            worker.onBye()
+
+# Canal RTCP único do processo
+rtcpChannel = RtcpChannel()
@@ -0,0 +1,95 @@
+"""Microbenchmarks of RTP packet construction and parsing.
+
+Usage: python RtpBenchmark.py [--seconds 1.0]
+
+Compares the original path (RtpPacket.encode filling the header byte by byte
+and getPacket concatenating header and payload; decode copying the payload)
+with the fast path (RtpHeaderTemplate patched in place, header and payload
+kept as separate buffers for sendmsg; decode returning a view).
+"""
+import argparse, socket, time
+
+from RtpPacket import RtpPacket, RtpHeaderTemplate, HEADER_SIZE
+from Egress import HAS_SENDMSG
+
+def legacyEncode(seqnum, payload):
+    rtpPacket = RtpPacket()
+    rtpPacket.encode(2, 0, 0, 0, seqnum, 0, 26, 0x1234, payload, seqnum)
+    return rtpPacket.getPacket()
+
+class LegacyRtpPacket(RtpPacket):
+    def decode(self, byteStream):
+        # decode original: header em bytearray e cópia do payload
+        self.header = bytearray(byteStream[:HEADER_SIZE])
+        self.payload = byteStream[HEADER_SIZE:]
+
+def measure(function, seconds):
+    """Call function() repeatedly for about the given time. Return calls per second."""
+    calls = 0
+    batch = 1000
+    start = time.perf_counter()
+    while True:
+        for _ in range(batch):
+            function()
+        calls += batch
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return calls / elapsed
+
+def report(name, opsPerSecond, payloadSize, baseline=None):
+    throughput = opsPerSecond * payloadSize * 8 / 1e9
+    speedup = "" if baseline is None else f"  x{opsPerSecond / baseline:.2f}"
+    print(f"  {name:<34} {opsPerSecond:>12,.0f} ops/s {throughput:>8.2f} Gbit/s{speedup}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=1.0, help="duração de cada medição")
+    args = parser.parse_args()
+
+    template = RtpHeaderTemplate(26, 0x1234)
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(('127.0.0.1', 0))
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    address = sink.getsockname()
+
+    # Fragmento típico (cabe no MTU) e frame inteiro (como era enviado antes da fragmentação)
+    for payloadSize in (1380, 40000):
+        payload = bytes(payloadSize)
+        view = memoryview(payload)
+        print(f"payload de {payloadSize} bytes")
+
+        print(" encode")
+        counter = iter(range(1 << 62))
+        base = measure(lambda: legacyEncode(next(counter) & 0xFFFF, payload), args.seconds)
+        report("RtpPacket.encode + getPacket", base, payloadSize)
+        fast = measure(lambda: (template.patch(next(counter) & 0xFFFF, 0), view), args.seconds)
+        report("RtpHeaderTemplate.patch", fast, payloadSize, base)
+        joined = measure(lambda: template.patch(next(counter) & 0xFFFF, 0) + view, args.seconds)
+        report("RtpHeaderTemplate.patch + concat", joined, payloadSize, base)
+
+        print(" decode")
+        packet = legacyEncode(1, payload)
+        legacyPacket = LegacyRtpPacket()
+        base = measure(lambda: legacyPacket.decode(packet), args.seconds)
+        report("decode com cópia do payload", base, payloadSize)
+        rtpPacket = RtpPacket()
+        fast = measure(lambda: rtpPacket.decode(packet), args.seconds)
+        report("RtpPacket.decode (view)", fast, payloadSize, base)
+
+        # Datagramas UDP são limitados a 64 KB; o frame inteiro cabe
+        print(" envio (loopback)")
+        base = measure(lambda: sender.sendto(legacyEncode(1, payload), address), args.seconds / 2)
+        report("encode + sendto", base, payloadSize)
+        if HAS_SENDMSG:
+            fast = measure(lambda: sender.sendmsg([template.patch(1, 0), view], (), 0, address), args.seconds / 2)
+            report("patch + sendmsg", fast, payloadSize, base)
+        # Esvazia o socket de destino entre as medições
+        sink.setblocking(False)
+        try:
+            while True:
+                sink.recv(65535)
+        except BlockingIOError:
+            pass
+
+if __name__ == "__main__":
+    main()
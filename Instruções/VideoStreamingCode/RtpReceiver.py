@@ -0,0 +1,179 @@
+import heapq, itertools, os, selectors, socket, threading, time
+from collections import deque
+
+# Datagramas lidos de um socket por vez antes de passar aos outros: um stream intenso não atrasa os demais
+RECV_BATCH = 64
+
+class RtpReceiver:
+    """One thread that receives the RTP of every playing ClientEngine of the process.
+
+    The UDP RTP sockets are non-blocking and registered in a selector; the
+    packets interleaved on RTSP connections are handed over by deliver().
+    The select timeout is the earliest instant at which some jitter buffer
+    has a packet to release, kept in a heap of deadlines, so an idle stream
+    costs nothing. add() and remove() are queued for the loop and wake it
+    through a socket pair: PAUSE, TEARDOWN and close() take effect at once,
+    without waiting for a receive timeout.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Processo dono do selector e da thread (criados no primeiro add)
+        self.pid = None
+        self.selector = None
+        # Pedidos das outras threads: ('add' | 'remove', engine) e (engine, pacote RTP intercalado)
+        self.changes = deque()
+        self.delivered = deque()
+        self.counter = itertools.count()
+
+    def start(self):
+        # Um fork (processos do gerador de carga) não leva a thread e compartilharia o epoll e o par de
+        # sockets com o pai: cada processo cria os seus
+        self.changes.clear()
+        self.delivered.clear()
+        # Streams tocando; só a thread do loop usa estes três
+        self.engines = set()
+        self.deadlines = {}
+        self.heap = []
+        self.selector = selectors.DefaultSelector()
+        self.wakeReader, self.wakeWriter = socket.socketpair()
+        self.wakeReader.setblocking(False)
+        self.wakeWriter.setblocking(False)
+        self.selector.register(self.wakeReader, selectors.EVENT_READ, None)
+        self.pid = os.getpid()
+        threading.Thread(target=self.run, name="RtpReceiver", daemon=True).start()
+
+    def add(self, engine):
+        """Start receiving the RTP of engine (after its jitter buffer and reassembler were reset)."""
+        with self.lock:
+            if self.pid != os.getpid():
+                self.start()
+            self.changes.append(('add', engine))
+        self.wake()
+
+    def remove(self, engine):
+        """Stop receiving the RTP of engine; the packets still in its jitter buffer are dropped."""
+        self.changes.append(('remove', engine))
+        self.wake()
+
+    def deliver(self, engine, data):
+        """Hand over an RTP packet interleaved on the RTSP connection of engine (from its RTSP thread)."""
+        self.delivered.append((engine, data))
+        self.wake()
+
+    def wake(self):
+        if self.pid != os.getpid():
+            return
+        try:
+            self.wakeWriter.send(b'\0')
+        except (BlockingIOError, InterruptedError):
+            # Buffer cheio: o loop já tem um despertar pendente
+            pass
+
+    def run(self):
+        while True:
+            timeout = None
+            if self.heap:
+                timeout = max(0.0, self.heap[0][0] - time.monotonic())
+            try:
+                events = self.selector.select(timeout)
+            except OSError:
+                # select() do Windows falha com um socket fechado por close(); o remove pendente o tira
+                events = []
+            for key, _ in events:
+                if key.data is None:
+                    self.drainWakeup()
+                else:
+                    self.receive(key.data, key.fileobj)
+            self.applyChanges()
+            if self.delivered:
+                self.receiveDelivered()
+            self.releaseDue()
+
+    def drainWakeup(self):
+        try:
+            while self.wakeReader.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def applyChanges(self):
+        while self.changes:
+            action, engine = self.changes.popleft()
+            sock = engine.rtpSocket if engine.interleaved is None else None
+            if action == 'add':
+                self.engines.add(engine)
+                if sock is not None:
+                    try:
+                        self.selector.register(sock, selectors.EVENT_READ, engine)
+                    except (KeyError, ValueError, OSError):
+                        # Já registrado (PLAY repetido) ou socket fechado
+                        pass
+            else:
+                self.engines.discard(engine)
+                self.deadlines.pop(engine, None)
+                if sock is not None:
+                    try:
+                        self.selector.unregister(sock)
+                    except (KeyError, ValueError, OSError):
+                        pass
+
+    def receiveDelivered(self):
+        received = set()
+        while self.delivered:
+            engine, data = self.delivered.popleft()
+            if engine in self.engines and self.handle(engine, engine.receivePacket, data):
+                received.add(engine)
+        for engine in received:
+            self.handle(engine, self.release, engine)
+
+    def receive(self, engine, sock):
+        """Read up to RECV_BATCH datagrams from the RTP socket of engine."""
+        for _ in range(RECV_BATCH):
+            try:
+                data = sock.recv(65535)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                # Socket fechado por close() antes de o remove chegar ao loop
+                self.remove(engine)
+                return
+            if not self.handle(engine, engine.receivePacket, data):
+                return
+        self.handle(engine, self.release, engine)
+
+    def handle(self, engine, method, argument):
+        """Run method(argument) for engine; an error stops that stream only. Return False on error."""
+        try:
+            method(argument)
+            return True
+        except Exception as e:
+            engine.log("Erro na recepção RTP:", e)
+            self.remove(engine)
+            return False
+
+    def release(self, engine):
+        """Release the due packets of engine and keep its next deadline in the heap."""
+        now = time.monotonic()
+        wait = engine.releaseFrames(now)
+        if wait is None:
+            self.deadlines.pop(engine, None)
+            return
+        deadline = now + wait
+        # Um prazo mais tarde já na heap acorda o loop à toa uma vez; um mais cedo entra agora
+        if self.deadlines.get(engine, float('inf')) > deadline:
+            self.deadlines[engine] = deadline
+            heapq.heappush(self.heap, (deadline, next(self.counter), engine))
+
+    def releaseDue(self):
+        now = time.monotonic()
+        while self.heap and self.heap[0][0] <= now:
+            deadline, _, engine = heapq.heappop(self.heap)
+            # Entrada substituída por um prazo mais cedo, ou stream removido
+            if self.deadlines.get(engine) != deadline:
+                continue
+            del self.deadlines[engine]
+            self.handle(engine, self.release, engine)
+
+# Loop único do processo, compartilhado por todos os clientes
+rtpReceiver = RtpReceiver()
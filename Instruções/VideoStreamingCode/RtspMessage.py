@@ -0,0 +1,221 @@
+import re, struct
+
+RTSP_VERSION = 'RTSP/1.0'
+
+# Limites contra mensagens malformadas ou abusivas
+MAX_HEADER_SIZE = 8192
+MAX_BODY_SIZE = 1 << 20
+
+# Fim do cabeçalho: linha vazia, com CRLF (RFC 2326) ou só LF
+HEADER_END = re.compile(b'\r?\n\r?\n')
+
+# Grafia dos cabeçalhos que não seguem o padrão Palavra-Palavra
+CANONICAL_NAMES = {'cseq': 'CSeq', 'rtp-info': 'RTP-Info', 'www-authenticate': 'WWW-Authenticate'}
+
+# RTP/RTCP intercalado na conexão RTSP (RFC 2326, seção 10.12): '$', canal, tamanho de 16 bits
+INTERLEAVED_MARK = 0x24
+INTERLEAVED_HEADER = struct.Struct('!BBH')
+
+class RtspError(Exception):
+    """Malformed or oversized RTSP message.
+
+    messages holds what RtspParser.feed() completed before the error in the
+    same call (pipelined messages ahead of the bad one).
+    """
+    messages = ()
+
+def canonicalName(name):
+    return CANONICAL_NAMES.get(name) or '-'.join(part.capitalize() for part in name.split('-'))
+
+class RtspMessage:
+    """One RTSP request (method and uri set) or response (statusCode and reason set).
+
+    Header names are case-insensitive: they are stored lowercased and written
+    back in their canonical form. The body is bytes; Content-Length is added
+    by serialize().
+    """
+
+    def __init__(self, method=None, uri=None, statusCode=None, reason=None, headers=None, body=b''):
+        self.method = method
+        self.uri = uri
+        self.statusCode = statusCode
+        self.reason = reason
+        self.version = RTSP_VERSION
+        self.headers = {}
+        for name, value in (headers or {}).items():
+            self.setHeader(name, value)
+        self.body = body.encode('utf-8') if isinstance(body, str) else bytes(body)
+
+    @classmethod
+    def request(cls, method, uri, cseq, headers=None, body=b''):
+        message = cls(method=method, uri=uri, body=body)
+        message.setHeader('CSeq', cseq)
+        for name, value in (headers or {}).items():
+            message.setHeader(name, value)
+        return message
+
+    @classmethod
+    def response(cls, statusCode, reason, cseq, headers=None, body=b''):
+        message = cls(statusCode=statusCode, reason=reason, body=body)
+        message.setHeader('CSeq', cseq)
+        for name, value in (headers or {}).items():
+            message.setHeader(name, value)
+        return message
+
+    def isRequest(self):
+        return self.method is not None
+
+    def header(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+    def setHeader(self, name, value):
+        self.headers[name.lower()] = str(value)
+
+    @property
+    def cseq(self):
+        return self.header('CSeq')
+
+    def bodyText(self):
+        return self.body.decode('utf-8', errors='replace')
+
+    def startLine(self):
+        if self.isRequest():
+            return f"{self.method} {self.uri} {self.version}"
+        return f"{self.version} {self.statusCode} {self.reason}"
+
+    def head(self):
+        """Start line and headers, without the trailing blank line."""
+        lines = [self.startLine()]
+        for name, value in self.headers.items():
+            if name != 'content-length':
+                lines.append(f"{canonicalName(name)}: {value}")
+        if self.body:
+            lines.append(f"Content-Length: {len(self.body)}")
+        return "\r\n".join(lines)
+
+    def serialize(self):
+        """Return the message as bytes on the wire (CRLF line endings)."""
+        return (self.head() + "\r\n\r\n").encode('utf-8') + self.body
+
+    def __str__(self):
+        return self.head() + ("\n\n" + self.bodyText() if self.body else "")
+
+class InterleavedFrame:
+    """One binary packet (RTP or RTCP) carried on the RTSP connection."""
+
+    def __init__(self, channel, data):
+        self.channel = channel
+        self.data = data
+
+    def serialize(self):
+        return INTERLEAVED_HEADER.pack(INTERLEAVED_MARK, self.channel, len(self.data)) + self.data
+
+def parseHead(head):
+    """Parse the start line and headers of one message."""
+    try:
+        lines = head.decode('utf-8').splitlines()
+    except UnicodeDecodeError:
+        raise RtspError("cabeçalho RTSP não é UTF-8")
+    parts = lines[0].split(' ', 2)
+    if len(parts) != 3:
+        raise RtspError(f"linha inicial inválida: {lines[0]!r}")
+    if parts[0].startswith('RTSP/'):
+        try:
+            message = RtspMessage(statusCode=int(parts[1]), reason=parts[2])
+        except ValueError:
+            raise RtspError(f"código de status inválido: {lines[0]!r}")
+    else:
+        message = RtspMessage(method=parts[0], uri=parts[1])
+    message.version = parts[2] if message.isRequest() else parts[0]
+
+    name = None
+    for line in lines[1:]:
+        if line[:1] in (' ', '\t') and name is not None:
+            # Continuação do cabeçalho anterior
+            message.headers[name] += ' ' + line.strip()
+            continue
+        name, separator, value = line.partition(':')
+        if not separator:
+            raise RtspError(f"cabeçalho inválido: {line!r}")
+        name = name.strip().lower()
+        message.headers[name] = value.strip()
+    return message
+
+class RtspParser:
+    """Incremental RTSP parser: feed() the bytes received, get the complete messages back.
+
+    Messages may arrive split across reads or several in one read
+    (pipelining); the body of each one is framed by its Content-Length.
+    Interleaved '$' packets between messages come back as InterleavedFrame.
+    """
+    __slots__ = ('maxHeaderSize', 'maxBodySize', 'buffer', 'scanFrom', 'pending', 'bodyLength')
+
+    def __init__(self, maxHeaderSize=MAX_HEADER_SIZE, maxBodySize=MAX_BODY_SIZE):
+        self.maxHeaderSize = maxHeaderSize
+        self.maxBodySize = maxBodySize
+        self.buffer = bytearray()
+        # Posição a partir da qual procurar o fim do cabeçalho (não reexamina o que já foi visto)
+        self.scanFrom = 0
+        # Mensagem cujo cabeçalho já chegou e que espera o corpo
+        self.pending = None
+        self.bodyLength = 0
+
+    def feed(self, data):
+        """Add received bytes. Return the list of messages completed by them.
+
+        On a malformed message, raise RtspError with the messages completed
+        before it in its messages attribute.
+        """
+        self.buffer += data
+        messages = []
+        try:
+            self.parseBuffer(messages)
+        except RtspError as e:
+            e.messages = messages
+            raise
+        return messages
+
+    def parseBuffer(self, messages):
+        # Acrescenta a messages as mensagens completas do buffer; o que sobra espera o próximo feed
+        while True:
+            if self.pending is None:
+                # Linhas vazias entre mensagens são toleradas
+                while self.buffer[:1] in (b'\r', b'\n'):
+                    del self.buffer[:1]
+                    self.scanFrom = 0
+                if self.buffer[:1] == b'$':
+                    if len(self.buffer) < INTERLEAVED_HEADER.size:
+                        return
+                    _, channel, length = INTERLEAVED_HEADER.unpack_from(self.buffer)
+                    end = INTERLEAVED_HEADER.size + length
+                    if len(self.buffer) < end:
+                        return
+                    messages.append(InterleavedFrame(channel, bytes(self.buffer[INTERLEAVED_HEADER.size:end])))
+                    del self.buffer[:end]
+                    continue
+                match = HEADER_END.search(self.buffer, max(0, self.scanFrom - 3))
+                if match is None:
+                    if len(self.buffer) > self.maxHeaderSize:
+                        raise RtspError("cabeçalho RTSP grande demais")
+                    self.scanFrom = len(self.buffer)
+                    return
+                # O fim do cabeçalho pode chegar no mesmo recv que um cabeçalho acima do limite
+                if match.start() > self.maxHeaderSize:
+                    raise RtspError("cabeçalho RTSP grande demais")
+                head = bytes(self.buffer[:match.start()])
+                del self.buffer[:match.end()]
+                self.scanFrom = 0
+                self.pending = parseHead(head)
+                try:
+                    self.bodyLength = int(self.pending.header('Content-Length', 0))
+                except ValueError:
+                    raise RtspError("Content-Length inválido")
+                if not 0 <= self.bodyLength <= self.maxBodySize:
+                    raise RtspError("Content-Length fora do limite")
+
+            if len(self.buffer) < self.bodyLength:
+                return
+            self.pending.body = bytes(self.buffer[:self.bodyLength])
+            del self.buffer[:self.bodyLength]
+            messages.append(self.pending)
+            self.pending = None
@@ -0,0 +1,112 @@
+import heapq, itertools, threading, time
+
+# Relógio de mídia do RTP para vídeo (RFC 3551)
+RTP_CLOCK_RATE = 90000
+
+# Atraso a partir do qual uma sessão deixa de tentar recuperar o tempo perdido
+MAX_LATENESS = 0.5
+
+def rtpTimestamp(frameIndex, frameRate, base=0):
+    """Return the 32-bit 90 kHz RTP timestamp of a 0-based frame index."""
+    return (base + frameIndex * RTP_CLOCK_RATE // frameRate) & 0xFFFFFFFF
+
+class MediaClock:
+    """Monotonic due times of the frames of one PLAY, anchored at its first frame."""
+
+    def __init__(self, frameRate, startFrame=0, startTime=None):
+        self.frameRate = frameRate
+        self.startFrame = startFrame
+        self.startTime = time.monotonic() if startTime is None else startTime
+
+    def dueTime(self, frameIndex):
+        """Return when frameIndex must be sent."""
+        return self.startTime + (frameIndex - self.startFrame) / self.frameRate
+
+    def nextDueTime(self, frameIndex, now):
+        """Return the due time of frameIndex, re-anchoring the clock if it fell too far behind."""
+        due = self.dueTime(frameIndex)
+        if now - due > MAX_LATENESS:
+            # Muito atrasado: em vez de enviar uma rajada, recomeça a contagem a partir de agora
+            self.startFrame = frameIndex
+            self.startTime = now
+            due = now
+        return due
+
+class TimerHandle:
+    """A scheduled callback; cancel() prevents it from running."""
+    __slots__ = ('when', 'callback', 'cancelled')
+
+    def __init__(self, when, callback):
+        self.when = when
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class MediaScheduler:
+    """Single thread that runs the frame callbacks of every session from a timer heap."""
+
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.tickListeners = []
+        # Estatísticas do atraso com que os callbacks são executados
+        self.callbacks = 0
+        self.maxLateness = 0.0
+
+    def callAt(self, when, callback):
+        """Run callback at monotonic time when. Return a TimerHandle."""
+        handle = TimerHandle(when, callback)
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="MediaScheduler", daemon=True)
+                self.thread.start()
+            heapq.heappush(self.heap, (when, next(self.counter), handle))
+            # Acorda a thread só se o novo item vence antes do que ela está esperando
+            if self.heap[0][2] is handle:
+                self.condition.notify()
+        return handle
+
+    def addTickListener(self, listener):
+        """Call listener() after every tick, once the callbacks due in it have run."""
+        self.tickListeners.append(listener)
+
+    def run(self):
+        while True:
+            # Um tick: todos os callbacks vencidos desde a última vez que a thread acordou
+            due = []
+            with self.condition:
+                while not due:
+                    if not self.heap:
+                        self.condition.wait()
+                        continue
+                    now = time.monotonic()
+                    while self.heap and self.heap[0][0] <= now:
+                        handle = heapq.heappop(self.heap)[2]
+                        if not handle.cancelled:
+                            due.append(handle)
+                    if not due:
+                        while self.heap and self.heap[0][2].cancelled:
+                            heapq.heappop(self.heap)
+                        if self.heap:
+                            self.condition.wait(self.heap[0][0] - now)
+
+            for handle in due:
+                self.callbacks += 1
+                self.maxLateness = max(self.maxLateness, now - handle.when)
+                try:
+                    handle.callback()
+                except Exception as e:
+                    print("Erro no callback do scheduler:", e)
+
+            for listener in self.tickListeners:
+                try:
+                    listener()
+                except Exception as e:
+                    print("Erro no fim do tick do scheduler:", e)
+
+# Scheduler único do processo, compartilhado por todas as sessões
+mediaScheduler = MediaScheduler()
@@ -1,27 +1,128 @@
-import sys, socket, threading
-from ServerWorker import ServerWorker
-
-class Server:
-    def main(self):
-        try:
-            SERVER_PORT = int(sys.argv[1])
-        except:
-            print("[Usage: Server.py Server_port]")
-            return
-
-        rtspSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        rtspSocket.bind(('', SERVER_PORT))
-        rtspSocket.listen(5)
-
-        print("Servidor escutando na porta:", SERVER_PORT)
-
-        while True:
-            clientInfo = {}
-            clientInfo['rtspSocket'] = rtspSocket.accept()
-            print("Novo cliente conectado:", clientInfo['rtspSocket'][1])
-
-            worker = ServerWorker(clientInfo)
-            threading.Thread(target=worker.run).start()
-
-if __name__ == "__main__":
-    (Server()).main()
+import sys, os, math, socket, threading, argparse
+from ServerWorker import ServerWorker
+from Egress import egress
+from Metrics import MetricsServer
+from VideoStream import MediaFile
+from MediaCatalog import mediaCatalog
+from LiveChannel import liveChannels
+from Fec import FecEncoder, MAX_GROUP
+from Retransmit import RetransmitRing
+from Renditions import renditionCache
+from SessionManager import sessionManager, DEFAULT_SESSION_TIMEOUT
+
+class Server:
+    def main(self):
+        parser = argparse.ArgumentParser(description="Servidor RTSP/RTP de vídeo MJPEG")
+        parser.add_argument('port', type=int, metavar='Server_port')
+        parser.add_argument('--mode', choices=['threaded', 'async', 'prefork'], default='threaded',
+                            help="threaded: uma thread por cliente; async: um único event loop asyncio; "
+                                 "prefork: vários processos worker")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="número de processos worker do modo prefork (padrão: um por núcleo)")
+        parser.add_argument('--worker-mode', choices=['threaded', 'async'], default='async',
+                            help="modo de cada processo worker do prefork")
+        parser.add_argument('--no-reuseport', action='store_true',
+                            help="prefork: herdar um único socket de escuta em vez de SO_REUSEPORT")
+        parser.add_argument('--egress-sockets', type=int, default=1,
+                            help="número de sockets UDP compartilhados que enviam o RTP")
+        parser.add_argument('--packetize', action='store_true',
+                            help="cria o packet store (.pkt) de cada vídeo na primeira abertura")
+        parser.add_argument('--renditions', action='store_true',
+                            help="cria com Pillow as renditions de qualidade menor de cada vídeo na primeira "
+                                 "abertura (bitrate adaptativo)")
+        parser.add_argument('--rendition-workers', type=int,
+                            help="processos que recodificam os frames das renditions (padrão: um por núcleo)")
+        parser.add_argument('--fec', type=int, default=0, metavar='GRUPO',
+                            help=f"oferece FEC por paridade XOR: um pacote de paridade a cada GRUPO pacotes RTP "
+                                 f"(1 a {MAX_GROUP}; o cliente pede com x-fec no SETUP)")
+        parser.add_argument('--nack', action='store_true',
+                            help="guarda os últimos pacotes de cada sessão UDP e os reenvia quando o cliente "
+                                 "pede com NACK (RTCP, RFC 4585)")
+        parser.add_argument('--max-sessions', type=int,
+                            help="sessões simultâneas aceitas; além disso o SETUP recebe 453")
+        parser.add_argument('--session-timeout', type=int, default=DEFAULT_SESSION_TIMEOUT,
+                            help="segundos sem request RTSP nem RTCP até a sessão ser encerrada")
+        parser.add_argument('--session-bandwidth', type=int, metavar='KBIT_S',
+                            help="limite de banda de cada sessão (kbit/s)")
+        parser.add_argument('--total-bandwidth', type=int, metavar='KBIT_S',
+                            help="limite de banda do servidor (kbit/s), também usado na admissão")
+        parser.add_argument('--live', action='append', default=[], metavar='NOME=FONTE',
+                            help="canal ao vivo rtsp://host:porta/live/NOME lido de FONTE (FIFO no formato "
+                                 ".Mjpeg ou arquivo .Mjpeg repetido em loop); pode ser repetido")
+        parser.add_argument('--metrics-port', type=int,
+                            help="porta local do endpoint HTTP /metrics (desligado por padrão)")
+        args = parser.parse_args()
+        if not 0 <= args.fec <= MAX_GROUP:
+            parser.error(f"--fec espera um grupo de 1 a {MAX_GROUP} pacotes")
+
+        for live in args.live:
+            name, sep, source = live.partition('=')
+            if not sep or not name or not source:
+                parser.error(f"--live espera NOME=FONTE: {live}")
+            liveChannels.add(name, source)
+        if args.mode == 'prefork':
+            from Prefork import HAS_FORK
+            if not HAS_FORK:
+                parser.error("--mode prefork precisa de fork(), que esta plataforma não tem")
+        if args.mode == 'prefork' and liveChannels.hasPipes():
+            # Cada worker teria o seu produtor, e os frames do FIFO seriam divididos entre eles
+            parser.error("canais ao vivo lidos de FIFO não funcionam com --mode prefork")
+
+        # Antes do fork do prefork: os workers herdam a configuração
+        MediaFile.buildPacketStores = args.packetize
+        renditionCache.configure(args.renditions, args.rendition_workers)
+        FecEncoder.group = args.fec
+        RetransmitRing.enabled = args.nack
+        # No prefork cada worker recebe uma parte dos limites do servidor
+        shares = max(1, args.workers) if args.mode == 'prefork' else 1
+        sessionManager.configure(
+            maxSessions=None if args.max_sessions is None else math.ceil(args.max_sessions / shares),
+            timeout=args.session_timeout,
+            sessionBandwidth=args.session_bandwidth and args.session_bandwidth * 1000,
+            totalBandwidth=args.total_bandwidth and args.total_bandwidth * 1000 / shares)
+
+        if args.mode == 'prefork':
+            # As métricas dos workers são somadas e expostas pelo supervisor
+            from Prefork import PreforkServer
+            PreforkServer(args.port, args.workers, args.worker_mode, args.egress_sockets,
+                          args.metrics_port, not args.no_reuseport).main()
+            return
+
+        # Metadados e SDP dos vídeos do diretório atual, lidos em segundo plano
+        mediaCatalog.start()
+        liveChannels.start()
+
+        if args.metrics_port:
+            MetricsServer(args.metrics_port).start()
+            print("Métricas em http://127.0.0.1:%d/metrics" % args.metrics_port)
+
+        if args.mode == 'async':
+            from AsyncServer import AsyncServer
+            AsyncServer(args.port, args.egress_sockets).main()
+        else:
+            egress.setSocketCount(args.egress_sockets)
+            self.serveThreaded(args.port)
+
+    def serveThreaded(self, SERVER_PORT):
+        """Accept clients and start one ServerWorker thread for each."""
+        rtspSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # O servidor fecha as conexões que terminam: permite reabrir a porta com elas em TIME_WAIT
+        rtspSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        rtspSocket.bind(('', SERVER_PORT))
+        rtspSocket.listen(5)
+
+        print("Servidor escutando na porta:", SERVER_PORT)
+        self.acceptLoop(rtspSocket)
+
+    def acceptLoop(self, rtspSocket):
+        """Accept clients on a listening socket forever."""
+        while True:
+            clientInfo = {}
+            clientInfo['rtspSocket'] = rtspSocket.accept()
+            print("Novo cliente conectado:", clientInfo['rtspSocket'][1])
+
+            worker = ServerWorker(clientInfo)
+            threading.Thread(target=worker.run).start()
+
+if __name__ == "__main__":
+    (Server()).main()
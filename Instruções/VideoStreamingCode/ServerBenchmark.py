@@ -0,0 +1,176 @@
+"""Compare how many concurrent sessions the threaded and asyncio servers sustain.
+
+Usage: python ServerBenchmark.py [--levels 50,100,200,400] [--duration 5]
+
+For each server mode a server is started on loopback, sessions are added in
+steps (SETUP + PLAY of a synthetic .Mjpeg) and every RTP socket is drained by
+a single selector loop. A session is "sustained" when it receives at least 90%
+of the nominal frame rate; a level passes when 95% of its sessions are
+sustained.
+"""
+import argparse, os, selectors, socket, subprocess, sys, tempfile, time
+
+from SyntheticVideo import writeSyntheticMjpeg
+from VideoStream import FRAME_RATE
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def raiseFileLimit():
+    """Raise the soft limit of open files as far as the hard limit allows."""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+def freePort():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def processStats(pid):
+    """Return (cpu seconds, thread count) of a process, read from /proc."""
+    try:
+        with open(f"/proc/{pid}/stat") as file:
+            fields = file.read().rsplit(')', 1)[1].split()
+        with open(f"/proc/{pid}/status") as file:
+            threads = next(int(line.split()[1]) for line in file if line.startswith('Threads:'))
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK'), threads
+    except (OSError, StopIteration, ValueError):
+        return None, None
+
+def processTreeCpu(pid):
+    """Return the cpu seconds of a process plus its children (e.g. prefork workers), read from /proc."""
+    total, _ = processStats(pid)
+    if total is None:
+        return None
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as file:
+                ppid = int(file.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == pid:
+            cpu, _ = processStats(int(entry))
+            total += cpu or 0
+    return total
+
+class BenchSession:
+    """One RTSP session opened with raw sockets; RTP is drained by the selector."""
+
+    def __init__(self, port, videoFile, selector):
+        self.rtp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.rtp.bind(('127.0.0.1', 0))
+        self.rtp.setblocking(False)
+        self.frames = 0
+        selector.register(self.rtp, selectors.EVENT_READ, self)
+
+        self.rtsp = socket.create_connection(('127.0.0.1', port))
+        rtpPort = self.rtp.getsockname()[1]
+        self.request(f"SETUP {videoFile} RTSP/1.0\nCSeq: 1\nTransport: RTP/UDP; client_port={rtpPort}\n\n")
+        self.request(f"PLAY {videoFile} RTSP/1.0\nCSeq: 2\nSession: 0\n\n")
+
+    def request(self, text):
+        self.rtsp.send(text.encode('utf-8'))
+        reply = self.rtsp.recv(1024)
+        if not reply.startswith(b'RTSP/1.0 200'):
+            raise RuntimeError("resposta RTSP inesperada: %r" % reply)
+
+    def drain(self):
+        while True:
+            try:
+                data = self.rtp.recv(65535)
+            except BlockingIOError:
+                return
+            # Marker bit: último fragmento do frame
+            if data[1] & 0x80:
+                self.frames += 1
+
+    def close(self):
+        self.rtsp.close()
+        self.rtp.close()
+
+def pump(selector, seconds):
+    """Drain every ready RTP socket for the given time."""
+    end = time.monotonic() + seconds
+    while True:
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            return
+        for key, _ in selector.select(remaining):
+            key.data.drain()
+
+def runMode(mode, levels, duration, videoFile):
+    port = freePort()
+    server = subprocess.Popen([sys.executable, os.path.join(HERE, 'Server.py'), str(port), '--mode', mode],
+                              cwd=os.path.dirname(videoFile), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    selector = selectors.DefaultSelector()
+    sessions = []
+    results = []
+    try:
+        time.sleep(1.0)
+        for level in levels:
+            while len(sessions) < level:
+                sessions.append(BenchSession(port, os.path.basename(videoFile), selector))
+                # Mantém os sockets já abertos drenados durante o ramp-up
+                pump(selector, 0)
+            pump(selector, 1.0)
+
+            for session in sessions:
+                session.frames = 0
+            cpuBefore, _ = processStats(server.pid)
+            pump(selector, duration)
+            cpuAfter, threads = processStats(server.pid)
+
+            rates = [session.frames / duration for session in sessions]
+            sustained = sum(1 for rate in rates if rate >= 0.9 * FRAME_RATE)
+            result = {
+                'mode': mode,
+                'sessions': level,
+                'sustained': sustained,
+                'meanFps': sum(rates) / len(rates),
+                'serverCpu': None if cpuBefore is None else (cpuAfter - cpuBefore) / duration,
+                'serverThreads': threads,
+            }
+            results.append(result)
+            cpu = "?" if result['serverCpu'] is None else f"{result['serverCpu']:.0%}"
+            print(f"{mode:>8} {level:>6} sessões  {sustained:>6} sustentadas  "
+                  f"{result['meanFps']:6.1f} fps médios  cpu={cpu}  threads={threads}")
+            if sustained < 0.95 * level:
+                break
+    except (OSError, RuntimeError) as e:
+        print(f"{mode}: interrompido com {len(sessions)} sessões ({e})")
+    finally:
+        for session in sessions:
+            session.close()
+        server.kill()
+        server.wait()
+    passed = [r['sessions'] for r in results if r['sustained'] >= 0.95 * r['sessions']]
+    return max(passed, default=0), results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--levels', default='25,50,100,200,400',
+                        help="número de sessões de cada etapa, separados por vírgula")
+    parser.add_argument('--duration', type=float, default=5.0, help="segundos medidos em cada etapa")
+    parser.add_argument('--modes', default='threaded,async')
+    args = parser.parse_args()
+
+    raiseFileLimit()
+    levels = [int(level) for level in args.levels.split(',')]
+    with tempfile.TemporaryDirectory() as tmp:
+        # Vídeo longo o bastante para não acabar durante a medição
+        frames = int(FRAME_RATE * (len(levels) * (args.duration + 1) + 60))
+        videoFile = writeSyntheticMjpeg(os.path.join(tmp, 'bench.Mjpeg'), frames, frameSize=6000)
+        summary = {}
+        for mode in args.modes.split(','):
+            summary[mode], _ = runMode(mode, levels, args.duration, videoFile)
+    print()
+    for mode, sessions in summary.items():
+        print(f"{mode}: até {sessions} sessões sustentadas")
+
+if __name__ == "__main__":
+    main()
@@ -1,213 +1,697 @@
-from random import randint
-import sys, traceback, threading, socket
-
-from VideoStream import VideoStream
-from RtpPacket import RtpPacket
-
-class ServerWorker:
-    SETUP = 'SETUP'
-    PLAY = 'PLAY'
-    PAUSE = 'PAUSE'
-    TEARDOWN = 'TEARDOWN'
-    DESCRIBE = 'DESCRIBE'
-    
-    INIT = 0
-    READY = 1
-    PLAYING = 2
-    state = INIT
-
-    OK_200 = 0
-    FILE_NOT_FOUND_404 = 1
-    CON_ERR_500 = 2
-    
-    clientInfo = {}
-    
-    def __init__(self, clientInfo):
-        self.clientInfo = clientInfo
-        
-    def run(self):
-        threading.Thread(target=self.recvRtspRequest).start()
-    
-    def recvRtspRequest(self):
-        """Receive RTSP request from the client."""
-        connSocket = self.clientInfo['rtspSocket'][0]
-        while True:            
-            try:
-                data = connSocket.recv(256)
-                if data:
-                    # Decodifica bytes para string (Python 3)
-                    decoded_data = data.decode('utf-8')
-                    print("-" * 20)
-                    print("RTSP Request recebido:\n" + decoded_data.strip())
-                    self.processRtspRequest(decoded_data)
-                else:
-                    # Se data for vazio, o cliente desconectou. Encerra o loop.
-                    print("Cliente desconectou o socket RTSP.")
-                    break
-            except Exception as e:
-                print("Erro no recvRtspRequest:", e)
-                break
-    
-    def processRtspRequest(self, data):
-        """Process RTSP request sent from the client."""
-        # splitlines() é mais seguro para quebras de linha
-        request = data.splitlines()
-        line1 = request[0].split(' ')
-        requestType = line1[0]
-        
-        # Get the media file name
-        filename = line1[1]
-        
-        # Get the RTSP sequence number 
-        seq = request[1].split(' ')
-        
-        # Process SETUP request
-        if requestType == self.SETUP:
-            if self.state == self.INIT:
-                print("Processando SETUP...")
-                
-                try:
-                    self.clientInfo['videoStream'] = VideoStream(filename)
-                    self.state = self.READY
-                    print("Arquivo de video aberto com sucesso:", filename)
-                except IOError:
-                    print("Erro: Arquivo não encontrado ->", filename)
-                    self.replyRtsp(self.FILE_NOT_FOUND_404, seq[1])
-                
-                # Generate a randomized RTSP session ID
-                self.clientInfo['session'] = randint(100000, 999999)
-                
-                # Send RTSP reply
-                self.replyRtsp(self.OK_200, seq[1])
-                
-                # Get the RTP/UDP port from the last line
-                # Procura a linha que começa com Transport
-                for line in request:
-                    if "Transport:" in line:
-                         self.clientInfo['rtpPort'] = line.split('client_port=')[1].strip()
-                         break
-        
-        # Process PLAY request      
-        elif requestType == self.PLAY:
-            if self.state == self.READY:
-                print("Processando PLAY...")
-                self.state = self.PLAYING
-                
-                # Create a new socket for RTP/UDP
-                self.clientInfo["rtpSocket"] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                
-                self.replyRtsp(self.OK_200, seq[1])
-                
-                # Create a new thread and start sending RTP packets
-                self.clientInfo['event'] = threading.Event()
-                self.clientInfo['worker'] = threading.Thread(target=self.sendRtp) 
-                self.clientInfo['worker'].start()
-        
-        # Process PAUSE request
-        elif requestType == self.PAUSE:
-            if self.state == self.PLAYING:
-                print("Processando PAUSE...")
-                self.state = self.READY
-                
-                self.clientInfo['event'].set()
-            
-                self.replyRtsp(self.OK_200, seq[1])
-
-        # Process DESCRIBE request
-        elif requestType == self.DESCRIBE:
-            print("Processando DESCRIBE...")
-            
-            # Gera a resposta SDP
-            sdpInfo = self.generateSdp(self.clientInfo['videoStream'])
-            
-            self.replyRtspDescribe(self.OK_200, seq[1], sdpInfo)
-        
-        # Process TEARDOWN request
-        elif requestType == self.TEARDOWN:
-            print("Processando TEARDOWN...")
-
-            self.clientInfo['event'].set()
-            
-            self.replyRtsp(self.OK_200, seq[1])
-            
-            # Close the RTP socket
-            if 'rtpSocket' in self.clientInfo:
-                self.clientInfo['rtpSocket'].close()
-            
-    def sendRtp(self):
-        """Send RTP packets over UDP."""
-        print("Iniciando envio RTP...")
-        while True:
-            self.clientInfo['event'].wait(0.05) 
-            
-            # Stop sending if request is PAUSE or TEARDOWN
-            if self.clientInfo['event'].isSet(): 
-                break 
-                
-            data = self.clientInfo['videoStream'].nextFrame()
-            
-            if data: 
-                frameNumber = self.clientInfo['videoStream'].frameNbr()
-                try:
-                    address = self.clientInfo['rtspSocket'][1][0]
-                    port = int(self.clientInfo['rtpPort'])
-                    packet = self.makeRtp(data, frameNumber)
-                    self.clientInfo['rtpSocket'].sendto(packet,(address,port))
-                    # Descomente a linha abaixo se quiser ver MUITOS logs
-                    # print(f"Enviado frame {frameNumber} para {address}:{port} ({len(packet)} bytes)")
-                except Exception as e:
-                    print("Erro de Conexão no envio RTP:", e)
-            else:
-                # Se não há dados, o video acabou ou falhou
-                # print("Sem dados do VideoStream (Fim do arquivo ou erro)")
-                pass
-
-    def makeRtp(self, payload, frameNbr):
-        """RTP-packetize the video data."""
-        version = 2
-        padding = 0
-        extension = 0
-        cc = 0
-        marker = 0
-        pt = 26 # MJPEG type
-        seqnum = frameNbr
-        ssrc = 0 
-        
-        rtpPacket = RtpPacket()
-        
-        rtpPacket.encode(version, padding, extension, cc, seqnum, marker, pt, ssrc, payload)
-        
-        return rtpPacket.getPacket()
-        
-    def replyRtsp(self, code, seq):
-        """Send RTSP reply to the client."""
-        if code == self.OK_200:
-            reply = 'RTSP/1.0 200 OK\nCSeq: ' + seq + '\nSession: ' + str(self.clientInfo['session']) + '\n'
-            connSocket = self.clientInfo['rtspSocket'][0]
-            # Envia resposta codificada em bytes
-            connSocket.send(reply.encode('utf-8'))
-        
-        # Error messages
-        elif code == self.FILE_NOT_FOUND_404:
-            print("Erro 404: Arquivo não encontrado.")
-        elif code == self.CON_ERR_500:
-            print("Erro 500: Erro de conexão.")
-    
-    def generateSdp(self, videoStream):
-        """Gera informações de descrição da sessão em formato SDP"""
-        filename = videoStream.filename
-        sdp = f"v=0\n"                      # versão SDP
-        sdp += f"o=- 0 0 IN IP4 127.0.0.1\n" # origin
-        sdp += f"s={filename}\n"             # session name
-        sdp += f"t=0 0\n"                    # timing
-        sdp += f"m=video {self.clientInfo.get('rtpPort', 0)} RTP/AVP 26\n"  # media, porta RTP, payload type
-        sdp += f"a=control:streamid=0\n"
-        sdp += f"a=mimetype:string;encoding=JPEG\n"
-        return sdp
-
-    def replyRtspDescribe(self, code, seq, sdpInfo):
-        """Envia resposta DESCRIBE ao cliente"""
-        if code == self.OK_200:
-            reply = f'RTSP/1.0 200 OK\nCSeq: {seq}\nSession: {self.clientInfo["session"]}\n{len(sdpInfo)}\n{sdpInfo}'
-            connSocket = self.clientInfo['rtspSocket'][0]
-            connSocket.send(reply.encode('utf-8'))
\ No newline at end of file
+import sys, traceback, threading, socket, select, time, random
+
+from VideoStream import FRAME_RATE
+from RtpPacket import RtpHeaderTemplate
+from JpegPayload import JpegPacketizer
+from Scheduler import mediaScheduler, rtpTimestamp, RTP_CLOCK_RATE
+from Egress import egress, TcpSendQueue
+from Rtcp import rtcpChannel, buildSenderReport, parseRtcp, ntpTimestamp, ntpMiddle, RTCP_INTERVAL, RTCP_SR, RTCP_RR, RTCP_BYE
+from Metrics import metrics
+from MediaCatalog import mediaCatalog, MJPEG_PT
+from LiveChannel import liveChannels
+from Renditions import renditionCache, AdaptiveStream, RateController
+from Fec import FecEncoder, parseFecParameter, MAX_GROUP
+from Retransmit import RetransmitRing
+from SessionManager import sessionManager
+from Session import Session, SessionState, RtspMethod, sessionTable
+from RtspMessage import RtspMessage, RtspParser, RtspError, InterleavedFrame, INTERLEAVED_HEADER, INTERLEAVED_MARK
+
+sessionsByState = metrics.gauge('rtsp_sessions', "Sessões RTSP por estado", ['state'])
+requestDuration = metrics.histogram('rtsp_request_duration_seconds', "Tempo de processamento dos requests RTSP", ['method'])
+framesSent = metrics.counter('rtp_frames_sent_total', "Frames de vídeo enviados por RTP")
+fecPacketsSent = metrics.counter('rtp_fec_packets_sent_total', "Pacotes de paridade FEC enviados")
+
+class ServerWorker:
+    SETUP = RtspMethod.SETUP
+    PLAY = RtspMethod.PLAY
+    PAUSE = RtspMethod.PAUSE
+    TEARDOWN = RtspMethod.TEARDOWN
+    DESCRIBE = RtspMethod.DESCRIBE
+    GET_PARAMETER = RtspMethod.GET_PARAMETER
+    OPTIONS = RtspMethod.OPTIONS
+    METHODS = tuple(RtspMethod)
+    
+    INIT = SessionState.INIT
+    READY = SessionState.READY
+    PLAYING = SessionState.PLAYING
+
+    # Sessões sem SETUP (INIT) não entram na métrica rtsp_sessions
+    STATE_NAMES = {READY: 'ready', PLAYING: 'playing'}
+
+    OK_200 = 0
+    FILE_NOT_FOUND_404 = 1
+    CON_ERR_500 = 2
+    INVALID_RANGE_457 = 3
+    BAD_REQUEST_400 = 4
+    UNSUPPORTED_TRANSPORT_461 = 5
+    NOT_ENOUGH_BANDWIDTH_453 = 6
+
+    STATUS = {
+        OK_200: (200, 'OK'),
+        FILE_NOT_FOUND_404: (404, 'Not Found'),
+        CON_ERR_500: (500, 'Internal Server Error'),
+        INVALID_RANGE_457: (457, 'Invalid Range'),
+        BAD_REQUEST_400: (400, 'Bad Request'),
+        UNSUPPORTED_TRANSPORT_461: (461, 'Unsupported Transport'),
+        NOT_ENOUGH_BANDWIDTH_453: (453, 'Not Enough Bandwidth'),
+    }
+
+    # Sem estado por sessão: um único packetizer serve todas
+    packetizer = JpegPacketizer()
+
+    __slots__ = ('clientInfo', 'session', 'parser', 'streamLock', 'egress')
+    
+    def __init__(self, clientInfo):
+        # Só o que é da conexão RTSP (socket e fila de envio); o estado da sessão fica em self.session
+        self.clientInfo = clientInfo
+        self.session = None
+        # Requests podem chegar partidos em vários recv ou vários em um só (pipelining)
+        self.parser = RtspParser()
+        self.streamLock = threading.Lock()
+        self.egress = egress
+
+    @property
+    def state(self):
+        return self.session.state if self.session is not None else self.INIT
+        
+    def run(self):
+        threading.Thread(target=self.recvRtspRequest).start()
+    
+    def recvRtspRequest(self):
+        """Receive RTSP request from the client."""
+        connSocket = self.clientInfo['rtspSocket'][0]
+        while True:            
+            try:
+                try:
+                    data = connSocket.recv(4096)
+                except BlockingIOError:
+                    # RTP intercalado: a fila de envio deixou o socket não bloqueante; espera o próximo request
+                    select.select([connSocket], [], [])
+                    continue
+                if data:
+                    if not self.dataReceived(data):
+                        break
+                else:
+                    # Se data for vazio, o cliente desconectou. Encerra o loop.
+                    print("Cliente desconectou o socket RTSP.")
+                    break
+            except Exception as e:
+                print("Erro no recvRtspRequest:", e)
+                break
+        self.closeSession()
+        if 'sendQueue' in self.clientInfo:
+            self.clientInfo.pop('sendQueue').close()
+        connSocket.close()
+
+    def dataReceived(self, data):
+        """Feed bytes from the control connection and process every complete request.
+
+        Return False if the stream is malformed and the connection must be closed.
+        """
+        error = None
+        try:
+            requests = self.parser.feed(data)
+        except RtspError as e:
+            # Os requests que chegaram antes do malformado (pipelining) são atendidos antes do 400
+            requests, error = e.messages, e
+        for request in requests:
+            if isinstance(request, InterleavedFrame):
+                self.interleavedReceived(request)
+                continue
+            print("-" * 20)
+            print("RTSP Request recebido:\n" + str(request))
+            self.processRtspRequest(request)
+        if error is not None:
+            print("Request RTSP malformado:", error)
+            self.replyRtsp(self.BAD_REQUEST_400, '0')
+            return False
+        return True
+    
+    def processRtspRequest(self, request):
+        """Process RTSP request sent from the client, timing it per method."""
+        started = time.perf_counter()
+        # Qualquer request na conexão mantém a sessão viva
+        if self.session is not None:
+            sessionManager.touch(self.session)
+        try:
+            self.handleRtspRequest(request)
+        finally:
+            method = request.method if request.method in self.METHODS else 'other'
+            requestDuration.labels(method).observe(time.perf_counter() - started)
+
+    def handleRtspRequest(self, request):
+        """Dispatch one RTSP request (an RtspMessage)."""
+        requestType = request.method
+        
+        # Get the media file name
+        filename = request.uri
+        
+        # Get the RTSP sequence number 
+        seq = request.cseq
+        if seq is None:
+            self.replyRtsp(self.BAD_REQUEST_400, '0')
+            return
+        
+        # Process SETUP request
+        if requestType == self.SETUP:
+            if self.state == self.INIT:
+                print("Processando SETUP...")
+
+                # RTP/AVP/TCP;interleaved=<rtp>-<rtcp> ou RTP/AVP;client_port=<rtp>[-<rtcp>]
+                transport = request.header('Transport', '')
+                interleaved = self.parseInterleaved(transport)
+                if interleaved is None and 'client_port=' not in transport:
+                    self.replyRtsp(self.UNSUPPORTED_TRANSPORT_461, seq)
+                    return
+
+                # Controle de admissão: número de sessões e banda média reservada pelos vídeos
+                info = self.lookupMedia(filename)
+                if info is None:
+                    print("Erro: Arquivo não encontrado ->", filename)
+                    self.replyRtsp(self.FILE_NOT_FOUND_404, seq)
+                    return
+                # Session ID, SSRC, número de sequência e base de timestamp aleatórios (RFC 3550)
+                session = Session(sessionTable.newId(), self)
+                if not sessionManager.admit(session, info.averageBitrate):
+                    self.replyRtsp(self.NOT_ENOUGH_BANDWIDTH_453, seq)
+                    return
+                
+                try:
+                    session.videoStream = self.openStream(filename, info)
+                except IOError:
+                    print("Erro: Arquivo não encontrado ->", filename)
+                    sessionManager.release(session)
+                    self.replyRtsp(self.FILE_NOT_FOUND_404, seq)
+                    return
+                if isinstance(session.videoStream, AdaptiveStream):
+                    session.abr = RateController(session.videoStream.bitrates())
+                self.session = session
+                self.setState(self.READY)
+                print("Arquivo de video aberto com sucesso:", filename)
+
+                session.rtpHeader = RtpHeaderTemplate(MJPEG_PT, session.ssrc)
+                
+                if interleaved is not None:
+                    # RTP/AVP/TCP: RTP e RTCP vão pela própria conexão RTSP, nos canais pedidos
+                    session.interleaved = interleaved
+                    if 'sendQueue' not in self.clientInfo:
+                        self.clientInfo['sendQueue'] = self.openSendQueue()
+                    transport = (f"RTP/AVP/TCP;unicast;interleaved={interleaved[0]}-{interleaved[1]};"
+                                 f"ssrc={session.ssrc:08X}")
+                else:
+                    # Get the RTP/UDP port from the Transport header
+                    # client_port=<rtp> ou client_port=<rtp>-<rtcp>
+                    ports = transport.split('client_port=')[1].split(';')[0].strip().split('-')
+                    session.rtpPort = int(ports[0])
+                    session.rtcpPort = int(ports[1]) if len(ports) > 1 else session.rtpPort + 1
+
+                    # RTCP: relatórios do cliente chegam ao canal do servidor e são entregues pelo SSRC
+                    rtcpChannel.register(session.ssrc, self)
+                    rtpSourcePort = self.egress.socketFor(session.ssrc).getsockname()[1]
+                    fecGroup = parseFecParameter(transport)
+                    nack = 'x-nack' in (parameter.strip() for parameter in transport.split(';'))
+                    transport = (f"RTP/AVP;unicast;client_port={session.rtpPort}-{session.rtcpPort};"
+                                 f"server_port={rtpSourcePort}-{rtcpChannel.port()};ssrc={session.ssrc:08X}")
+                    # FEC (x-fec[=<grupo>]): só em UDP e se o servidor oferece; a resposta traz o grupo usado
+                    if fecGroup != 0 and FecEncoder.group:
+                        fecGroup = FecEncoder.group if fecGroup is None else max(1, min(fecGroup, MAX_GROUP))
+                        session.fec = FecEncoder(fecGroup, session.ssrc, random.randint(0, 0xFFFF))
+                        transport += f";x-fec={fecGroup}"
+                    # NACK (x-nack): o servidor guarda os últimos pacotes da sessão para reenviá-los
+                    if nack and RetransmitRing.enabled:
+                        session.retransmit = RetransmitRing(session.rate)
+                        transport += ";x-nack"
+                
+                # Send RTSP reply
+                self.replyRtsp(self.OK_200, seq, {'Transport': transport})
+        
+        # Process PLAY request      
+        elif requestType == self.PLAY:
+            if self.state == self.READY:
+                print("Processando PLAY...")
+                videoStream = self.session.videoStream
+                headers = {}
+
+                # Range: npt=<início>-[<fim>] reposiciona o stream antes de enviar
+                if videoStream.live:
+                    # Canal ao vivo: sem busca, o envio começa no frame mais recente
+                    headers['Range'] = "npt=now-"
+                elif request.header('Range') is not None:
+                    npt = self.parseRange(request.header('Range'))
+                    if npt is None or (npt[0] or 0) > videoStream.duration():
+                        self.replyRtsp(self.INVALID_RANGE_457, seq)
+                        return
+                    start, end = npt
+                    if start is not None:
+                        videoStream.seek(int(start * FRAME_RATE))
+                    self.session.lastFrame = None if end is None else int(end * FRAME_RATE)
+                    position = videoStream.frameNbr() / FRAME_RATE
+                    headers['Range'] = f"npt={position:.3f}-" + ("" if end is None else f"{end:.3f}")
+
+                self.setState(self.PLAYING)
+                
+                self.replyRtsp(self.OK_200, seq, headers)
+                
+                self.startStreaming()
+        
+        # Process PAUSE request
+        elif requestType == self.PAUSE:
+            if self.state == self.PLAYING:
+                print("Processando PAUSE...")
+                self.setState(self.READY)
+                
+                self.stopStreaming()
+            
+                self.replyRtsp(self.OK_200, seq)
+            elif self.state == self.READY:
+                # Stream já parado (fim do vídeo): nada a fazer (RFC 2326, apêndice A)
+                self.replyRtsp(self.OK_200, seq)
+
+        # Process DESCRIBE request: answered from the media catalog (or the live channel), in any state
+        elif requestType == self.DESCRIBE:
+            print("Processando DESCRIBE...")
+            
+            info = self.lookupMedia(filename)
+            if info is None:
+                self.replyRtsp(self.FILE_NOT_FOUND_404, seq)
+                return
+            
+            self.replyRtspDescribe(self.OK_200, seq, info.sdp)
+        
+        # Process TEARDOWN request
+        elif requestType == self.TEARDOWN:
+            print("Processando TEARDOWN...")
+
+            self.stopStreaming()
+            
+            self.replyRtsp(self.OK_200, seq)
+            
+            self.closeSession()
+
+        # Process OPTIONS request: also used by clients as a keep-alive
+        elif requestType == self.OPTIONS:
+            self.replyRtsp(self.OK_200, seq, {'Public': ', '.join(self.METHODS)})
+
+        # Process GET_PARAMETER request: the body lists the metrics wanted (empty = all)
+        elif requestType == self.GET_PARAMETER:
+            names = [line.strip() for line in request.bodyText().splitlines() if line.strip()]
+            body = metrics.render(names or None)
+            self.replyRtsp(self.OK_200, seq, {'Content-Type': 'text/parameters'}, body)
+
+    def startStreaming(self):
+        """Start sending RTP packets for the current PLAY."""
+        session = self.session
+        # O RTP sai pelos sockets UDP compartilhados do egress
+        session.rtpSocket = self.egress.socketFor(session.ssrc)
+
+        print("Iniciando envio RTP...")
+        with self.streamLock:
+            # Relógio de mídia ancorado no frame em que o PLAY começa (ao vivo: segue o produtor do canal)
+            session.clock = session.videoStream.mediaClock()
+            session.timer = self.callAt(session.clock.startTime, self.sendRtp)
+
+    def stopStreaming(self):
+        """Cancel the session's pending frame, waiting for one being sent."""
+        with self.streamLock:
+            session = self.session
+            if session is not None and session.timer is not None:
+                session.timer.cancel()
+                session.timer = None
+
+    def callAt(self, when, callback):
+        """Schedule callback at monotonic time when on the shared media scheduler."""
+        return mediaScheduler.callAt(when, callback)
+
+    def closeSession(self):
+        """Release the session's reference to the shared video."""
+        self.stopStreaming()
+        session = self.session
+        if session is None:
+            return
+        sessionManager.release(session)
+        rtcpChannel.unregister(session.ssrc)
+        if session.retransmit is not None:
+            # Os pacotes guardados podem ser views do packet store, que fecha com o vídeo
+            session.retransmit.clear()
+        # A fila de envio continua até a conexão fechar: a resposta ao TEARDOWN ainda passa por ela
+        if session.reception:
+            print("Qualidade de entrega (RTCP):", self.receptionStats())
+
+        session.videoStream.close()
+        self.setState(self.INIT)
+        self.session = None
+
+    def expire(self):
+        """Close the control connection of a session that timed out (called by the session manager)."""
+        print("Sessão", self.sessionId(), "encerrada por inatividade")
+        try:
+            # Acorda o recv da thread da conexão, que encerra a sessão
+            self.clientInfo['rtspSocket'][0].shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def setState(self, state):
+        """Change the session state, keeping the per-state session gauge up to date."""
+        if state == self.state:
+            return
+        if self.state in self.STATE_NAMES:
+            sessionsByState.labels(self.STATE_NAMES[self.state]).dec()
+        if state in self.STATE_NAMES:
+            sessionsByState.labels(self.STATE_NAMES[state]).inc()
+        self.session.state = state
+
+    def sessionId(self):
+        """Return the Session ID, or None before SETUP."""
+        session = self.session
+        return session.id if session is not None else None
+            
+    def sendRtp(self):
+        """Send the frame that is due and schedule the next one on the media clock."""
+        with self.streamLock:
+            session = self.session
+            # Stop sending if request is PAUSE or TEARDOWN
+            if session is None or session.timer is None:
+                return
+
+            if not self.sendFrame():
+                # Fim do vídeo (ou do Range): a sessão volta a READY e expira se o cliente sumir
+                session.timer = None
+                self.setState(self.READY)
+                return
+
+            now = time.monotonic()
+            if now >= session.nextSenderReport:
+                self.sendSenderReport()
+                session.nextSenderReport = now + RTCP_INTERVAL
+
+            due = session.clock.nextDueTime(session.videoStream.frameNbr(), now)
+            session.timer = self.callAt(due, self.sendRtp)
+
+    def sendSenderReport(self):
+        """Send an RTCP SR for the frame just sent to the client's RTCP port."""
+        session = self.session
+        frameIndex = session.videoStream.frameNbr() - 1
+        timestamp = rtpTimestamp(frameIndex, FRAME_RATE, session.rtpTimestampBase)
+        packet = buildSenderReport(session.ssrc, timestamp, session.packetsSent, session.octetsSent)
+        if session.interleaved is not None:
+            self.clientInfo['sendQueue'].push(InterleavedFrame(session.interleaved[1], packet).serialize())
+        else:
+            rtcpChannel.send(packet, (self.clientInfo['rtspSocket'][1][0], session.rtcpPort))
+
+    def onReceiverReport(self, block, receiverSsrc, arrival):
+        """Aggregate an RTCP report block about this session (called from the RTCP thread)."""
+        session = self.session
+        if session is None:
+            return
+        sessionManager.touch(session)
+        if session.reception is None:
+            session.reception = {'reports': 0, 'fractionLostSum': 0.0}
+        reception = session.reception
+        session.receiverSsrc = receiverSsrc
+        reception['reports'] += 1
+        reception['fractionLost'] = block['fractionLost'] / 256
+        reception['fractionLostSum'] += reception['fractionLost']
+        reception['cumulativeLost'] = block['cumulativeLost']
+        reception['jitterMs'] = block['jitter'] * 1000 / RTP_CLOCK_RATE
+        if session.abr is not None:
+            session.abr.onReport(reception['fractionLost'], session.octetsSent, time.monotonic())
+        if block['lsr']:
+            # RTT = chegada - LSR - DLSR, tudo em 1/65536 s (RFC 3550, seção 6.4.1)
+            rtt = (ntpMiddle(*ntpTimestamp(arrival)) - block['lsr'] - block['dlsr']) & 0xFFFFFFFF
+            if rtt < 0x80000000:
+                reception['rttMs'] = rtt * 1000 / 65536
+
+    def interleavedReceived(self, frame):
+        """Handle a '$' packet from the client: RTCP on the session's RTCP channel."""
+        session = self.session
+        if session is None or session.interleaved is None or frame.channel != session.interleaved[1]:
+            return
+        arrival = time.time()
+        for packet in parseRtcp(frame.data):
+            if packet['type'] in (RTCP_SR, RTCP_RR):
+                for block in packet['blocks']:
+                    if block['ssrc'] == session.ssrc:
+                        self.onReceiverReport(block, packet['ssrc'], arrival)
+            elif packet['type'] == RTCP_BYE:
+                self.onBye()
+
+    def onNack(self, lost):
+        """Resend the packets the client reported lost in a generic NACK (called from the RTCP thread)."""
+        with self.streamLock:
+            session = self.session
+            if session is None or session.retransmit is None or session.rtpSocket is None:
+                return
+            now = time.monotonic()
+            address = self.rtpAddress()
+            queued = False
+            for seq in lost:
+                buffers = session.retransmit.take(seq, now)
+                if buffers is not None:
+                    self.egress.enqueue(session.rtpSocket, buffers, address)
+                    queued = True
+        if queued:
+            self.flushEgress()
+
+    def flushEgress(self):
+        """Send the queued packets now instead of at the next scheduler tick."""
+        self.egress.flush()
+
+    def onBye(self):
+        """The receiver left the session (RTCP BYE)."""
+        print("RTCP BYE recebido da sessão", self.sessionId())
+        self.stopStreaming()
+
+    def receptionStats(self):
+        """Return the delivery quality reported by the client over RTCP."""
+        session = self.session
+        reception = dict(session.reception or {})
+        if reception.get('reports'):
+            reception['averageFractionLost'] = reception.pop('fractionLostSum') / reception['reports']
+        reception['packetsSent'] = session.packetsSent
+        reception['octetsSent'] = session.octetsSent
+        return reception
+
+    def sendFrame(self):
+        """Send the next frame of the video. Return False when there is nothing left to send."""
+        # Fim do intervalo pedido no Range do PLAY
+        session = self.session
+        videoStream = session.videoStream
+        if session.lastFrame is not None and videoStream.frameNbr() >= session.lastFrame:
+            return False
+        if not videoStream.frameReady():
+            # Canal ao vivo: o próximo frame ainda não foi publicado
+            return True
+        if session.abr is not None:
+            # Bitrate adaptativo: a rendition é escolhida a cada frame
+            videoStream.setLevel(session.abr.level)
+
+        # Vídeo com packet store: os payloads já estão prontos, só falta o cabeçalho RTP
+        payloads = videoStream.nextPayloads()
+        if payloads is None:
+            data = videoStream.nextFrame()
+            if not data:
+                # Se não há dados, o video acabou ou falhou
+                # print("Sem dados do VideoStream (Fim do arquivo ou erro)")
+                return False
+        elif not payloads:
+            return False
+        # Número lido depois do frame: um assinante ao vivo atrasado pode ter pulado para a borda
+        frameNumber = videoStream.frameNbr() - 1
+        if payloads is None:
+            packets = self.makeRtp(data, frameNumber)
+        else:
+            packets = self.makeRtpFromPayloads(payloads, frameNumber)
+
+        # Limites de banda: o frame inteiro é descartado, o relógio de mídia segue
+        size = len(data) if payloads is None else sum(len(payload) for payload in payloads)
+        if not sessionManager.allowFrame(session, size):
+            if session.abr is not None:
+                session.abr.onThrottled()
+            return True
+
+        try:
+            if session.interleaved is not None:
+                self.sendInterleavedFrame(packets)
+            else:
+                now = time.monotonic()
+                for buffers in packets:
+                    self.sendPacket(buffers)
+                    if session.retransmit is not None:
+                        session.retransmit.add(buffers, now)
+                    if session.fec is not None:
+                        self.sendParity(session.fec.add(buffers))
+                framesSent.inc()
+            # Descomente a linha abaixo se quiser ver MUITOS logs
+            # print(f"Enviado frame {frameNumber} ({len(data)} bytes)")
+        except Exception as e:
+            print("Erro de Conexão no envio RTP:", e)
+        return True
+
+    def rtpAddress(self):
+        """Return the (address, port) the client receives RTP on."""
+        return (self.clientInfo['rtspSocket'][1][0], self.session.rtpPort)
+
+    def sendPacket(self, buffers):
+        """Queue one RTP packet, given as a list of buffers, for the egress flush of this tick."""
+        self.egress.enqueue(self.session.rtpSocket, buffers, self.rtpAddress())
+        self.countPacket(buffers)
+
+    def sendParity(self, packet):
+        """Queue the FEC packet that closed a group, if any, after the media packets."""
+        if packet is not None:
+            self.egress.enqueue(self.session.rtpSocket, [packet], self.rtpAddress())
+            fecPacketsSent.inc()
+
+    def sendInterleavedFrame(self, packets):
+        """Queue every RTP packet of a frame as one message on the RTSP connection.
+
+        The frame goes whole or not at all: when the connection's send queue
+        is full it is dropped, and its sequence numbers show up as lost in
+        the client's reports.
+        """
+        channel = self.session.interleaved[0]
+        message = bytearray()
+        count = octets = 0
+        for buffers in packets:
+            message += INTERLEAVED_HEADER.pack(INTERLEAVED_MARK, channel, sum(len(b) for b in buffers))
+            for buffer in buffers:
+                message += buffer
+            count += 1
+            octets += sum(len(b) for b in buffers[1:])
+        if self.clientInfo['sendQueue'].push(bytes(message)):
+            self.countPackets(count, octets)
+            framesSent.inc()
+
+    def openSendQueue(self):
+        """Return the bounded send queue of the RTSP connection (interleaved transport)."""
+        return TcpSendQueue(self.clientInfo['rtspSocket'][0], self.callAt)
+
+    def lookupMedia(self, filename):
+        """Return the description (SDP, average bitrate) of a live channel or a video file, or None."""
+        channel = liveChannels.get(filename)
+        return channel if channel is not None else mediaCatalog.lookup(filename)
+
+    def openStream(self, filename, info):
+        """Open the session's stream: a subscription to a live channel, or the video file with its renditions.
+
+        info is what lookupMedia() returned for filename: a file is opened by
+        the path the catalog resolved and validated, never by the raw name.
+        """
+        channel = liveChannels.get(filename)
+        return channel.subscribe() if channel is not None else renditionCache.open(info.path)
+
+    def parseInterleaved(self, transport):
+        """Return the (rtp, rtcp) channels of an RTP/AVP/TCP Transport header, or None."""
+        if not transport.startswith('RTP/AVP/TCP'):
+            return None
+        channels = (0, 1)
+        for parameter in transport.split(';'):
+            if parameter.strip().startswith('interleaved='):
+                try:
+                    values = [int(value) for value in parameter.split('=', 1)[1].split('-')]
+                except ValueError:
+                    return None
+                channels = (values[0], values[1] if len(values) > 1 else values[0] + 1)
+        if not all(0 <= channel <= 255 for channel in channels):
+            return None
+        return channels
+
+    def countPacket(self, buffers):
+        """Update the packet and payload octet counts reported in the RTCP SR."""
+        self.countPackets(1, sum(len(b) for b in buffers[1:]))
+
+    def countPackets(self, packets, octets):
+        session = self.session
+        session.packetsSent += packets
+        session.octetsSent += octets
+
+    def makeRtp(self, payload, frameNbr):
+        """RTP-packetize frame frameNbr (0-based) of the video.
+
+        Yields the buffers of each packet: RTP header, RFC 2435 header and the
+        fragment (a view of the frame). The RTP header is the session's
+        template patched in place, so each packet must be sent before the
+        next one is taken from the generator.
+        """
+        fragments = (([jpegHeader, fragment], last) for jpegHeader, fragment, last in self.packetizer.packetize(payload))
+        return self.rtpPackets(fragments, frameNbr)
+
+    def makeRtpFromPayloads(self, payloads, frameNbr):
+        """RTP-packetize frame frameNbr from the packet store, whose payloads are ready RFC 2435 fragments."""
+        last = len(payloads) - 1
+        return self.rtpPackets((([payload], i == last) for i, payload in enumerate(payloads)), frameNbr)
+
+    def rtpPackets(self, fragments, frameNbr):
+        """Yield [RTP header] + buffers for each (buffers, last) fragment of frame frameNbr."""
+        session = self.session
+        template = session.rtpHeader
+        # Todos os fragmentos de um frame compartilham o timestamp de 90 kHz do frame
+        timestamp = rtpTimestamp(frameNbr, FRAME_RATE, session.rtpTimestampBase)
+
+        for buffers, last in fragments:
+            # Número de sequência por pacote (16 bits, dá a volta em 65535)
+            seqnum = session.rtpSeq
+            session.rtpSeq = (seqnum + 1) & 0xFFFF
+            marker = 1 if last else 0
+
+            yield [template.patch(seqnum, timestamp, marker)] + buffers
+        
+    def replyRtsp(self, code, seq, headers=None, body=b''):
+        """Send RTSP reply to the client."""
+        statusCode, reason = self.STATUS[code]
+        reply = RtspMessage.response(statusCode, reason, seq)
+        if code == self.OK_200:
+            # GET_PARAMETER pode chegar antes do SETUP, sem sessão
+            if self.session is not None:
+                reply.setHeader('Session', f"{self.session.id};timeout={sessionManager.timeout}")
+            for name, value in (headers or {}).items():
+                reply.setHeader(name, value)
+            reply.body = body.encode('utf-8') if isinstance(body, str) else body
+        
+        # Error messages
+        else:
+            if code == self.NOT_ENOUGH_BANDWIDTH_453:
+                print("Erro 453: servidor sem capacidade para outra sessão.")
+            elif code == self.FILE_NOT_FOUND_404:
+                print("Erro 404: Arquivo não encontrado.")
+            elif code == self.CON_ERR_500:
+                print("Erro 500: Erro de conexão.")
+            elif code == self.INVALID_RANGE_457:
+                print("Erro 457: Range inválido.")
+            elif code == self.BAD_REQUEST_400:
+                print("Erro 400: Request malformado.")
+            elif code == self.UNSUPPORTED_TRANSPORT_461:
+                print("Erro 461: Transport não suportado.")
+
+        self.sendRtspReply(reply.serialize())
+
+    def sendRtspReply(self, reply):
+        """Write a serialized RTSP reply on the control connection."""
+        sendQueue = self.clientInfo.get('sendQueue')
+        if sendQueue is not None:
+            # Com RTP intercalado a resposta entra na fila, entre frames inteiros, e nunca é descartada
+            sendQueue.push(reply, droppable=False)
+            return
+        connSocket = self.clientInfo['rtspSocket'][0]
+        connSocket.sendall(reply)
+
+    def parseRange(self, value):
+        """Parse a Range header value 'npt=start-[end]'. Return (start, end) in seconds or None."""
+        value = value.strip()
+        if not value.startswith('npt='):
+            return None
+        try:
+            start, end = value[4:].split('-', 1)
+            # 'now' e início vazio significam continuar da posição atual
+            start = None if start in ('', 'now') else float(start)
+            end = float(end) if end.strip() else None
+        except ValueError:
+            return None
+        if (start is not None and start < 0) or (end is not None and start is not None and end < start):
+            return None
+        return start, end
+    
+    def replyRtspDescribe(self, code, seq, sdpInfo):
+        """Envia resposta DESCRIBE ao cliente"""
+        if code == self.OK_200:
+            self.replyRtsp(code, seq, {'Content-Type': 'application/sdp'}, sdpInfo)
\ No newline at end of file
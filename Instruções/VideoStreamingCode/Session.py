@@ -0,0 +1,118 @@
+import random, threading
+from enum import Enum, IntEnum
+
+class SessionState(IntEnum):
+    """RTSP session states (RFC 2326, appendix A)."""
+    INIT = 0
+    READY = 1
+    PLAYING = 2
+
+class RtspMethod(str, Enum):
+    """RTSP methods served; members compare equal to the method names of the requests."""
+    SETUP = 'SETUP'
+    PLAY = 'PLAY'
+    PAUSE = 'PAUSE'
+    TEARDOWN = 'TEARDOWN'
+    DESCRIBE = 'DESCRIBE'
+    GET_PARAMETER = 'GET_PARAMETER'
+    OPTIONS = 'OPTIONS'
+
+    # Nome puro em cabeçalhos, logs e labels de métricas
+    __str__ = str.__str__
+
+class Session:
+    """The state of one RTSP session, from SETUP to TEARDOWN, in a fixed set of slots.
+
+    The control connection (ServerWorker) owns at most one session. Fields
+    that only exist with one transport or after PLAY stay None; with
+    __slots__ an idle session costs a single small object instead of a
+    growing dict.
+    """
+    __slots__ = ('id', 'worker', 'state', 'videoStream',
+                 # RTP: identificação, número de sequência e template do cabeçalho
+                 'ssrc', 'rtpSeq', 'rtpTimestampBase', 'rtpHeader',
+                 # Transporte: canais intercalados (TCP) ou portas do cliente (UDP) e socket do egress
+                 'interleaved', 'rtpPort', 'rtcpPort', 'rtpSocket',
+                 # Envio em andamento: relógio de mídia, timer do próximo frame e fim do Range
+                 'clock', 'timer', 'lastFrame', 'nextSenderReport',
+                 # Contadores do SR e relatórios RTCP do cliente
+                 'packetsSent', 'octetsSent', 'reception', 'receiverSsrc',
+                 # Controle de admissão: banda reservada (bytes/s), balde de tokens e última atividade
+                 'rate', 'bucket', 'lastSeen',
+                 # Bitrate adaptativo: escolha da rendition (None se o vídeo não tem renditions)
+                 'abr',
+                 # Paridade XOR dos pacotes RTP (None sem FEC negociado no SETUP)
+                 'fec',
+                 # Últimos pacotes enviados, reenviados a pedido do cliente (None sem NACK negociado)
+                 'retransmit')
+
+    def __init__(self, sessionId, worker):
+        self.id = sessionId
+        self.worker = worker
+        self.state = SessionState.INIT
+        self.videoStream = None
+        self.ssrc = random.randint(1, 0xFFFFFFFF)
+        self.rtpSeq = random.randint(0, 0xFFFF)
+        self.rtpTimestampBase = random.randint(0, 0xFFFFFFFF)
+        self.rtpHeader = None
+        self.interleaved = None
+        self.rtpPort = None
+        self.rtcpPort = None
+        self.rtpSocket = None
+        self.clock = None
+        self.timer = None
+        self.lastFrame = None
+        self.nextSenderReport = 0.0
+        self.packetsSent = 0
+        self.octetsSent = 0
+        self.reception = None
+        self.receiverSsrc = None
+        self.rate = 0.0
+        self.bucket = None
+        self.lastSeen = 0.0
+        self.abr = None
+        self.fec = None
+        self.retransmit = None
+
+class SessionTable:
+    """Every admitted session of the process, by Session ID."""
+
+    def __init__(self):
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def newId(self):
+        """Return a random 6-digit Session ID not in use."""
+        while True:
+            sessionId = random.randint(100000, 999999)
+            if sessionId not in self.sessions:
+                return sessionId
+
+    def add(self, session):
+        with self.lock:
+            # Dois SETUPs simultâneos podem ter sorteado o mesmo ID
+            while session.id in self.sessions:
+                session.id = random.randint(100000, 999999)
+            self.sessions[session.id] = session
+
+    def remove(self, session):
+        """Drop session. Return False if it was not in the table."""
+        with self.lock:
+            if self.sessions.get(session.id) is not session:
+                return False
+            del self.sessions[session.id]
+            return True
+
+    def get(self, sessionId):
+        return self.sessions.get(sessionId)
+
+    def all(self):
+        """Return a list of the sessions, safe to iterate while sessions come and go."""
+        with self.lock:
+            return list(self.sessions.values())
+
+    def __len__(self):
+        return len(self.sessions)
+
+# Tabela única do processo
+sessionTable = SessionTable()
@@ -0,0 +1,143 @@
+import threading, time
+
+from Metrics import metrics
+from Session import sessionTable
+
+# Timeout anunciado no cabeçalho Session (RFC 2326, seção 12.37): sem request RTSP nem RTCP nesse
+# intervalo, a sessão é encerrada
+DEFAULT_SESSION_TIMEOUT = 60
+
+# Quanto tempo de banda um balde de tokens pode acumular
+BURST_SECONDS = 0.5
+
+sessionsRejected = metrics.counter('rtsp_sessions_rejected_total', "SETUPs recusados com 453 (servidor cheio)")
+sessionsExpired = metrics.counter('rtsp_sessions_expired_total', "Sessões encerradas por inatividade")
+framesThrottled = metrics.counter('rtp_frames_throttled_total', "Frames descartados pelo limite de banda",
+                                  ['scope'])
+
+class TokenBucket:
+    """Token bucket in bytes: rate bytes/s, holding at most burst bytes.
+
+    A frame passes while the bucket is not in debt and then takes its whole
+    size, so a frame larger than the burst is never starved: the next ones
+    wait until the debt is paid back.
+    """
+    __slots__ = ('rate', 'burst', 'tokens', 'updated', 'lock')
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate * BURST_SECONDS
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, size, now=None):
+        """Take size bytes if the bucket allows it. Return False if the frame must be dropped."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 0:
+                return False
+            self.tokens -= size
+            return True
+
+    def refund(self, size):
+        """Give back the tokens of a frame that was dropped after all."""
+        with self.lock:
+            self.tokens = min(self.burst, self.tokens + size)
+
+class SessionManager:
+    """Admission control, keep-alive and bandwidth caps of the sessions of this process.
+
+    SETUP asks admit(): a session is refused when maxSessions are open or
+    when the average bitrates reserved would exceed the server-wide cap.
+    Every RTSP request and RTCP report of a session touches it; a thread
+    expires the ones silent for longer than their timeout. Frames go
+    through a per-session and a server-wide token bucket, so an
+    overloaded server drops frames instead of falling behind on all of
+    them.
+    """
+
+    def __init__(self):
+        self.maxSessions = None
+        self.timeout = DEFAULT_SESSION_TIMEOUT
+        # Limites de banda em bytes/s (None = sem limite)
+        self.sessionRate = None
+        self.totalRate = None
+        self.totalBucket = None
+        # Sessões admitidas, por Session ID
+        self.sessions = sessionTable
+        # Soma das taxas médias (bytes/s) dos vídeos das sessões admitidas
+        self.reserved = 0.0
+        self.lock = threading.Lock()
+        self.reaper = None
+
+    def configure(self, maxSessions=None, timeout=DEFAULT_SESSION_TIMEOUT, sessionBandwidth=None, totalBandwidth=None):
+        """Set the limits (bandwidths in bits/s). Called before the first session."""
+        self.maxSessions = maxSessions
+        self.timeout = timeout
+        self.sessionRate = sessionBandwidth / 8 if sessionBandwidth else None
+        self.totalRate = totalBandwidth / 8 if totalBandwidth else None
+        self.totalBucket = TokenBucket(self.totalRate) if self.totalRate else None
+
+    def admit(self, session, bitrate=0):
+        """Add a new session to the session table. Return False if the server has no room for it (453)."""
+        rate = bitrate / 8
+        with self.lock:
+            if self.maxSessions is not None and len(self.sessions) >= self.maxSessions:
+                sessionsRejected.inc()
+                return False
+            if self.totalRate is not None and len(self.sessions) and self.reserved + rate > self.totalRate:
+                sessionsRejected.inc()
+                return False
+            session.rate = rate
+            session.lastSeen = time.monotonic()
+            session.bucket = TokenBucket(self.sessionRate) if self.sessionRate else None
+            self.sessions.add(session)
+            self.reserved += rate
+            if self.reaper is None:
+                self.reaper = threading.Thread(target=self.run, name="SessionReaper", daemon=True)
+                self.reaper.start()
+        return True
+
+    def release(self, session):
+        with self.lock:
+            if self.sessions.remove(session):
+                self.reserved -= session.rate
+
+    def touch(self, session):
+        """Record activity of a session (keep-alive)."""
+        session.lastSeen = time.monotonic()
+
+    def allowFrame(self, session, size):
+        """Check a frame of size bytes against the session's and the server's buckets."""
+        bucket = session.bucket
+        if bucket is not None and not bucket.consume(size):
+            framesThrottled.labels('session').inc()
+            return False
+        if self.totalBucket is not None and not self.totalBucket.consume(size):
+            if bucket is not None:
+                bucket.refund(size)
+            framesThrottled.labels('server').inc()
+            return False
+        return True
+
+    def run(self):
+        while True:
+            time.sleep(max(0.5, min(self.timeout / 4, 5.0)))
+            deadline = time.monotonic() - self.timeout
+            expired = [session for session in self.sessions.all() if session.lastSeen < deadline]
+            for session in expired:
+                self.release(session)
+                sessionsExpired.inc()
+                try:
+                    session.worker.expire()
+                except Exception as e:
+                    print("Erro ao encerrar sessão inativa:", e)
+
+# Gerenciador único do processo
+sessionManager = SessionManager()
+
+metrics.gauge('rtsp_sessions_admitted', "Sessões admitidas pelo controle de admissão",
+              function=lambda: len(sessionManager.sessions))
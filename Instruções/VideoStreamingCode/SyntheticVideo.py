@@ -0,0 +1,36 @@
+import random, struct
+
+def makeJpegFrame(width, height, frameSize, rng=random):
+    """Build a JPEG-shaped frame of about frameSize bytes with the given dimensions.
+
+    The frame has real SOI, SOF0, SOS and EOI markers so that parsers reading the
+    markers behave as with a real file, but the scan data is random and is not
+    meant to be decoded.
+    """
+    # SOF0 baseline, 8 bits, 3 componentes com subamostragem 4:2:0
+    sof = struct.pack(">BBHBHHB", 0xFF, 0xC0, 17, 8, height, width, 3)
+    sof += bytes([1, 0x22, 0, 2, 0x11, 1, 3, 0x11, 1])
+    sos = bytes([0xFF, 0xDA, 0, 12, 3, 1, 0x00, 2, 0x11, 3, 0x11, 0, 63, 0])
+    header = b"\xff\xd8" + sof + sos
+    # Dados de scan sem 0xFF para não criar marcadores falsos
+    scanSize = max(0, frameSize - len(header) - 2)
+    scan = bytes(rng.randrange(0xFF) for _ in range(min(scanSize, 4096)))
+    scan = (scan * (scanSize // max(len(scan), 1) + 1))[:scanSize]
+    return header + scan + b"\xff\xd9"
+
+def writeSyntheticMjpeg(path, frameCount, width=384, height=288, frameSize=8000, seed=0):
+    """Write an .Mjpeg file of frameCount synthetic frames (5-byte ASCII length + JPEG)."""
+    rng = random.Random(seed)
+    # Poucos frames distintos repetidos: o arquivo é gerado rápido mesmo quando grande
+    frames = []
+    for i in range(min(frameCount, 16)):
+        size = int(frameSize * rng.uniform(0.8, 1.2))
+        frames.append(makeJpegFrame(width, height, size, rng))
+    with open(path, 'wb') as file:
+        for i in range(frameCount):
+            frame = frames[i % len(frames)]
+            if len(frame) > 99999:
+                raise ValueError("frames do .Mjpeg são limitados a 99999 bytes")
+            file.write(b"%05d" % len(frame))
+            file.write(frame)
+    return path
@@ -1,32 +1,180 @@
-class VideoStream:
-    def __init__(self, filename):
-        self.filename = filename
-        try:
-            self.file = open(filename, 'rb')
-        except:
-            raise IOError
-        self.frameNum = 0
-        
-    def nextFrame(self):
-        """Get next frame."""
-        # Lê os 5 primeiros bytes que indicam o tamanho do próximo frame (string ASCII)
-        data = self.file.read(5)
-        
-        # Verifica se leu algo (se não leu, é fim de arquivo)
-        if data: 
-            try:
-                # Em Python 3, é mais seguro converter os bytes para string antes de virar int
-                framelength = int(data)
-                
-                # Lê o frame atual com base no tamanho descoberto
-                data = self.file.read(framelength)
-                self.frameNum += 1
-            except ValueError:
-                # Se falhar a conversão, retorna bytes vazios
-                data = bytes()
-                
-        return data
-        
-    def frameNbr(self):
-        """Get frame number."""
-        return self.frameNum
\ No newline at end of file
+import os, mmap, threading, time
+from FrameIndex import FrameIndex
+from FrameCache import frameCache
+from PacketStore import PacketStore
+from Metrics import metrics, FAST_BUCKETS
+from Scheduler import MediaClock
+
+# Taxa de quadros nominal dos arquivos .Mjpeg (um frame a cada 50 ms)
+FRAME_RATE = 20
+
+frameReadDuration = metrics.histogram('video_frame_read_duration_seconds', "Tempo de leitura de um frame em nextFrame",
+                                      buckets=FAST_BUCKETS)
+
+class MediaFile:
+    """Memory-mapped .Mjpeg file and its frame index, shared by every session."""
+    openFiles = {}
+    lock = threading.Lock()
+    # Um lock por caminho: a primeira abertura de um vídeo grande (índice, packet store) só segura quem pede o mesmo
+    openLocks = {}
+    # Cria o packet store (.pkt) na primeira abertura de um vídeo que ainda não tem (Server.py --packetize)
+    buildPacketStores = False
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        try:
+            self.index = FrameIndex(path)
+        except:
+            self.file.close()
+            raise
+        # mmap não aceita arquivos vazios
+        if self.index.size > 0:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.data = bytes()
+        # Chave do arquivo no cache de frames: muda se o vídeo for regravado
+        self.key = (path, self.index.mtime, self.index.size)
+        # Pacotes prontos, se houver um store válido: dispensa leitura do frame e fragmentação
+        self.packets = PacketStore.open(path, self.buildPacketStores)
+        if self.packets is not None and self.packets.frameCount() != self.index.frameCount():
+            self.packets.close()
+            self.packets = None
+        self.refs = 1
+
+    @classmethod
+    def acquire(cls, filename):
+        """Return the shared MediaFile for filename, opening it on first use."""
+        path = os.path.realpath(filename)
+        with cls.lock:
+            media = cls.shared(path)
+            if media is not None:
+                return media
+            pathLock = cls.openLocks.setdefault(path, threading.Lock())
+        with pathLock:
+            # Outra thread pode ter aberto o vídeo enquanto esta esperava
+            with cls.lock:
+                media = cls.shared(path)
+                if media is not None:
+                    return media
+            media = cls(path)
+            with cls.lock:
+                cls.openFiles[path] = media
+            return media
+
+    @classmethod
+    def shared(cls, path):
+        # Chamado com cls.lock
+        media = cls.openFiles.get(path)
+        if media is None or media.isStale():
+            return None
+        media.refs += 1
+        return media
+
+    @classmethod
+    def isOpen(cls, filename):
+        """Check whether filename is already open and current, so acquiring it does no disk work."""
+        media = cls.openFiles.get(os.path.realpath(filename))
+        return media is not None and not media.isStale()
+
+    def release(self):
+        """Drop one reference, closing the file when no session uses it."""
+        with self.lock:
+            self.refs -= 1
+            if self.refs > 0:
+                return
+            if self.openFiles.get(self.path) is self:
+                del self.openFiles[self.path]
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        if self.packets is not None:
+            self.packets.close()
+        self.index.close()
+        self.file.close()
+
+    def isStale(self):
+        """Check whether the file on disk changed since it was opened."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return True
+        return stat.st_mtime_ns != self.index.mtime or stat.st_size != self.index.size
+
+    def readFrame(self, frameNumber):
+        """Return the JPEG data of a 0-based frame number, going through the frame cache."""
+        start, framelength = self.index.frameSpan(frameNumber)
+        return frameCache.get((self.key, frameNumber), lambda: self.data[start:start + framelength])
+
+class VideoStream:
+    # Arquivo com duração e busca (canais ao vivo usam LiveSubscription)
+    live = False
+    __slots__ = ('filename', 'media', 'index', 'frameNum')
+
+    def __init__(self, filename):
+        self.filename = filename
+        try:
+            self.media = MediaFile.acquire(filename)
+        except:
+            raise IOError
+        self.index = self.media.index
+        self.frameNum = 0
+
+    def mediaClock(self):
+        """Return the media clock of a PLAY starting at the current frame."""
+        return MediaClock(FRAME_RATE, self.frameNum)
+
+    def frameReady(self):
+        """Check whether the next frame can be read now (always, for a file)."""
+        return True
+
+    def nextFrame(self):
+        """Get next frame."""
+        # Sem mais frames no índice: fim de arquivo, retorna bytes vazios
+        if self.frameNum >= self.index.frameCount():
+            return bytes()
+
+        started = time.perf_counter()
+        data = self.media.readFrame(self.frameNum)
+        frameReadDuration.observe(time.perf_counter() - started)
+        self.frameNum += 1
+        return data
+
+    def nextPayloads(self):
+        """Get the ready-to-send RTP payloads of the next frame from the packet store.
+
+        Return None when the video has no packet store (use nextFrame) and an
+        empty list at the end of the file.
+        """
+        packets = self.media.packets
+        if packets is None:
+            return None
+        if self.frameNum >= self.index.frameCount():
+            return []
+
+        started = time.perf_counter()
+        payloads = packets.framePayloads(self.frameNum)
+        frameReadDuration.observe(time.perf_counter() - started)
+        self.frameNum += 1
+        return payloads
+
+    def frameNbr(self):
+        """Get frame number."""
+        return self.frameNum
+
+    def seek(self, frameNumber):
+        """Position the stream so that the next frame read is frameNumber (0-based)."""
+        self.frameNum = max(0, min(frameNumber, self.frameCount()))
+
+    def frameCount(self):
+        """Get the total number of frames."""
+        return self.index.frameCount()
+
+    def duration(self):
+        """Get the duration of the video in seconds."""
+        return self.frameCount() / FRAME_RATE
+
+    def close(self):
+        """Release this session's reference to the shared media file."""
+        if self.media is not None:
+            self.media.release()
+            self.media = None
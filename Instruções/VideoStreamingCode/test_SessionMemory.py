@@ -0,0 +1,30 @@
+"""Memory budget of idle RTSP sessions.
+
+Usage: python -m unittest test_SessionMemory
+"""
+import os, tempfile, unittest
+
+from MediaCatalog import mediaCatalog
+from MicroBenchmark import idleSessionBytes, IDLE_SESSIONS, SESSION_MEMORY_BUDGET
+from SyntheticVideo import writeSyntheticMjpeg
+
+class IdleSessionMemoryTest(unittest.TestCase):
+
+    def test_idle_sessions_fit_budget(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = writeSyntheticMjpeg(os.path.join(directory, "idle.Mjpeg"), 16)
+            # O SETUP só encontra vídeos do diretório do catálogo; sem start(), nenhuma varredura fica apontada
+            # para o diretório temporário, e o catálogo do processo volta ao que era no fim do teste
+            self.addCleanup(self.restoreCatalog, mediaCatalog.directory, os.path.realpath(path))
+            mediaCatalog.directory = directory
+            sessionBytes = idleSessionBytes(path, IDLE_SESSIONS)
+        self.assertLessEqual(sessionBytes, SESSION_MEMORY_BUDGET,
+                             f"{IDLE_SESSIONS} sessões ociosas: {sessionBytes:,.0f} B por sessão")
+
+    def restoreCatalog(self, directory, path):
+        mediaCatalog.directory = directory
+        with mediaCatalog.lock:
+            mediaCatalog.entries.pop(path, None)
+
+if __name__ == "__main__":
+    unittest.main()